@@ -6,10 +6,21 @@ import argparse
 from typing import List, Dict, Any, Optional, Union
 import tempfile
 import time
+import inspect
+import threading
 from pathlib import Path
 import numpy as np
 import soundfile as sf
 from .utils.text_splitter import split_text, merge_sentences_into_chunks, merge_audio_files
+from .utils.prompt_cache import PromptFeatureCache, prompt_feature_cache
+from .utils.audio_cache import get_synthesis_cache, file_digest
+from .utils.request_dedup import SerialDeduplicator, SFT_DEDUP_ENABLED
+from .synthesis_pipeline import LongTextPipeline, LONG_TEXT_PIPELINE
+from .inference_backends import apply_inference_backend, configure_torch_threads, COSYVOICE_BACKEND
+from .quantization import quantize_model, parse_quantize_parts, COSYVOICE_QUANTIZE
+from .utils.chunk_planner import ChunkPlanner
+from .utils.duration_predictor import DurationPredictor, clamp_speed
+from .utils.time_stretch import needs_stretch
 
 # 添加CosyVoice路径
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -21,19 +32,29 @@ from cosyvoice.cli.cosyvoice import CosyVoice, CosyVoice2
 from cosyvoice.utils.file_utils import load_wav
 from cosyvoice.utils.common import set_all_random_seed
 
+# 固定随机种子以获得稳定结果，同时作为合成音频缓存键的一部分
+SYNTHESIS_SEED = 42
+
 class CosyVoiceHelper:
     _instance = None
+    # 启动时模型在后台线程加载，与请求线程的构造、加载互斥
+    _init_lock = threading.RLock()
     
     def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super(CosyVoiceHelper, cls).__new__(cls)
-            cls._instance._initialized = False
+        with cls._init_lock:
+            if cls._instance is None:
+                cls._instance = super(CosyVoiceHelper, cls).__new__(cls)
+                cls._instance._initialized = False
         return cls._instance
     
-    def __init__(self, model_dir=None, lazy_load=False):
+    def __init__(self, model_dir=None, lazy_load=False, backend=None, quantize=None):
         if self._initialized:
             return
-        
+        with self._init_lock:
+            if not self._initialized:
+                self._setup(model_dir, lazy_load, backend, quantize)
+    
+    def _setup(self, model_dir, lazy_load, backend, quantize):
         # 允许懒加载模式，即只在第一次实际使用时加载模型
         self._lazy_load = lazy_load
         
@@ -44,6 +65,27 @@ class CosyVoiceHelper:
         self._initialized = True
         self.model = None
         self.model_type = None
+        # 推理后端（eager/torchscript/onnxruntime），加载后为实际生效的后端
+        self._requested_backend = backend or COSYVOICE_BACKEND
+        self.backend = None
+        # 需要动态int8量化的模块（llm/flow），加载后为实际完成量化的模块
+        self._requested_quantize = parse_quantize_parts(COSYVOICE_QUANTIZE if quantize is None else quantize)
+        self.quantized = []
+        
+        # 零样本合成的提示特征缓存（进程内共享）
+        self._prompt_cache = prompt_feature_cache
+        # 合成音频缓存（内存 + 磁盘）
+        self._audio_cache = get_synthesis_cache()
+        # 预置声音推理的串行去重器（SFT_DEDUP_ENABLED时使用），首次使用时创建
+        self._sft_dedup = None
+        # 长文本流水线，首次使用时创建；当前CosyVoice版本不支持时为False
+        self._long_text_pipeline = None
+        # 模型的预置说话人列表，加载后不会变化，首次获取后缓存
+        self._preset_voices = None
+        # 按模型文本token规划合成分块，模型加载后创建
+        self.chunk_planner = None
+        # 按目标时长选择语速时预测自然时长，模型加载后创建
+        self.duration_predictor = None
         
         # 如果不是懒加载模式，立即初始化模型
         if not lazy_load:
@@ -54,7 +96,12 @@ class CosyVoiceHelper:
         if self.model is not None:
             # 模型已初始化，无需重复操作
             return
-            
+        with self._init_lock:
+            if self.model is None:
+                self._load_model()
+    
+    def _load_model(self):
+        configure_torch_threads()
         try:
             logging.info(f"初始化CosyVoice2模型: {self.model_dir}")
             self.model = CosyVoice2(self.model_dir, load_jit=False, load_trt=False, fp16=False)
@@ -68,8 +115,18 @@ class CosyVoiceHelper:
                 logging.error(f"初始化CosyVoice失败: {e2}")
                 raise ValueError(f"无法初始化语音模型: {e2}")
         
+        self.backend = apply_inference_backend(self.model, self.model_dir, self._requested_backend)
+        self.quantized = quantize_model(self.model, self.model_dir, self._requested_quantize)
         self.sample_rate = self.model.sample_rate
-        logging.info(f"CosyVoiceHelper初始化完成，模型类型: {self.model_type}")
+        self.chunk_planner = ChunkPlanner.for_model(self.model, self.model_dir)
+        self.duration_predictor = DurationPredictor(self.chunk_planner.count_tokens)
+        logging.info(f"CosyVoiceHelper初始化完成，模型类型: {self.model_type}，推理后端: {self.backend}，"
+                     f"int8量化: {','.join(self.quantized) or '无'}")
+    
+    @property
+    def _model_variant(self) -> Dict[str, Any]:
+        """影响合成结果的推理配置，作为合成音频缓存键的一部分"""
+        return {"backend": self.backend, "quantized": ",".join(self.quantized)}
     
     @property
     def is_initialized(self):
@@ -80,7 +137,17 @@ class CosyVoiceHelper:
         """获取预置的声音列表 - 通过代码调用获取，而非硬编码"""
         if self.model is None:
             self._initialize_model()
-            
+        
+        if self._preset_voices is None:
+            preset_voices = self._list_preset_voices()
+            # 获取失败时不缓存空列表，下次重试
+            if preset_voices:
+                self._preset_voices = list(preset_voices)
+            return preset_voices
+        return list(self._preset_voices)
+    
+    def _list_preset_voices(self) -> List[str]:
+        """从模型读取预置说话人列表"""
         try:
             if self.model_type == "CosyVoice":
                 return self.model.list_available_spks()
@@ -104,8 +171,66 @@ class CosyVoiceHelper:
             
         return self._get_preset_voices()
     
+    def warm_up(self, texts: List[str], max_voices: int = 0) -> Dict[str, Any]:
+        """
+        预热模型：用预置声音合成若干文本，提前承担首次推理的内存分配、算子选择等开销
+        
+        预热结果不写入合成音频缓存。没有预置声音时使用示例音频做跨语种合成。
+        
+        参数:
+            texts: 预热文本
+            max_voices: 预热的预置声音数，为0时预热全部预置声音
+        
+        返回:
+            预热的声音数、合成次数和耗时
+        """
+        self._initialize_model()
+        voices = self._get_preset_voices()
+        if max_voices > 0:
+            voices = voices[:max_voices]
+        
+        start = time.perf_counter()
+        count = 0
+        if voices:
+            for voice in voices:
+                for text in texts:
+                    self._collect_speech(self.model.inference_sft(text, voice, stream=False))
+                    count += 1
+        else:
+            sample_path = os.path.join(os.path.dirname(__file__), "assets", "sample_voice.wav")
+            if os.path.exists(sample_path) and os.path.getsize(sample_path) > 0:
+                sample_speech = load_wav(sample_path, 16000)
+                for text in texts:
+                    self._collect_speech(self.model.inference_cross_lingual(text, sample_speech, stream=False))
+                    count += 1
+            else:
+                logging.warning("没有预置声音和示例音频，跳过预热")
+        
+        elapsed = time.perf_counter() - start
+        logging.info(f"模型预热完成: {len(voices)} 个声音，{count} 次合成，耗时 {elapsed:.2f}s")
+        return {"voices": len(voices), "utterances": count, "seconds": round(elapsed, 3)}
+    
+    def _resolve_preset_voice_name(self, voice_id) -> str:
+        """如果voice_id是数字或数字字符串，将其映射到实际的预置声音名称"""
+        if not (isinstance(voice_id, (int, str)) and str(voice_id).isdigit()):
+            return voice_id
+        
+        preset_voices = self._get_preset_voices()
+        voice_idx = int(voice_id)
+        if 0 < voice_idx <= len(preset_voices):
+            preset_voice_name = preset_voices[voice_idx - 1]
+            logging.info(f"将数字ID {voice_id} 映射到预置声音: {preset_voice_name}")
+            return preset_voice_name
+        
+        if not preset_voices:
+            raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
+        preset_voice_name = preset_voices[0]
+        logging.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {preset_voice_name}")
+        return preset_voice_name
+    
     def synthesize_speech(self, text: str, voice_id: str, is_preset: bool = False, 
-                          prompt_audio: Optional[str] = None, prompt_text: Optional[str] = None) -> Any:
+                          prompt_audio: Optional[str] = None, prompt_text: Optional[str] = None,
+                          speed: float = 1.0) -> Any:
         """
         合成语音
         
@@ -115,6 +240,7 @@ class CosyVoiceHelper:
             is_preset: 是否使用预置声音
             prompt_audio: 提示音频文件路径
             prompt_text: 提示文本
+            speed: 语速，输出时长约为正常语速的1/speed
             
         返回:
             合成的音频数据
@@ -123,45 +249,29 @@ class CosyVoiceHelper:
         if self.model is None:
             self._initialize_model()
             
-        set_all_random_seed(42)  # 固定随机种子以获得稳定结果
+        set_all_random_seed(SYNTHESIS_SEED)  # 固定随机种子以获得稳定结果
         
         try:
             # 确保text不为空
             if not text or not text.strip():
                 raise ValueError("合成文本不能为空")
             
-            # 检查文本长度，如果超过阈值则自动分段处理
-            max_single_text_length = 70  # 实测安全长度
-            if len(text) > max_single_text_length and is_preset:
-                logging.info(f"文本长度 {len(text)} 超过单次合成阈值({max_single_text_length})，自动使用分段合成")
-                return self._synthesize_long_text_inner(text, voice_id)
+            # 检查文本的token数，如果超过单块长度则自动分段处理
+            if is_preset and self.chunk_planner.needs_split(text):
+                logging.info(f"文本 {len(text)} 个字符超过单块长度({self.chunk_planner.max_tokens} tokens)，自动使用分段合成")
+                return self._synthesize_long_text_inner(text, self._resolve_preset_voice_name(voice_id), speed=speed)
                 
             # 原有合成逻辑
             if is_preset:
                 # 使用预置声音
-                preset_voice_name = voice_id
-                # 如果voice_id是数字或数字字符串，尝试将其映射到实际的声音名称
-                preset_voices = self._get_preset_voices()
-                
-                if isinstance(voice_id, (int, str)) and str(voice_id).isdigit():
-                    voice_idx = int(voice_id)
-                    if 0 < voice_idx <= len(preset_voices):
-                        preset_voice_name = preset_voices[voice_idx - 1]
-                        logging.info(f"将数字ID {voice_id} 映射到预置声音: {preset_voice_name}")
-                    else:
-                        if preset_voices:
-                            preset_voice_name = preset_voices[0]
-                        else:
-                            raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
-                        logging.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {preset_voice_name}")
+                preset_voice_name = self._resolve_preset_voice_name(voice_id)
                 
                 logging.info(f"使用预置声音 '{preset_voice_name}' 合成文本: '{text[:30]}...'")
                 
                 # 为CosyVoice和CosyVoice2提供不同的实现
                 if self.model_type == "CosyVoice":
                     try:
-                        result = next(self.model.inference_sft(text, preset_voice_name, stream=False))
-                        audio_data = result['tts_speech'].numpy().flatten()
+                        audio_data = self._inference_sft_chunk(text, preset_voice_name, speed)
                         # 记录音频数据类型和范围
                         logging.info(f"预置声音合成结果 - 类型: {audio_data.dtype}, 形状: {audio_data.shape}, 范围: [{audio_data.min()}, {audio_data.max()}]")
                         return {
@@ -174,8 +284,7 @@ class CosyVoiceHelper:
                         
                 elif self.model_type == "CosyVoice2":
                     try:
-                        result = next(self.model.inference_sft(text, preset_voice_name, stream=False))
-                        audio_data = result['tts_speech'].numpy().flatten()
+                        audio_data = self._inference_sft_chunk(text, preset_voice_name, speed)
                         # 记录音频数据类型和范围
                         logging.info(f"预置声音合成结果 - 类型: {audio_data.dtype}, 形状: {audio_data.shape}, 范围: [{audio_data.min()}, {audio_data.max()}]")
                         return {
@@ -207,7 +316,8 @@ class CosyVoiceHelper:
                             sample_speech = load_wav(sample_path, 16000)
                             
                             # 使用cross_lingual方法
-                            result = next(self.model.inference_cross_lingual(text, sample_speech, stream=False))
+                            result = next(self.model.inference_cross_lingual(text, sample_speech, stream=False,
+                                                                             **self._speed_kwargs(speed)))
                             audio_data = result['tts_speech'].numpy().flatten()
                             # 记录音频数据类型和范围
                             logging.info(f"预置声音备选方法合成结果 - 类型: {audio_data.dtype}, 形状: {audio_data.shape}, 范围: [{audio_data.min()}, {audio_data.max()}]")
@@ -228,20 +338,10 @@ class CosyVoiceHelper:
                 logging.info(f"提示音频: {prompt_audio}")
                 logging.info(f"提示文本: {prompt_text or '(无)'}")
                 
-                prompt_speech_16k = load_wav(prompt_audio, 16000)
-                
-                # 记录提示音频信息
-                logging.info(f"提示音频信息 - 形状: {prompt_speech_16k.shape}, 类型: {prompt_speech_16k.dtype}")
-                
                 # 确保提示文本不为空
                 safe_prompt_text = prompt_text if prompt_text else "这是一段示例语音。"
                 
-                if self.model_type == "CosyVoice":
-                    result = next(self.model.inference_zero_shot(text, safe_prompt_text, prompt_speech_16k, stream=False))
-                elif self.model_type == "CosyVoice2":
-                    result = next(self.model.inference_zero_shot(text, safe_prompt_text, prompt_speech_16k, stream=False))
-                
-                audio_data = result['tts_speech'].numpy().flatten()
+                audio_data = self._inference_zero_shot_chunk(text, voice_id, prompt_audio, safe_prompt_text, speed)
                 
                 # 记录合成结果信息
                 logging.info(f"自定义声音合成结果 - 类型: {audio_data.dtype}, 形状: {audio_data.shape}, 范围: [{audio_data.min()}, {audio_data.max()}]")
@@ -271,9 +371,263 @@ class CosyVoiceHelper:
             logging.error(f"语音合成失败: {e}")
             raise
 
-    def _synthesize_long_text_inner(self, text, speaker_name):
+    def synthesize_for_duration(self, text: str, voice_id: str, target_duration: float, is_preset: bool = False,
+                                prompt_audio: Optional[str] = None, prompt_text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        合成时长接近target_duration秒的语音
+        
+        按预测的自然时长选择语速合成；结果超出时长容差时，用实测的自然时长修正语速再合成一次（最多一次）。
+        语速超出[SYNTH_SPEED_MIN, SYNTH_SPEED_MAX]的部分仍需调用方做时长调整。
+        
+        返回:
+            {"audio_data", "sample_rate", "speed"}
+        """
+        if self.model is None:
+            self._initialize_model()
+        if target_duration <= 0:
+            result = self.synthesize_speech(text, voice_id, is_preset, prompt_audio, prompt_text)
+            result["speed"] = 1.0
+            return result
+        
+        voice_key = f"preset:{self._resolve_preset_voice_name(voice_id)}" if is_preset else f"voice:{voice_id}"
+        speed = self.duration_predictor.speed_for(voice_key, text, target_duration)
+        result = self.synthesize_speech(text, voice_id, is_preset, prompt_audio, prompt_text, speed=speed)
+        duration = len(result["audio_data"]) / result["sample_rate"]
+        # 语速不影响语音token，时长×speed即为自然时长
+        natural_duration = duration * speed
+        self.duration_predictor.observe(voice_key, text, natural_duration)
+        
+        corrected = clamp_speed(natural_duration / target_duration)
+        if needs_stretch(duration, target_duration) and corrected != speed:
+            logging.info(f"合成时长 {duration:.2f}秒 与目标 {target_duration:.2f}秒 相差较大，"
+                         f"语速 {speed} -> {corrected} 重新合成")
+            retry = self.synthesize_speech(text, voice_id, is_preset, prompt_audio, prompt_text, speed=corrected)
+            retry_duration = len(retry["audio_data"]) / retry["sample_rate"]
+            if abs(retry_duration - target_duration) < abs(duration - target_duration):
+                result, duration, speed = retry, retry_duration, corrected
+        
+        logging.info(f"按目标时长合成: 目标 {target_duration:.2f}秒，语速 {speed}，实际 {duration:.2f}秒")
+        result["speed"] = speed
+        return result
+    
+    @staticmethod
+    def _speed_kwargs(speed: float) -> Dict[str, float]:
+        """正常语速时不传speed参数，与不支持speed的CosyVoice版本兼容"""
+        return {} if speed == 1.0 else {"speed": speed}
+    
+    def _audio_cache_key(self, text: str, voice_identity: str, speed: float = 1.0) -> str:
+        """计算非流式合成结果的缓存键（文本的所有规范化片段拼接后的音频）"""
+        return self._audio_cache.make_key(self.model_dir, self.model_type, voice_identity, text,
+                                          SYNTHESIS_SEED, segments="all", **self._speed_kwargs(speed),
+                                          **self._model_variant)
+    
+    @staticmethod
+    def _collect_speech(outputs) -> np.ndarray:
+        """拼接模型对一个文本块各规范化片段的输出"""
+        pieces = [model_output['tts_speech'].numpy().flatten() for model_output in outputs]
+        if not pieces:
+            raise ValueError("模型没有输出音频")
+        return np.concatenate(pieces)
+    
+    def _cached_inference(self, text: str, voice_identity: str, infer, speed: float = 1.0) -> np.ndarray:
+        """
+        查询合成音频缓存，未命中时调用infer()执行推理并写入缓存
+        
+        返回模型输出的原始浮点音频数据
+        """
+        key = self._audio_cache_key(text, voice_identity, speed)
+        cached = self._audio_cache.get(key)
+        if cached is not None:
+            logging.info(f"合成音频缓存命中: '{text[:30]}...'")
+            return cached[0]
+        
+        audio_data = infer()
+        self._audio_cache.put(key, audio_data, self.sample_rate)
+        return audio_data
+    
+    def _inference_sft_chunk(self, text: str, speaker_name: str, speed: float = 1.0) -> np.ndarray:
+        """使用预置声音合成单个文本块（带缓存，启用去重时未命中的请求经串行去重器推理）"""
+        def infer():
+            if SFT_DEDUP_ENABLED:
+                return self._get_sft_dedup().infer((text, speaker_name, speed))
+            return self._collect_speech(self.model.inference_sft(text, speaker_name, stream=False,
+                                                                 **self._speed_kwargs(speed)))
+        
+        return self._cached_inference(text, f"preset:{speaker_name}", infer, speed)
+    
+    def _get_sft_dedup(self) -> SerialDeduplicator:
+        if self._sft_dedup is None:
+            self._sft_dedup = SerialDeduplicator(self._run_sft_requests, name="sft-request-dedup")
+        return self._sft_dedup
+    
+    def _run_sft_requests(self, requests: List[tuple]) -> List[Any]:
+        """
+        在去重器的工作线程上依次执行去重后的预置声音推理
+        
+        返回与requests等长的列表，单条失败以异常对象返回。
+        """
+        results = []
+        with torch.no_grad():
+            for text, speaker_name, speed in requests:
+                try:
+                    results.append(self._collect_speech(self.model.inference_sft(text, speaker_name, stream=False,
+                                                                                 **self._speed_kwargs(speed))))
+                except Exception as e:
+                    results.append(e)
+        return results
+    
+    def _inference_zero_shot_chunk(self, text: str, voice_id, prompt_audio: str, prompt_text: str,
+                                   speed: float = 1.0) -> np.ndarray:
+        """使用上传的声音样本合成单个文本块（带缓存）"""
+        def infer():
+            # 从缓存获取提示音频及其前端特征，命中时无需重新加载和提取
+            prompt_features = self._get_prompt_features(voice_id, prompt_audio, prompt_text)
+            return self._collect_speech(self._inference_zero_shot(text, prompt_features, stream=False, speed=speed))
+        
+        voice_identity = f"prompt:{file_digest(prompt_audio)}:{prompt_text}"
+        return self._cached_inference(text, voice_identity, infer, speed)
+    
+    def _get_prompt_features(self, voice_id, prompt_audio: str, prompt_text: str) -> Dict[str, Any]:
+        """获取提示音频特征，优先从缓存读取"""
+        key = PromptFeatureCache.make_key(voice_id, prompt_audio, prompt_text)
+        return self._prompt_cache.get_or_create(
+            key, lambda: self._extract_prompt_features(prompt_audio, prompt_text)
+        )
+    
+    def _extract_prompt_features(self, prompt_audio: str, prompt_text: str) -> Dict[str, Any]:
+        """
+        加载提示音频并提取CosyVoice前端特征
+        
+        返回的字典包含16k提示波形，以及不含合成文本的模型输入
+        （提示文本token、语音token、说话人向量、梅尔特征）。
+        如果当前CosyVoice版本不支持直接提取，则只缓存波形。
+        """
+        logging.info(f"提取提示音频特征: {prompt_audio}")
+        prompt_speech_16k = load_wav(prompt_audio, 16000)
+        logging.info(f"提示音频信息 - 形状: {prompt_speech_16k.shape}, 类型: {prompt_speech_16k.dtype}")
+        
+        features = {
+            "prompt_text": prompt_text,
+            "prompt_speech_16k": prompt_speech_16k,
+            "model_input": None
+        }
+        
+        try:
+            frontend = self.model.frontend
+            normalized_prompt_text = frontend.text_normalize(prompt_text, split=False)
+            args = ['', normalized_prompt_text, prompt_speech_16k, self.sample_rate]
+            # 新版本CosyVoice的frontend_zero_shot多了zero_shot_spk_id参数
+            if 'zero_shot_spk_id' in inspect.signature(frontend.frontend_zero_shot).parameters:
+                args.append('')
+            with torch.no_grad():
+                model_input = frontend.frontend_zero_shot(*args)
+            model_input.pop('text', None)
+            model_input.pop('text_len', None)
+            features["model_input"] = model_input
+        except Exception as e:
+            logging.warning(f"提取提示音频前端特征失败，仅缓存提示波形: {e}")
+        
+        return features
+    
+    def _inference_zero_shot(self, text: str, prompt_features: Dict[str, Any], stream: bool = False,
+                             speed: float = 1.0):
+        """
+        使用缓存的提示特征直接驱动模型进行零样本合成
+        
+        与model.inference_zero_shot的输出一致，但跳过了提示音频的重复特征提取
+        """
+        model_input = prompt_features.get("model_input")
+        if model_input is None:
+            yield from self.model.inference_zero_shot(
+                text, prompt_features["prompt_text"], prompt_features["prompt_speech_16k"], stream=stream,
+                **self._speed_kwargs(speed)
+            )
+            return
+        
+        frontend = self.model.frontend
+        with torch.no_grad():
+            for segment in frontend.text_normalize(text, split=True):
+                text_token, text_token_len = frontend._extract_text_token(segment)
+                segment_input = dict(model_input)
+                segment_input['text'] = text_token
+                segment_input['text_len'] = text_token_len
+                for model_output in self.model.model.tts(**segment_input, stream=stream, **self._speed_kwargs(speed)):
+                    yield model_output
+
+    def synthesize_stream(self, text: str, voice_id, is_preset: bool = False,
+                          prompt_audio: Optional[str] = None, prompt_text: Optional[str] = None,
+                          max_chunk_length: Optional[int] = None):
+        """
+        流式合成语音
+        
+        按split_text切分句子后由chunk_planner分块，逐块调用模型的流式推理(stream=True)，
+        每产生一段音频就立即返回，而不是等整段文本合成完毕。
+        
+        参数同synthesize_speech，max_chunk_length指定时按字符数分块
+        
+        返回:
+            生成器，依次产出一维浮点音频数据（采样率为self.sample_rate）
+        """
+        if self.model is None:
+            self._initialize_model()
+        
+        if not text or not text.strip():
+            raise ValueError("合成文本不能为空")
+        
+        set_all_random_seed(SYNTHESIS_SEED)
+        
+        if is_preset:
+            speaker_name = self._resolve_preset_voice_name(voice_id)
+            voice_identity = f"preset:{speaker_name}"
+        else:
+            if not prompt_audio:
+                raise ValueError("使用自定义声音时需要提供声音样本")
+            prompt_text = prompt_text if prompt_text else "这是一段示例语音。"
+            voice_identity = f"prompt:{file_digest(prompt_audio)}:{prompt_text}"
+        
+        chunks = self._plan_chunks(split_text(text), max_chunk_length)
+        logging.info(f"流式合成: {len(text)} 个字符，共 {len(chunks)} 个块")
+        
+        for i, chunk in enumerate(chunks):
+            if not chunk.strip():
+                continue
+            
+            # 流式输出与非流式输出不同，使用独立的缓存键
+            key = self._audio_cache.make_key(self.model_dir, self.model_type, voice_identity, chunk,
+                                             SYNTHESIS_SEED, stream=True, **self._model_variant)
+            cached = self._audio_cache.get(key)
+            if cached is not None:
+                yield cached[0]
+                continue
+            
+            if is_preset:
+                outputs = self.model.inference_sft(chunk, speaker_name, stream=True)
+            else:
+                prompt_features = self._get_prompt_features(voice_id, prompt_audio, prompt_text)
+                outputs = self._inference_zero_shot(chunk, prompt_features, stream=True)
+            
+            pieces = []
+            for model_output in outputs:
+                piece = model_output['tts_speech'].numpy().flatten()
+                pieces.append(piece)
+                yield piece
+            
+            if pieces:
+                self._audio_cache.put(key, np.concatenate(pieces), self.sample_rate)
+            logging.info(f"流式合成第 {i+1}/{len(chunks)} 块完成")
+    
+    def _plan_chunks(self, sentences: List[str], max_chunk_length: Optional[int] = None) -> List[str]:
+        """把句子合并为合成分块：默认按模型token数规划，指定max_chunk_length时按字符数合并"""
+        if max_chunk_length:
+            return merge_sentences_into_chunks(sentences, max_chunk_length)
+        return self.chunk_planner.plan(sentences)
+    
+    def _synthesize_long_text_inner(self, text, speaker_name, max_chunk_length: Optional[int] = None,
+                                    speed: float = 1.0):
         """
         内部方法：处理长文本合成，直接返回合并后的音频数据
+        
+        指定语速时逐块合成（流水线不支持speed参数）
         """
         logging.info(f"开始长文本内部处理，共 {len(text)} 个字符")
         
@@ -289,53 +643,45 @@ class CosyVoiceHelper:
         for i in range(min(3, len(sentences))):
             logging.info(f"句子示例 {i+1}: {sentences[i]}")
         
-        # 将句子合并为合适长度的块
-        max_chunk_length = 70  # 经测试的安全单次合成长度
-        chunks = merge_sentences_into_chunks(sentences, max_chunk_length)
+        # 将句子按token数合并为合适长度的块
+        chunks = self._plan_chunks(sentences, max_chunk_length)
         logging.info(f"句子已合并为 {len(chunks)} 个块")
         
         # 显示每个块的大小以进行调试
         for i, chunk in enumerate(chunks):
-            logging.info(f"块 {i+1} 长度: {len(chunk)}")
-        
-        # 直接合成所有块的音频数据，然后合并
-        audio_segments = []
-        sample_rate = None
+            logging.info(f"块 {i+1} 长度: {len(chunk)} 字符，{self.chunk_planner.count_tokens(chunk)} tokens")
         
+        # 先查缓存，未命中的块再合成
+        voice_identity = f"preset:{speaker_name}"
+        chunk_audio = {}
+        pending = []
         for i, chunk in enumerate(chunks):
             if not chunk.strip():
                 continue
-                
-            logging.info(f"正在合成第 {i+1}/{len(chunks)} 块，内容: '{chunk}'")
-            try:
-                # 为CosyVoice和CosyVoice2提供不同的实现
-                if self.model_type == "CosyVoice":
-                    try:
-                        result = next(self.model.inference_sft(chunk, speaker_name, stream=False))
-                        chunk_audio = result['tts_speech'].numpy().flatten()
-                        chunk_rate = self.sample_rate
-                    except Exception as e:
-                        logging.error(f"CosyVoice sft合成块 {i+1} 失败: {e}")
-                        continue
-                        
-                elif self.model_type == "CosyVoice2":
-                    try:
-                        result = next(self.model.inference_sft(chunk, speaker_name, stream=False))
-                        chunk_audio = result['tts_speech'].numpy().flatten()
-                        chunk_rate = self.sample_rate
-                    except (AttributeError, Exception) as e:
-                        logging.warning(f"CosyVoice2 sft方法失败，尝试其他方法: {e}")
-                        continue
-                
-                # 保存采样率（第一个成功的块）
-                if sample_rate is None:
-                    sample_rate = chunk_rate
-                
-                # 收集音频数据
-                audio_segments.append(chunk_audio)
-                logging.info(f"第 {i+1}/{len(chunks)} 块合成完成，音频长度: {len(chunk_audio)/chunk_rate:.2f}秒")
-            except Exception as e:
-                logging.error(f"合成第 {i+1} 块时出错: {str(e)}")
+            cached = self._audio_cache.get(self._audio_cache_key(chunk, voice_identity, speed))
+            if cached is not None:
+                chunk_audio[i] = cached[0]
+            else:
+                pending.append(i)
+        if chunk_audio:
+            logging.info(f"{len(chunk_audio)} 个块命中合成音频缓存")
+        
+        pipeline = self._get_long_text_pipeline() if len(pending) > 1 and speed == 1.0 else None
+        if pipeline is not None:
+            chunk_audio.update(self._synthesize_chunks_pipelined(pipeline, chunks, pending, speaker_name))
+        else:
+            chunk_audio.update(self._synthesize_chunks_sequential(chunks, pending, speaker_name, speed))
+        
+        # 按原始顺序组装，失败的块跳过
+        audio_segments = []
+        sample_rate = self.sample_rate
+        for i in sorted(chunk_audio):
+            result = chunk_audio[i]
+            if isinstance(result, Exception):
+                logging.error(f"合成第 {i+1} 块时出错: {result}")
+                continue
+            audio_segments.append(result)
+            logging.info(f"第 {i+1}/{len(chunks)} 块合成完成，音频长度: {len(result)/sample_rate:.2f}秒")
         
         # 如果没有成功合成任何块，返回None
         if not audio_segments:
@@ -352,7 +698,60 @@ class CosyVoiceHelper:
             "sample_rate": sample_rate
         }
 
-    def synthesize_long_text(self, text, speaker_name, output_path=None, max_chunk_length=70):
+    def _get_long_text_pipeline(self) -> Optional[LongTextPipeline]:
+        """获取长文本流水线，未启用或当前CosyVoice版本不支持时返回None"""
+        if not LONG_TEXT_PIPELINE or self._long_text_pipeline is False:
+            return None
+        if self._long_text_pipeline is None:
+            if LongTextPipeline.is_supported(self.model):
+                self._long_text_pipeline = LongTextPipeline(self.model)
+            else:
+                logging.warning("当前CosyVoice版本不支持长文本流水线合成，使用逐块合成")
+                self._long_text_pipeline = False
+                return None
+        return self._long_text_pipeline
+    
+    def _synthesize_chunks_sequential(self, chunks: List[str], indices: List[int], speaker_name: str,
+                                      speed: float = 1.0) -> Dict[int, Any]:
+        """逐块合成，返回 块序号 -> 音频数据或异常"""
+        results = {}
+        for i in indices:
+            logging.info(f"正在合成第 {i+1}/{len(chunks)} 块，内容: '{chunks[i]}'")
+            try:
+                results[i] = self._inference_sft_chunk(chunks[i], speaker_name, speed)
+            except Exception as e:
+                results[i] = e
+        return results
+    
+    def _synthesize_chunks_pipelined(self, pipeline: LongTextPipeline, chunks: List[str],
+                                     indices: List[int], speaker_name: str) -> Dict[int, Any]:
+        """
+        流水线合成多个块，第N+1块的前端和LLM计算与第N块的flow/声码器计算重叠
+        
+        流水线整体失败时回退到逐块合成
+        """
+        frontend = self.model.frontend
+        
+        def build_inputs(chunk):
+            return [frontend.frontend_sft(segment, speaker_name)
+                    for segment in frontend.text_normalize(chunk, split=True)]
+        
+        logging.info(f"流水线合成 {len(indices)} 个块")
+        start_time = time.time()
+        try:
+            results = pipeline.run([(i, lambda chunk=chunks[i]: build_inputs(chunk)) for i in indices])
+        except Exception as e:
+            logging.error(f"流水线合成失败，回退到逐块合成: {e}")
+            return self._synthesize_chunks_sequential(chunks, indices, speaker_name)
+        logging.info(f"流水线合成完成，耗时 {time.time() - start_time:.2f}秒")
+        
+        voice_identity = f"preset:{speaker_name}"
+        for i, result in results.items():
+            if not isinstance(result, Exception) and result.size:
+                self._audio_cache.put(self._audio_cache_key(chunks[i], voice_identity), result, self.sample_rate)
+        return results
+    
+    def synthesize_long_text(self, text, speaker_name, output_path=None, max_chunk_length=None):
         """
         合成长文本，通过将文本分段处理然后合并结果
         
@@ -360,7 +759,7 @@ class CosyVoiceHelper:
         text: 要合成的文本
         speaker_name: 说话人名称
         output_path: 输出音频文件路径，如果为None则创建临时文件
-        max_chunk_length: 每个文本块的最大字符数
+        max_chunk_length: 每个文本块的最大字符数，为None时按模型token数规划分块
         
         返回:
         输出音频文件的路径或音频数据
@@ -373,7 +772,7 @@ class CosyVoiceHelper:
         
         try:
             # 使用内部处理方法获取合成的音频数据
-            result = self._synthesize_long_text_inner(text, speaker_name)
+            result = self._synthesize_long_text_inner(text, speaker_name, max_chunk_length)
             
             # 如果需要保存到文件
             if output_path:
@@ -401,17 +800,15 @@ class CosyVoiceHelper:
         """
         logging.info(f"开始合成文本，长度: {len(text)}")
         
-        # 检查文本长度，如果超过阈值则使用长文本处理方法
-        max_single_text_length = 70  # 根据实际测试调整
-        
-        if len(text) > max_single_text_length:  
-            logging.info(f"文本长度 {len(text)} 超过阈值({max_single_text_length})，使用长文本处理")
-            return self.synthesize_long_text(text, speaker_name, output_path)
-        
         # 确保模型已初始化
         if self.model is None:
             self._initialize_model()
         
+        # 检查文本的token数，如果超过单块长度则使用长文本处理方法
+        if self.chunk_planner.needs_split(text):
+            logging.info(f"文本 {len(text)} 个字符超过单块长度({self.chunk_planner.max_tokens} tokens)，使用长文本处理")
+            return self.synthesize_long_text(text, speaker_name, output_path)
+        
         logging.info(f"使用标准合成方法处理文本: {text[:30]}...")
         # 对于短文本的合成
         result = self.synthesize_speech(text, speaker_name, is_preset=True)
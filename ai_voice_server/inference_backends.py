@@ -0,0 +1,174 @@
+"""
+CPU推理后端
+
+CosyVoice在没有CUDA的机器上会忽略load_jit/load_trt参数，全部模块以eager模式运行。
+这里在模型加载完成后替换其中计算最密集的模块：
+
+- eager:       不做替换
+- torchscript: 加载模型目录中预先导出的TorchScript模块（flow编码器，CosyVoice还包括LLM文本编码器和LLM）
+- onnxruntime: flow matching的估计器（每次合成执行多步ODE求解，是flow阶段的主要开销）
+               改由ONNX Runtime会话执行，ONNX文件由CosyVoice的 cosyvoice/bin/export_onnx.py 导出
+
+HiFT声码器在所有后端下都保持eager：其中的正弦激励生成和istft无法导出为TorchScript/ONNX。
+所需文件或依赖缺失时记录警告并回退到eager。
+"""
+
+import os
+import inspect
+import logging
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnxruntime")
+
+# 推理后端：eager / torchscript / onnxruntime
+COSYVOICE_BACKEND = os.environ.get("COSYVOICE_BACKEND", "eager").strip().lower()
+# 算子内并行线程数，为0时保持PyTorch默认值（推理池工作进程中为INFERENCE_WORKER_THREADS）
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get("INFERENCE_INTRA_OP_THREADS", "0"))
+# 算子间并行线程数，为0时保持默认值（ONNX Runtime为1，即顺序执行）
+INFERENCE_INTER_OP_THREADS = int(os.environ.get("INFERENCE_INTER_OP_THREADS", "0"))
+# flow估计器的ONNX文件，为空时使用模型目录下的 flow.decoder.estimator.fp32.onnx
+COSYVOICE_ONNX_ESTIMATOR = os.environ.get("COSYVOICE_ONNX_ESTIMATOR", "")
+
+
+def configure_torch_threads(intra_op: int = INFERENCE_INTRA_OP_THREADS,
+                            inter_op: int = INFERENCE_INTER_OP_THREADS) -> None:
+    """按配置设置PyTorch的线程数，需在加载模型之前调用"""
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # 算子间线程池启动后不能再修改
+            logger.warning(f"无法设置算子间线程数: {e}")
+
+
+def _jit_files(model, model_dir: str) -> List[str]:
+    """模型load_jit所需的TorchScript文件，与CosyVoice自身的命名一致"""
+    if type(model).__name__ == "CosyVoice2":
+        names = ["flow.encoder.fp32.zip"]
+    else:
+        names = ["llm.text_encoder.fp32.zip", "llm.llm.fp32.zip", "flow.encoder.fp32.zip"]
+    return [os.path.join(model_dir, name) for name in names]
+
+
+def _apply_torchscript(model, model_dir: str) -> bool:
+    inner = model.model
+    if not hasattr(inner, "load_jit"):
+        logger.warning("当前CosyVoice版本不支持load_jit")
+        return False
+
+    files = _jit_files(model, model_dir)
+    missing = [path for path in files if not os.path.exists(path)]
+    if missing:
+        logger.warning(f"缺少TorchScript模块文件: {missing}")
+        return False
+    if len(inspect.signature(inner.load_jit).parameters) != len(files):
+        logger.warning("load_jit的参数与当前模型不匹配")
+        return False
+
+    inner.load_jit(*files)
+    return True
+
+
+class OnnxEstimator(torch.nn.Module):
+    """
+    以ONNX Runtime会话执行flow matching估计器
+
+    继承nn.Module，使flow_matching中按isinstance判断的PyTorch调用路径保持不变。
+    """
+
+    def __init__(self, session, original: torch.nn.Module):
+        super().__init__()
+        self.session = session
+        self.input_names = [item.name for item in session.get_inputs()]
+        # 保留原估计器上被flow模块读取的属性
+        for name in ("in_channels", "out_channels"):
+            if hasattr(original, name):
+                setattr(self, name, getattr(original, name))
+
+    def forward(self, x, mask, mu, t, spks=None, cond=None, **kwargs):
+        tensors = (x, mask, mu, t, spks, cond)
+        feeds = {
+            name: np.ascontiguousarray(tensor.detach().cpu().numpy().astype(np.float32))
+            for name, tensor in zip(self.input_names, tensors)
+        }
+        output = self.session.run(None, feeds)[0]
+        return torch.from_numpy(output).to(device=x.device, dtype=x.dtype)
+
+
+def create_onnx_session(path: str, intra_op: int = INFERENCE_INTRA_OP_THREADS,
+                        inter_op: int = INFERENCE_INTER_OP_THREADS):
+    """创建CPU上的ONNX Runtime会话"""
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op if intra_op > 0 else torch.get_num_threads()
+    if inter_op > 1:
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        options.inter_op_num_threads = inter_op
+    else:
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _apply_onnxruntime(model, model_dir: str) -> bool:
+    if onnxruntime is None:
+        logger.warning("未安装onnxruntime")
+        return False
+
+    decoder = getattr(getattr(model.model, "flow", None), "decoder", None)
+    if decoder is None or not isinstance(getattr(decoder, "estimator", None), torch.nn.Module):
+        logger.warning("当前CosyVoice版本的flow模块没有可替换的估计器")
+        return False
+
+    path = COSYVOICE_ONNX_ESTIMATOR or os.path.join(model_dir, "flow.decoder.estimator.fp32.onnx")
+    if not os.path.exists(path):
+        logger.warning(f"缺少flow估计器ONNX文件: {path}，可使用CosyVoice的 cosyvoice/bin/export_onnx.py 导出")
+        return False
+
+    decoder.estimator = OnnxEstimator(create_onnx_session(path), decoder.estimator)
+    return True
+
+
+def apply_inference_backend(model, model_dir: str, backend: Optional[str] = None) -> str:
+    """
+    为已加载的CosyVoice/CosyVoice2模型应用推理后端
+
+    参数:
+        model: CosyVoice或CosyVoice2实例
+        model_dir: 模型目录，TorchScript/ONNX文件从这里加载
+        backend: 后端名称，为None时使用COSYVOICE_BACKEND
+
+    返回:
+        实际生效的后端名称，失败回退时为"eager"
+    """
+    backend = (backend or COSYVOICE_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        logger.warning(f"未知的推理后端 {backend}，可选: {', '.join(BACKENDS)}，使用eager")
+        return "eager"
+    if backend == "eager":
+        return backend
+
+    apply = _apply_torchscript if backend == "torchscript" else _apply_onnxruntime
+    try:
+        applied = apply(model, model_dir)
+    except Exception as e:
+        logger.warning(f"加载{backend}后端失败: {e}")
+        applied = False
+
+    if not applied:
+        logger.warning(f"推理后端 {backend} 不可用，回退到eager")
+        return "eager"
+    logger.info(f"已启用推理后端: {backend}")
+    return backend
+
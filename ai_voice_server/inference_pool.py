@@ -0,0 +1,500 @@
+"""
+多进程推理工作池
+
+CosyVoiceHelper是进程内单例，同一个uvicorn进程内的所有合成请求都串行使用同一个模型。
+推理池启动N个工作进程，每个进程持有一份模型副本，Web进程把请求逐个分派给空闲的工作进程；
+合成的音频通过共享内存传回Web进程，池会定期检查工作进程健康状态并在崩溃或卡死时重启。
+连续启动失败的工作进程按指数退避重启，超过INFERENCE_MAX_RESTARTS次后放弃；
+所有工作进程都被放弃时推理池进入失败状态，排队的请求以异常结束。
+
+INFERENCE_WORKERS 为0（默认）时不启动推理池，所有调用直接在当前进程内执行。
+"""
+
+import os
+import time
+import uuid
+import queue
+import threading
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .utils.executor import get_inference_executor
+from .warmup import ensure_model_ready
+
+logger = logging.getLogger(__name__)
+
+# 工作进程数量，0表示不使用推理池
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))
+# 每个工作进程使用的torch线程数，0表示按CPU核数平均分配
+INFERENCE_WORKER_THREADS = int(os.environ.get("INFERENCE_WORKER_THREADS", "0"))
+# 健康检查间隔（秒）
+INFERENCE_HEALTH_INTERVAL = float(os.environ.get("INFERENCE_HEALTH_INTERVAL", "5"))
+# 心跳超时（秒），超过该时间未收到心跳的工作进程视为卡死
+INFERENCE_HEARTBEAT_TIMEOUT = float(os.environ.get("INFERENCE_HEARTBEAT_TIMEOUT", "60"))
+# 单次调用的默认超时（秒），0表示不限制
+INFERENCE_CALL_TIMEOUT = float(os.environ.get("INFERENCE_CALL_TIMEOUT", "600"))
+# 工作进程连续启动失败（就绪前退出）时的最大重启次数，超过后放弃该进程
+INFERENCE_MAX_RESTARTS = int(os.environ.get("INFERENCE_MAX_RESTARTS", "3"))
+# 重启退避的上限（秒）
+INFERENCE_RESTART_BACKOFF_MAX = 60.0
+
+# 允许通过推理池调用的CosyVoiceHelper方法
+ALLOWED_METHODS = {
+    "synthesize_speech",
+    "synthesize_for_duration",
+    "synthesize",
+    "synthesize_long_text",
+    "get_preset_voices",
+}
+
+# 小于该字节数的数组直接随消息传递，不使用共享内存
+_SHM_MIN_BYTES = 64 * 1024
+
+
+def _pack_value(value: Any) -> Any:
+    """将结果中的大数组放入共享内存，其余内容原样返回"""
+    if isinstance(value, np.ndarray) and value.nbytes >= _SHM_MIN_BYTES:
+        shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)[...] = value
+        packed = ("__shm__", shm.name, value.shape, value.dtype.str)
+        shm.close()
+        return packed
+    if isinstance(value, dict):
+        return {k: _pack_value(v) for k, v in value.items()}
+    return value
+
+
+def _unpack_value(value: Any) -> Any:
+    """从共享内存中取回数组并释放共享内存块"""
+    if isinstance(value, tuple) and len(value) == 4 and value[0] == "__shm__":
+        _, name, shape, dtype = value
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    if isinstance(value, dict):
+        return {k: _unpack_value(v) for k, v in value.items()}
+    return value
+
+
+def _release_value(value: Any) -> None:
+    """释放未被取回的共享内存块（调用方已放弃结果时使用）"""
+    try:
+        _unpack_value(value)
+    except Exception:
+        pass
+
+
+def _worker_main(worker_idx: int, request_queue, result_queue, model_dir: Optional[str], num_threads: int) -> None:
+    """工作进程入口：加载模型副本并循环处理请求"""
+    logging.basicConfig(level=logging.INFO)
+    stop_event = threading.Event()
+
+    def heartbeat():
+        while not stop_event.wait(max(1.0, INFERENCE_HEALTH_INTERVAL / 2)):
+            result_queue.put(("heartbeat", worker_idx, None, None))
+
+    try:
+        import torch
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
+        from ai_voice_server.warmup import WARMUP_ENABLED, warm_up_helper
+        helper = CosyVoiceHelper(model_dir=model_dir)
+        # 预热完成后才报告就绪，避免首个请求承担首次推理开销
+        if WARMUP_ENABLED:
+            warm_up_helper(helper)
+    except Exception as e:
+        logging.exception(f"推理工作进程 {worker_idx} 初始化失败")
+        result_queue.put(("fatal", worker_idx, None, str(e)))
+        return
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    result_queue.put(("ready", worker_idx, None, os.getpid()))
+
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+
+        request_id, method, args, kwargs = request
+        try:
+            if method not in ALLOWED_METHODS:
+                raise ValueError(f"不允许通过推理池调用的方法: {method}")
+            result = getattr(helper, method)(*args, **kwargs)
+            result_queue.put(("result", worker_idx, request_id, _pack_value(result)))
+        except Exception as e:
+            logging.exception(f"推理工作进程 {worker_idx} 执行 {method} 失败")
+            result_queue.put(("error", worker_idx, request_id, f"{type(e).__name__}: {e}"))
+
+    stop_event.set()
+
+
+class InferencePool:
+    """
+    多进程推理池
+
+    请求先进入Web进程内的待分派队列，每个工作进程有自己的请求队列，同一时间只分派一个请求；
+    分派时即记录请求所在的工作进程，进程退出时它手上的请求立即以异常结束，不会一直挂起。
+    结果经由结果队列（大数组经共享内存）回到Web进程，由收集线程分发到对应的Future。
+    """
+
+    def __init__(self, num_workers: int, model_dir: Optional[str] = None, num_threads: int = INFERENCE_WORKER_THREADS):
+        if num_workers < 1:
+            raise ValueError("推理池至少需要一个工作进程")
+
+        self.num_workers = num_workers
+        self.model_dir = model_dir
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // num_workers)
+
+        self._ctx = mp.get_context("spawn")
+        self._result_queue = self._ctx.Queue()
+
+        self._processes: List[Optional[mp.process.BaseProcess]] = [None] * num_workers
+        self._request_queues: List[Optional[Any]] = [None] * num_workers
+        self._ready = [False] * num_workers
+        self._last_heartbeat = [0.0] * num_workers
+        # 连续启动失败次数、下次重启时间、是否已放弃
+        self._failures = [0] * num_workers
+        self._restart_at: List[Optional[float]] = [None] * num_workers
+        self._given_up = [False] * num_workers
+        self._last_error: List[Optional[str]] = [None] * num_workers
+        # 工作进程序号 -> 已分派给它的请求ID
+        self._inflight: Dict[int, str] = {}
+        self._pending: Dict[str, Future] = {}
+        # 等待分派的请求
+        self._backlog: deque = deque()
+        self._lock = threading.Lock()
+        # 任一工作进程完成模型加载和预热后置位
+        self._any_ready = threading.Event()
+        # 所有工作进程都被放弃时的错误信息
+        self.error: Optional[str] = None
+
+        self._running = False
+        self._collector: Optional[threading.Thread] = None
+        self._monitor: Optional[threading.Thread] = None
+
+        self.restarts = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> "InferencePool":
+        if self._running:
+            return self
+        self._running = True
+        for idx in range(self.num_workers):
+            self._start_worker(idx)
+
+        self._collector = threading.Thread(target=self._collect_results, name="inference-pool-collector", daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._monitor_workers, name="inference-pool-monitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"推理池已启动: {self.num_workers} 个工作进程，每个进程 {self.num_threads} 个线程")
+        return self
+
+    def _start_worker(self, idx: int) -> None:
+        # 每次启动使用新的请求队列，旧进程退出时队列中残留的请求不会被新进程取到
+        request_queue = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(idx, request_queue, self._result_queue, self.model_dir, self.num_threads),
+            name=f"cosyvoice-worker-{idx}",
+            daemon=True,
+        )
+        process.start()
+        with self._lock:
+            self._processes[idx] = process
+            self._request_queues[idx] = request_queue
+            self._ready[idx] = False
+            self._restart_at[idx] = None
+            self._last_heartbeat[idx] = time.monotonic()
+        logger.info(f"推理工作进程 {idx} 已启动，PID: {process.pid}")
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """提交一次CosyVoiceHelper方法调用，返回Future"""
+        if not self._running:
+            raise RuntimeError("推理池未启动")
+        if self.error:
+            raise RuntimeError(self.error)
+        if method not in ALLOWED_METHODS:
+            raise ValueError(f"不允许通过推理池调用的方法: {method}")
+
+        request_id = uuid.uuid4().hex
+        future: Future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+            self._backlog.append((request_id, method, args, kwargs))
+            self._dispatch_locked()
+        return future
+
+    def call(self, method: str, *args, timeout: Optional[float] = INFERENCE_CALL_TIMEOUT, **kwargs) -> Any:
+        """
+        同步调用，阻塞直到结果返回
+
+        超过timeout秒（为None或0时不限制）抛出TimeoutError并放弃该请求：
+        尚未分派的请求不再执行，已在执行的请求结果到达后直接释放。
+        """
+        future = self.submit(method, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout or None)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"推理池调用 {method} 超时（{timeout}秒）")
+
+    def _dispatch_locked(self) -> None:
+        """把待分派的请求交给空闲且已就绪的工作进程，调用时需持有self._lock"""
+        for idx in range(self.num_workers):
+            if not self._backlog:
+                return
+            if not self._ready[idx] or idx in self._inflight:
+                continue
+            while self._backlog:
+                request = self._backlog.popleft()
+                future = self._pending.get(request[0])
+                if future is None or future.cancelled():
+                    # 调用方已超时放弃
+                    self._pending.pop(request[0], None)
+                    continue
+                self._inflight[idx] = request[0]
+                self._request_queues[idx].put(request)
+                break
+
+    def _collect_results(self) -> None:
+        while self._running:
+            try:
+                kind, worker_idx, request_id, payload = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                self._last_heartbeat[worker_idx] = time.monotonic()
+
+                if kind == "ready":
+                    self._ready[worker_idx] = True
+                    self._failures[worker_idx] = 0
+                    self._any_ready.set()
+                    logger.info(f"推理工作进程 {worker_idx} 模型加载完成 (PID {payload})")
+                    self._dispatch_locked()
+                    continue
+                if kind == "fatal":
+                    # 进程随后退出，由监控线程按退避策略重启
+                    self._last_error[worker_idx] = payload
+                    logger.error(f"推理工作进程 {worker_idx} 初始化失败: {payload}")
+                    continue
+                if kind == "heartbeat":
+                    continue
+
+                if self._inflight.get(worker_idx) == request_id:
+                    self._inflight.pop(worker_idx, None)
+                future = self._pending.pop(request_id, None)
+                self._dispatch_locked()
+
+            if future is None or future.cancelled():
+                if kind == "result":
+                    _release_value(payload)
+                continue
+
+            if kind == "result":
+                try:
+                    future.set_result(_unpack_value(payload))
+                    self.completed += 1
+                except Exception as e:
+                    future.set_exception(e)
+                    self.failed += 1
+            elif kind == "error":
+                future.set_exception(RuntimeError(payload))
+                self.failed += 1
+
+    def _monitor_workers(self) -> None:
+        while self._running:
+            time.sleep(INFERENCE_HEALTH_INTERVAL)
+            if not self._running:
+                break
+
+            now = time.monotonic()
+            for idx in range(self.num_workers):
+                if self._given_up[idx]:
+                    continue
+                process = self._processes[idx]
+                if process is None:
+                    # 等待退避时间结束后重启
+                    if self._restart_at[idx] is not None and now >= self._restart_at[idx]:
+                        self.restarts += 1
+                        self._start_worker(idx)
+                    continue
+
+                alive = process.is_alive()
+                stale = self._ready[idx] and now - self._last_heartbeat[idx] > INFERENCE_HEARTBEAT_TIMEOUT
+                if alive and not stale:
+                    continue
+
+                if stale and alive:
+                    logger.error(f"推理工作进程 {idx} 心跳超时，强制重启")
+                    process.terminate()
+                    process.join(timeout=5)
+                else:
+                    logger.error(f"推理工作进程 {idx} 已退出 (exitcode={process.exitcode})")
+                self._handle_worker_exit(idx, now)
+
+            if all(self._given_up):
+                reason = next((e for e in reversed(self._last_error) if e), "工作进程反复退出")
+                self._fail_pool(f"推理池所有工作进程均启动失败: {reason}")
+                break
+
+    def _handle_worker_exit(self, idx: int, now: float) -> None:
+        """结束退出进程手上的请求，并安排退避重启或放弃该进程"""
+        with self._lock:
+            self._processes[idx] = None
+            self._request_queues[idx] = None
+            self._ready[idx] = False
+            self._failures[idx] += 1
+            failures = self._failures[idx]
+        self._fail_inflight(idx, f"推理工作进程 {idx} 异常退出")
+
+        if failures > INFERENCE_MAX_RESTARTS:
+            self._given_up[idx] = True
+            logger.error(f"推理工作进程 {idx} 连续 {failures} 次未能就绪，不再重启")
+            return
+        delay = min(INFERENCE_HEALTH_INTERVAL * 2 ** (failures - 1), INFERENCE_RESTART_BACKOFF_MAX)
+        self._restart_at[idx] = now + delay
+        logger.info(f"推理工作进程 {idx} 将在 {delay:.0f} 秒后重启（第 {failures} 次）")
+
+    def _fail_inflight(self, worker_idx: int, message: str) -> None:
+        with self._lock:
+            request_id = self._inflight.pop(worker_idx, None)
+            future = self._pending.pop(request_id, None) if request_id else None
+        if future is not None and not future.done():
+            future.set_exception(RuntimeError(message))
+            self.failed += 1
+
+    def _fail_pool(self, message: str) -> None:
+        """进入失败状态，所有未完成的请求以异常结束"""
+        logger.error(message)
+        with self._lock:
+            self.error = message
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._backlog.clear()
+            self._inflight.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(message))
+                self.failed += 1
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待至少一个工作进程完成模型加载和预热（失败状态见self.error）"""
+        return self._any_ready.wait(timeout)
+
+    def health(self) -> Dict[str, Any]:
+        """返回各工作进程的健康状态"""
+        now = time.monotonic()
+        with self._lock:
+            workers = []
+            for idx, process in enumerate(self._processes):
+                workers.append({
+                    "index": idx,
+                    "pid": process.pid if process else None,
+                    "alive": bool(process and process.is_alive()),
+                    "ready": self._ready[idx],
+                    "busy": idx in self._inflight,
+                    "failures": self._failures[idx],
+                    "given_up": self._given_up[idx],
+                    "last_error": self._last_error[idx],
+                    "seconds_since_heartbeat": round(now - self._last_heartbeat[idx], 1),
+                })
+            return {
+                "workers": workers,
+                "error": self.error,
+                "pending": len(self._pending),
+                "queued": len(self._backlog),
+                "completed": self.completed,
+                "failed": self.failed,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """停止所有工作进程，未完成的请求以异常结束"""
+        if not self._running:
+            return
+        self._running = False
+
+        for request_queue in self._request_queues:
+            if request_queue is not None:
+                request_queue.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._backlog.clear()
+            self._inflight.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("推理池已关闭"))
+        logger.info("推理池已关闭")
+
+
+_pool: Optional[InferencePool] = None
+
+
+def start_inference_pool(num_workers: int = INFERENCE_WORKERS, model_dir: Optional[str] = None) -> Optional[InferencePool]:
+    """按配置启动全局推理池，num_workers为0时不启动"""
+    global _pool
+    if num_workers <= 0:
+        return None
+    if _pool is None:
+        _pool = InferencePool(num_workers, model_dir=model_dir).start()
+    return _pool
+
+
+def get_inference_pool() -> Optional[InferencePool]:
+    """返回全局推理池，未启动时返回None"""
+    return _pool
+
+
+def shutdown_inference_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def call_helper(method: str, *args, **kwargs) -> Any:
+    """
+    调用CosyVoiceHelper方法
+
+    推理池已启动时交给工作进程执行（默认超时INFERENCE_CALL_TIMEOUT秒），否则在当前进程内直接调用。
+    """
+    pool = get_inference_pool()
+    if pool is not None:
+        return pool.call(method, *args, **kwargs)
+
+    from .cosyvoice_helper import CosyVoiceHelper
+    return getattr(CosyVoiceHelper(), method)(*args, **kwargs)
+
+
+async def call_helper_async(method: str, *args, **kwargs) -> Any:
+    """
+    call_helper的异步版本，不阻塞事件循环
+
+    调用经过有界推理执行器进行准入控制，排队已满时抛出ExecutorBusyError（503）；
+    模型尚未加载或预热完成时同样返回503。
+    """
+    ensure_model_ready()
+    return await get_inference_executor().run(call_helper, method, *args, **kwargs)
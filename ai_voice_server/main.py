@@ -1,4 +1,10 @@
+import time
+# 启动报告中的导入耗时从这里开始计算
+_IMPORT_START = time.perf_counter()
+
+import threading
 from fastapi import FastAPI, Depends, Form, File, UploadFile, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, get_db
 from sqlalchemy.orm import Session
@@ -7,17 +13,27 @@ from .models.models import User, Voice
 from .routers import auth, voice, admin, courseware, voice_replace
 # 修改此行 - 从routers.auth模块导入get_current_user函数
 from .routers.auth import get_current_user
-from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-from typing import List
+from .inference_pool import (
+    INFERENCE_WORKERS, start_inference_pool, shutdown_inference_pool,
+    get_inference_pool, call_helper_async
+)
+from .utils.executor import executor_stats, shutdown_executors
+from .utils.time_stretch import shutdown_time_stretch_pool
+from .utils.lazy_import import imported_heavy_modules
+from .utils.audio_encoders import parse_output_format, audio_response
+from .voice_registry import voice_registry
+from .warmup import (
+    WARMUP_ENABLED, NOT_READY_RETRY_AFTER, startup_report, warm_up_helper, ensure_model_ready
+)
+from typing import List, Optional
 import os
 import uuid
 import logging
-import scipy.io.wavfile as wav
-import numpy as np
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+startup_report.record("imports", time.perf_counter() - _IMPORT_START)
 
 # 目录配置
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ai_voice_server", "uploads")
@@ -47,23 +63,101 @@ app.include_router(courseware.router, prefix="/api", tags=["courseware"])
 # 添加声音置换路由
 app.include_router(voice_replace.router, tags=["voice-replace"])
 
+# 是否在启动时加载模型；为0时模型在首个合成请求时加载，只处理登录、管理等请求的进程不会导入torch
+PRELOAD_MODEL = os.environ.get("PRELOAD_MODEL", "1") != "0"
+
 # 初始化全局变量
 cosyvoice_helper = None
 
+def _load_model():
+    """在后台线程加载模型、建立声音注册表并预热，全部完成后标记就绪"""
+    global cosyvoice_helper
+    try:
+        pool = get_inference_pool()
+        if pool is not None:
+            # 工作进程各自加载模型，并在报告就绪前完成预热
+            with startup_report.phase("model_load_and_warmup"):
+                while not pool.wait_ready(timeout=5):
+                    if get_inference_pool() is None:
+                        return
+                    if pool.error:
+                        # 所有工作进程都已放弃重启
+                        raise RuntimeError(pool.error)
+        else:
+            with startup_report.phase("model_load"):
+                # 导入CosyVoiceHelper会加载torch和CosyVoice，计入模型加载阶段
+                from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
+                cosyvoice_helper = CosyVoiceHelper()
+        
+        # 建立声音注册表，之后解析声音不再需要查询数据库或模型
+        with startup_report.phase("voice_registry"):
+            try:
+                voice_registry.build()
+            except Exception as e:
+                logger.error(f"加载声音注册表失败，将在首次使用时重试: {e}")
+        
+        if pool is None and WARMUP_ENABLED:
+            with startup_report.phase("warmup"):
+                startup_report.details["warmup"] = warm_up_helper(cosyvoice_helper)
+        startup_report.mark_ready()
+    except Exception as e:
+        startup_report.mark_failed(e)
+
 @app.on_event("startup")
 async def startup():
-    # 初始化CosyVoice模型
-    global cosyvoice_helper
-    cosyvoice_helper = CosyVoiceHelper()
-    logger.info("服务器已启动，模型已初始化")
+    # 模型在后台加载，服务器立即开始处理不依赖模型的请求；加载和预热完成前推理接口返回503
+    if INFERENCE_WORKERS > 0:
+        # 使用多进程推理池，模型副本由各工作进程加载
+        start_inference_pool(INFERENCE_WORKERS)
+        logger.info(f"服务器已启动，推理池共 {INFERENCE_WORKERS} 个工作进程")
+        logger.warning("推理池模式下流式合成接口 /api/synthesize/stream 和 /api/tts/ws 不可用（返回503）")
+    elif not PRELOAD_MODEL:
+        # 不预加载模型：推理接口不再等待，首个合成请求时加载模型
+        startup_report.details["preload"] = False
+        startup_report.mark_ready()
+        logger.info("服务器已启动，模型将在首次使用时加载")
+        return
+    else:
+        logger.info("服务器已启动，正在后台加载模型")
+    threading.Thread(target=_load_model, name="model-startup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_inference_pool()
+    shutdown_executors()
+    shutdown_time_stretch_pool()
+
+@app.get("/api/ready")
+async def ready():
+    """就绪检查：模型加载和预热完成前返回503，同时返回启动各阶段的耗时"""
+    report = startup_report.as_dict()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content=report,
+                            headers={"Retry-After": str(NOT_READY_RETRY_AFTER)})
+    return report
+
+@app.get("/api/inference/health")
+async def inference_health():
+    """返回推理池工作进程的健康状态和执行器排队情况"""
+    pool = get_inference_pool()
+    if pool is None:
+        return {
+            "mode": "in-process",
+            "model_loaded": bool(cosyvoice_helper and cosyvoice_helper.is_initialized),
+            "backend": cosyvoice_helper.backend if cosyvoice_helper else None,
+            "quantized": cosyvoice_helper.quantized if cosyvoice_helper else [],
+            "heavy_modules": imported_heavy_modules(),
+            "executors": executor_stats(),
+            "startup": startup_report.as_dict()
+        }
+    return {"mode": "pool", **pool.health(), "executors": executor_stats(), "startup": startup_report.as_dict()}
 
 @app.get("/api/preset_voices", response_model=List[str])
 async def get_preset_voices(current_user: User = Depends(get_current_user)):
     """获取所有预置的声音列表"""
-    global cosyvoice_helper
     try:
         # 获取系统预置声音
-        preset_voices = cosyvoice_helper.get_preset_voices()
+        preset_voices = await call_helper_async("get_preset_voices")
         logger.info(f"获取到 {len(preset_voices)} 个预置声音")
         return preset_voices
     except Exception as e:
@@ -78,82 +172,63 @@ async def synthesize(
     text: str = Form(...),
     voice_id: str = Form(...),
     is_preset: bool = Form(False),
+    output_format: str = Form("wav"),
+    bitrate: Optional[int] = Form(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    合成语音
+    合成语音，直接返回音频流
     
     - text: 要合成的文本
     - voice_id: 声音ID或预置声音名称
     - is_preset: 是否使用预置声音
+    - output_format: wav（默认）/ opus / mp3 / flac
+    - bitrate: opus / mp3 的码率(kbps)
     """
+    output_format, bitrate = parse_output_format(output_format, bitrate)
+    # 模型未就绪时在解析声音、提交推理之前返回503
+    ensure_model_ready()
     try:
         if is_preset:
             # 使用预置声音
-            result = cosyvoice_helper.synthesize_speech(text, voice_id, is_preset=True)
+            result = await call_helper_async("synthesize_speech", text, voice_id, is_preset=True)
         else:
             # 使用用户上传的声音
-            voice = db.query(Voice).filter(Voice.id == voice_id).first()
+            voice = voice_registry.resolve(voice_id, is_preset=False)
             if not voice:
                 raise HTTPException(status_code=404, detail="声音不存在")
                 
             # 确保用户只能使用自己的声音
-            if voice.user_id != current_user.id and not current_user.is_admin:
+            if not voice.is_preset and voice.user_id != current_user.id and not current_user.is_admin:
                 raise HTTPException(status_code=403, detail="没有权限使用此声音")
                 
-            audio_path = os.path.join(UPLOAD_DIR, voice.filename)
-            result = cosyvoice_helper.synthesize_speech(
+            result = await call_helper_async(
+                "synthesize_speech",
                 text, 
-                voice_id, 
-                is_preset=False,
-                prompt_audio=audio_path,
-                prompt_text=voice.transcript
+                voice.synthesis_voice_id, 
+                is_preset=voice.is_preset,
+                prompt_audio=voice.prompt_audio,
+                prompt_text=voice.prompt_text
             )
         
-        # 生成临时文件名
-        temp_filename = f"temp_{uuid.uuid4().hex}.wav"
-        temp_path = os.path.join(TEMP_DIR, temp_filename)
-        
-        # 确保临时目录存在
-        os.makedirs(TEMP_DIR, exist_ok=True)
-        
-        # 确保音频数据格式正确
         audio_data = result["audio_data"]
         sample_rate = result["sample_rate"]
         
         # 检查并打印音频信息
         logger.info(f"音频数据类型: {audio_data.dtype}, 形状: {audio_data.shape}")
-        logger.info(f"音频范围: 最小={audio_data.min()}, 最大={audio_data.max()}")
-        
-        # 确保是整数类型，防止因为float类型导致无声音
-        if audio_data.dtype != np.int16:
-            if np.issubdtype(audio_data.dtype, np.floating) and audio_data.max() <= 1.0 and audio_data.min() >= -1.0:
-                # 浮点数据在[-1, 1]范围内，缩放到int16范围
-                audio_data = (audio_data * 32767).astype(np.int16)
-                logger.info("浮点数据已缩放至int16范围")
-            else:
-                # 其他情况直接转换
-                audio_data = audio_data.astype(np.int16)
-                logger.info("数据已转换为int16类型")
         
         # 检查音频数据是否为空
         if audio_data.size == 0:
             raise HTTPException(status_code=500, detail="合成的音频数据为空")
         
-        # 保存合成的语音到临时文件
-        wav.write(temp_path, sample_rate, audio_data)
-        
-        # 检查生成的文件是否有效
-        if os.path.getsize(temp_path) <= 44:  # WAV文件头大小约44字节
-            logger.error("生成的WAV文件无效或为空")
-            raise HTTPException(status_code=500, detail="生成的音频文件无效")
-        
-        # 返回临时文件的URL
-        return {
-            "success": True,
-            "url": f"/temp/{temp_filename}"
-        }
+        # 直接以音频流返回，不再写入临时文件；int16转换或压缩编码在分块输出时进行
+        return audio_response(
+            audio_data, sample_rate, output_format, bitrate,
+            filename=f"synthesized_{uuid.uuid4().hex[:8]}{output_format.extension}"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("语音合成失败")
         raise HTTPException(status_code=500, detail=f"语音合成失败: {str(e)}")
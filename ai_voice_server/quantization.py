@@ -0,0 +1,192 @@
+"""
+CPU动态int8量化
+
+CPU上合成的主要耗时在0.5B的文本->语音token LLM，其计算几乎全部是Linear层的矩阵乘。
+开启后在模型加载时对LLM（可选flow估计器）的Linear层做动态int8量化：权重以int8保存，
+激活在运行时按批动态量化。
+
+量化后的权重保存到QUANTIZED_WEIGHTS_DIR，下次启动时直接构造量化层并加载，不再重新量化；
+原始权重文件变化或PyTorch版本变化时自动重新生成。
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import torch
+
+try:
+    import torch.ao.nn.quantized.dynamic as nnqd
+except ImportError:
+    import torch.nn.quantized.dynamic as nnqd
+
+logger = logging.getLogger(__name__)
+
+# 可量化的模块
+QUANTIZE_PARTS = ("llm", "flow")
+
+# 需要量化的模块，逗号分隔：llm / llm,flow；为空或0时不量化，1等同于llm
+COSYVOICE_QUANTIZE = os.environ.get("COSYVOICE_QUANTIZE", "")
+# 量化权重的保存目录，为空时使用模型目录下的int8子目录
+QUANTIZED_WEIGHTS_DIR = os.environ.get("QUANTIZED_WEIGHTS_DIR", "")
+
+# 量化权重文件格式版本，格式变化时递增
+_FORMAT_VERSION = 1
+
+
+def parse_quantize_parts(value: Optional[str]) -> List[str]:
+    """解析量化配置，返回需要量化的模块列表"""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "off", "none"):
+        return []
+    if value in ("1", "true", "on"):
+        return ["llm"]
+    parts = []
+    for part in value.split(","):
+        part = part.strip()
+        if part not in QUANTIZE_PARTS:
+            logger.warning(f"未知的量化模块 {part}，可选: {', '.join(QUANTIZE_PARTS)}")
+            continue
+        if part not in parts:
+            parts.append(part)
+    return parts
+
+
+def _target_module(model, part: str) -> Optional[torch.nn.Module]:
+    """返回待量化的子模块"""
+    inner = model.model
+    if part == "llm":
+        module = getattr(inner, "llm", None)
+    else:
+        module = getattr(getattr(getattr(inner, "flow", None), "decoder", None), "estimator", None)
+    if not isinstance(module, torch.nn.Module):
+        return None
+    # 已由TorchScript/ONNX Runtime后端替换的模块不再量化
+    if any(isinstance(child, torch.jit.ScriptModule) for child in module.modules()):
+        return None
+    if not any(type(child) is torch.nn.Linear for child in module.modules()):
+        return None
+    return module
+
+
+def _source_fingerprint(model_dir: str, part: str) -> Dict[str, Any]:
+    """原始权重文件的大小和修改时间，用于判断保存的量化权重是否过期"""
+    path = os.path.join(model_dir, f"{part}.pt")
+    try:
+        stat = os.stat(path)
+        source = {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+    except OSError:
+        source = None
+    return {"format": _FORMAT_VERSION, "torch": torch.__version__, "source": source}
+
+
+def _select_engine() -> None:
+    """选择当前CPU可用的量化计算引擎"""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("fbgemm", "x86", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return
+
+
+def _quantized_linear_names(module: torch.nn.Module) -> List[str]:
+    return [name for name, child in module.named_modules() if isinstance(child, nnqd.Linear)]
+
+
+def _replace_with_empty_quantized(module: torch.nn.Module, names: List[str]) -> None:
+    """把指定的Linear层替换为未初始化的动态量化层，随后由load_state_dict填充权重"""
+    for name in names:
+        parent_name, _, child_name = name.rpartition(".")
+        parent = module.get_submodule(parent_name) if parent_name else module
+        linear = getattr(parent, child_name)
+        if not isinstance(linear, torch.nn.Linear):
+            raise ValueError(f"{name} 不是Linear层")
+        setattr(parent, child_name, nnqd.Linear(linear.in_features, linear.out_features,
+                                                bias_=linear.bias is not None, dtype=torch.qint8))
+
+
+def _load_saved(module: torch.nn.Module, path: str, fingerprint: Dict[str, Any]) -> bool:
+    """加载保存的量化权重，文件不存在、已过期或无法读取时返回False"""
+    meta_path = path + ".json"
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != fingerprint:
+            logger.info(f"量化权重已过期，重新量化: {path}")
+            return False
+        # 量化层的打包权重不是纯张量，需要关闭weights_only
+        state_dict = torch.load(path, map_location="cpu", weights_only=False)
+    except Exception as e:
+        logger.warning(f"读取量化权重失败，重新量化: {e}")
+        return False
+
+    # 替换层之后模块已无法回退到fp32，此后的失败直接抛出
+    _replace_with_empty_quantized(module, meta["linear_names"])
+    module.load_state_dict(state_dict)
+    return True
+
+
+def _save(module: torch.nn.Module, path: str, fingerprint: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先写临时文件再替换，避免并发启动的工作进程读到不完整的文件
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(module.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+    meta = {"fingerprint": fingerprint, "linear_names": _quantized_linear_names(module)}
+    tmp_meta_path = f"{path}.json.{os.getpid()}.tmp"
+    with open(tmp_meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_meta_path, path + ".json")
+
+
+def quantize_model(model, model_dir: str, parts: List[str], weights_dir: Optional[str] = None) -> List[str]:
+    """
+    对已加载的CosyVoice/CosyVoice2模型做动态int8量化，需在应用推理后端之后调用
+
+    参数:
+        model: CosyVoice或CosyVoice2实例
+        model_dir: 模型目录
+        parts: 需要量化的模块，取值见QUANTIZE_PARTS
+        weights_dir: 量化权重的保存目录，为None时使用QUANTIZED_WEIGHTS_DIR
+
+    返回:
+        实际完成量化的模块列表
+    """
+    if not parts:
+        return []
+    _select_engine()
+    weights_dir = weights_dir or QUANTIZED_WEIGHTS_DIR or os.path.join(model_dir, "int8")
+
+    quantized = []
+    for part in parts:
+        module = _target_module(model, part)
+        if module is None:
+            logger.warning(f"当前模型没有可量化的 {part} 模块（或已由推理后端替换），跳过")
+            continue
+
+        path = os.path.join(weights_dir, f"{part}.int8.pt")
+        fingerprint = _source_fingerprint(model_dir, part)
+        if _load_saved(module, path, fingerprint):
+            logger.info(f"已加载 {part} 的int8量化权重: {path}")
+            quantized.append(part)
+            continue
+
+        try:
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        except Exception as e:
+            logger.warning(f"{part} 动态量化失败，保持fp32: {e}")
+            continue
+        quantized.append(part)
+        logger.info(f"{part} 已完成动态int8量化，共 {len(_quantized_linear_names(module))} 个Linear层")
+
+        try:
+            _save(module, path, fingerprint)
+            logger.info(f"{part} 的量化权重已保存: {path}")
+        except OSError as e:
+            logger.warning(f"保存 {part} 的量化权重失败，下次启动将重新量化: {e}")
+
+    return quantized
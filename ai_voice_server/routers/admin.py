@@ -7,6 +7,11 @@ from sqlalchemy import func
 from ..database import get_db
 from ..models import models
 from ..utils.security import get_current_user, get_password_hash
+from ..utils.prompt_cache import prompt_feature_cache
+from ..utils.audio_cache import get_synthesis_cache
+from ..utils.executor import executor_stats
+from ..voice_registry import voice_registry
+from starlette.concurrency import run_in_threadpool
 # 修改导入方式，直接导入schemas模块
 import sys
 import os.path
@@ -227,6 +232,8 @@ async def delete_user(
     # 删除用户前，先删除其关联的声音和课件
     voices = db.query(models.Voice).filter(models.Voice.user_id == user_id).all()
     for voice in voices:
+        prompt_feature_cache.invalidate(voice.id)
+        voice_registry.remove(voice.id)
         db.delete(voice)
     
     coursewares = db.query(models.Courseware).filter(models.Courseware.user_id == user_id).all()
@@ -339,6 +346,10 @@ async def delete_voice(
         db.delete(voice)
         db.commit()
         
+        # 4. 清除该声音的提示特征缓存和注册表条目
+        prompt_feature_cache.invalidate(voice_id)
+        voice_registry.remove(voice_id)
+        
         return {"message": "声音及关联课件已成功删除"}
     except HTTPException:
         raise
@@ -379,12 +390,12 @@ async def get_system_stats(
         ).scalar()
         
         # 获取系统状态信息
-        cpu_usage = psutil.cpu_percent(interval=1)
+        cpu_usage = await run_in_threadpool(psutil.cpu_percent, interval=1)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
         # 获取GPU显存信息
-        gpu_memory = get_gpu_memory_info()
+        gpu_memory = await run_in_threadpool(get_gpu_memory_info)
         
         system_status = {
             "cpu": {
@@ -433,6 +444,19 @@ async def get_system_stats(
             detail=f"获取系统统计数据失败: {str(e)}"
         )
 
+# 获取合成缓存统计
+@router.get("/cache-stats")
+async def get_cache_stats(
+    current_user: models.User = Depends(verify_admin)
+):
+    """返回合成音频缓存和提示特征缓存的命中统计，以及执行器的排队情况"""
+    return {
+        "synthesis_audio": get_synthesis_cache().stats(),
+        "prompt_features": prompt_feature_cache.stats(),
+        "executors": executor_stats(),
+        "voice_registry": voice_registry.stats()
+    }
+
 # 新增端点: 获取系统资源实时数据，用于图表显示
 @router.get("/system-monitor")
 async def get_system_monitor(
@@ -441,12 +465,13 @@ async def get_system_monitor(
     """获取系统资源的实时监控数据"""
     try:
         # 获取系统资源使用率
-        cpu_usage = psutil.cpu_percent(interval=0.5)
+        # cpu_percent采样和nvidia-smi调用会阻塞，放到线程池中执行
+        cpu_usage = await run_in_threadpool(psutil.cpu_percent, interval=0.5)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
         # 获取GPU显存使用率
-        gpu_memory = get_gpu_memory_info()
+        gpu_memory = await run_in_threadpool(get_gpu_memory_info)
         gpu_usage = gpu_memory["usage"] if gpu_memory else 0
         
         # 构建监控数据
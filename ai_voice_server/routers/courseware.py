@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 import os
 import io
@@ -13,12 +13,24 @@ import tempfile
 import subprocess
 import re
 import json
+import zipfile
+import xml.etree.ElementTree as ET
 from datetime import datetime
 
 from ..database import get_db, SessionLocal
 from ..models import models
 from ..utils.security import get_current_user
-from ..utils.text_splitter import merge_audio_files_exact, get_audio_duration
+from ..utils.text_splitter import (
+    merge_audio_files_exact, iter_sentences, iter_chunks, MAX_TEXT_LENGTH
+)
+from ..utils.audio_metadata import get_audio_duration
+from ..inference_pool import call_helper
+from ..utils.executor import get_job_executor, ExecutorBusyError
+from ..voice_registry import voice_registry
+from ..warmup import ensure_model_ready
+from ..utils.lazy_import import is_available
+from ..utils.audio_encoders import parse_output_format
+from ..utils.http_files import file_download_response, file_audio_response
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
@@ -51,24 +63,9 @@ except ImportError as e:
     IMPORT_ERRORS.append(f"soundfile: {str(e)}")
     PPT_SUPPORT = False
 
-try:
-    # 修改导入方式
-    from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, concatenate_videoclips, concatenate_audioclips, CompositeVideoClip
-    # moviepy的freeze函数位置可能有变化，试用两种路径
-    try:
-        from moviepy.video.fx.freeze import freeze
-    except ImportError:
-        try:
-            # 备选导入方式
-            from moviepy.video.fx.freeze_region import freeze_region as freeze
-        except ImportError:
-            # 如果freeze不可用，定义一个简易替代函数
-            def freeze(clip, duration):
-                """简易freeze函数，重复最后一帧"""
-                last_frame = clip.to_ImageClip(clip.duration-0.1)
-                return concatenate_videoclips([clip, last_frame.set_duration(duration-clip.duration)])
-except ImportError as e:
-    IMPORT_ERRORS.append(f"moviepy: {str(e)}")
+# moviepy会连带导入imageio、numpy等大量模块，这里只检查是否安装，生成视频时才导入
+if not is_available("moviepy"):
+    IMPORT_ERRORS.append("moviepy: 未安装")
     PPT_SUPPORT = False
 
 if not PPT_SUPPORT:
@@ -82,12 +79,10 @@ COSYVOICE_PATH = os.path.expanduser('~/CosyVoice')
 MATCHA_TTS_PATH = os.path.join(COSYVOICE_PATH, 'third_party/Matcha-TTS')
 sys.path.extend([COSYVOICE_PATH, MATCHA_TTS_PATH])
 
-try:
-    from cosyvoice.utils.file_utils import load_wav
-    COSYVOICE_AVAILABLE = True
-except ImportError:
+# 语音合成由CosyVoiceHelper完成，这里只检查CosyVoice是否可用，不导入torch
+COSYVOICE_AVAILABLE = is_available("cosyvoice")
+if not COSYVOICE_AVAILABLE:
     print("警告: CosyVoice 模块未找到")
-    COSYVOICE_AVAILABLE = False
 
 router = APIRouter()
 
@@ -165,17 +160,63 @@ def extract_text_from_pptx(pptx_path):
         logger.error(f"从PPTX提取文本时出错: {e}")
         return None
 
+# DOCX正文XML中的元素
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_BODY, _W_P, _W_R, _W_T = _W_NS + "body", _W_NS + "p", _W_NS + "r", _W_NS + "t"
+_W_TAB, _W_BR, _W_CR = _W_NS + "tab", _W_NS + "br", _W_NS + "cr"
+_W_TXBX = _W_NS + "txbxContent"
+# 文档逐段合成时每次提交给模型的文本长度（字符数），模型内部再按token分块
+DOCUMENT_WINDOW_CHARS = 1000
+
+def iter_docx_paragraphs(docx_path):
+    """
+    逐段读取DOCX正文段落的文本（与python-docx的doc.paragraphs相同，不含表格和文本框）
+    
+    直接增量解析word/document.xml，已处理的段落立即释放，
+    几百页的文档不必先整体加载和拼接成一个字符串
+    """
+    with zipfile.ZipFile(docx_path) as archive, archive.open("word/document.xml") as document_xml:
+        tags = []
+        body = None
+        texts = None
+        textbox_depth = 0
+        for event, elem in ET.iterparse(document_xml, events=("start", "end")):
+            if event == "start":
+                if elem.tag == _W_BODY:
+                    body = elem
+                elif elem.tag == _W_P and tags and tags[-1] == _W_BODY:
+                    texts = []
+                elif elem.tag == _W_TXBX:
+                    textbox_depth += 1
+                tags.append(elem.tag)
+                continue
+            
+            tags.pop()
+            parent = tags[-1] if tags else None
+            if elem.tag == _W_TXBX:
+                textbox_depth -= 1
+            elif texts is not None and not textbox_depth and parent == _W_R:
+                # 与python-docx的Run.text一致：制表符为\t，换行为\n
+                if elem.tag == _W_T:
+                    texts.append(elem.text or "")
+                elif elem.tag == _W_TAB:
+                    texts.append("\t")
+                elif elem.tag in (_W_BR, _W_CR):
+                    texts.append("\n")
+            
+            if parent == _W_BODY:
+                if elem.tag == _W_P:
+                    text = "".join(texts).strip()
+                    texts = None
+                    if text:
+                        yield text
+                # 释放已处理的正文元素
+                body.clear()
+
 def extract_text_from_docx(docx_path):
     """从DOCX文件中提取文本"""
     try:
-        doc = Document(docx_path)
-        paragraphs = []
-        
-        for para in doc.paragraphs:
-            if (para.text.strip()):
-                paragraphs.append(para.text.strip())
-        
-        return "\n".join(paragraphs)
+        return "\n".join(iter_docx_paragraphs(docx_path))
     except Exception as e:
         print(f"Error extracting text from DOCX: {e}")
         return None
@@ -187,25 +228,17 @@ def synthesize_speech(text, voice_id, output_path, db):
         return False
         
     try:
-        # 使用CosyVoiceHelper单例
-        from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-        cosyvoice_helper = CosyVoiceHelper()
-        
-        # 获取声音
-        voice = db.query(models.Voice).filter(models.Voice.id == voice_id).first()
+        # 从声音注册表获取声音
+        voice = voice_registry.get(int(voice_id))
         if not voice:
             raise Exception(f"Voice not found with id {voice_id}")
 
-        # 构建完整的音频文件路径
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-        audio_path = os.path.join(uploads_dir, voice.filename)
+        # 完整的音频文件路径
+        audio_path = voice.prompt_audio
         
         # 检查文件是否存在
-        if not os.path.exists(audio_path):
+        if not audio_path or not os.path.exists(audio_path):
             raise Exception(f"Voice file not found: {audio_path}")
-            
-        # 加载音频
-        prompt_speech_16k = load_wav(audio_path, 16000)
         
         # 分段合成处理长文本
         sentences = re.split(r'[。.!?！？]', text)
@@ -226,13 +259,14 @@ def synthesize_speech(text, voice_id, output_path, db):
             print(f"Synthesizing sentence {i+1}/{len(sentences)}: {sentence[:50]}...")
             
             try:
-                # 使用cosyvoice_helper而不是直接使用cosyvoice
-                result = cosyvoice_helper.synthesize_speech(
+                # 使用CosyVoiceHelper合成（推理池启动时由工作进程执行）
+                result = call_helper(
+                    "synthesize_speech",
                     sentence, 
                     voice_id, 
                     is_preset=False,
                     prompt_audio=audio_path,
-                    prompt_text=voice.transcript
+                    prompt_text=voice.prompt_text
                 )
                 
                 audio_array = result["audio_data"].astype(np.int16)
@@ -263,6 +297,92 @@ def synthesize_speech(text, voice_id, output_path, db):
         print(f"Error synthesizing speech: {e}")
         return False
 
+def resolve_task_preset_name(voice_id):
+    """从声音注册表将声音ID映射到实际的预置声音名称，无效的序号使用第一个预置声音"""
+    voice = voice_registry.resolve_preset(voice_id)
+    if voice is not None:
+        logger.info(f"预置声音 {voice_id} 解析为: {voice.speaker}")
+        return voice.speaker
+    if str(voice_id).isdigit():
+        preset_voices = voice_registry.preset_names
+        if not preset_voices:
+            raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
+        logger.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {preset_voices[0]}")
+        return preset_voices[0]
+    return str(voice_id)
+
+def synthesize_document_for_task(paragraphs, voice_id, output_path, is_preset=False,
+                                 text_file=None, on_progress=None):
+    """
+    逐段合成文档，边读取边合成边写入音频文件
+    
+    段落依次切分为句子并凑成文本块，每块合成后立即追加到输出文件，
+    第一块在读完整个文档之前就开始合成，内存占用为一个文本块的文本和音频。
+    
+    参数:
+        paragraphs: 段落的可迭代对象（如iter_docx_paragraphs）
+        voice_id: 声音ID
+        output_path: 输出WAV文件路径
+        is_preset: 是否为预置声音
+        text_file: 提取文本的保存路径（可选）
+        on_progress: 每合成一块后调用，参数为已合成的块数
+    
+    返回:
+        是否合成了音频
+    """
+    if is_preset:
+        # 预置声音每次提交较长的文本，由CosyVoiceHelper按token分块并流水线合成
+        voice_name = resolve_task_preset_name(voice_id)
+        window_chars = DOCUMENT_WINDOW_CHARS
+        synthesis_args = (voice_name,)
+        synthesis_kwargs = {"is_preset": True}
+        silence_duration = 0.0
+    else:
+        voice = voice_registry.get(int(voice_id))
+        if not voice or not voice.prompt_audio or not os.path.exists(voice.prompt_audio):
+            raise Exception(f"Voice not found with id {voice_id}")
+        window_chars = MAX_TEXT_LENGTH
+        synthesis_args = (voice_id,)
+        synthesis_kwargs = {"is_preset": False, "prompt_audio": voice.prompt_audio, "prompt_text": voice.prompt_text}
+        silence_duration = 0.2  # 句子间隔的静音时长（秒）
+    
+    text_out = open(text_file, 'w', encoding='utf-8') if text_file else None
+    
+    def saved_paragraphs():
+        for paragraph in paragraphs:
+            if text_out:
+                text_out.write(paragraph + "\n")
+            yield paragraph
+    
+    audio_out = None
+    count = 0
+    try:
+        for chunk in iter_chunks(iter_sentences(saved_paragraphs()), window_chars):
+            try:
+                result = call_helper("synthesize_speech", chunk, *synthesis_args, **synthesis_kwargs)
+            except Exception as e:
+                logger.error(f"合成第 {count + 1} 块失败: {e}")
+                continue
+            
+            audio = np.asarray(result["audio_data"]).reshape(-1)
+            if audio_out is None:
+                audio_out = sf.SoundFile(output_path, 'w', samplerate=result["sample_rate"],
+                                         channels=1, subtype='PCM_16')
+            elif silence_duration:
+                audio_out.write(np.zeros(int(silence_duration * audio_out.samplerate), dtype=np.int16))
+            audio_out.write(audio)
+            count += 1
+            if on_progress:
+                on_progress(count)
+    finally:
+        if audio_out is not None:
+            audio_out.close()
+        if text_out:
+            text_out.close()
+    
+    logger.info(f"文档合成完成，共 {count} 块: {output_path}")
+    return count > 0
+
 def synthesize_speech_for_task(text, voice_id, output_path, is_preset=False):
     """为课件任务合成语音，支持预置声音和用户声音"""
     try:
@@ -270,34 +390,15 @@ def synthesize_speech_for_task(text, voice_id, output_path, is_preset=False):
         db = SessionLocal()
         
         if is_preset:
-            # 对于预置声音，通过CosyVoiceHelper获取语音
-            from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-            cosyvoice_helper = CosyVoiceHelper()
-            
+            # 对于预置声音，通过CosyVoiceHelper获取语音（推理池启动时由工作进程执行）
             try:
                 # 直接使用CosyVoiceHelper的synthesize方法，它会根据文本长度自动选择合适的处理方式
                 logger.info(f"使用预置声音ID {voice_id} 合成文本: '{text[:30]}...'")
                 
-                # 获取预置声音列表
-                preset_voices = cosyvoice_helper.get_preset_voices()
-                
-                # 如果voice_id是数字或数字字符串，尝试将其映射到实际的声音名称
-                if isinstance(voice_id, (int, str)) and str(voice_id).isdigit():
-                    voice_idx = int(voice_id)
-                    if 0 < voice_idx <= len(preset_voices):
-                        voice_name = preset_voices[voice_idx - 1]
-                        logger.info(f"将数字ID {voice_id} 映射到预置声音: {voice_name}")
-                    else:
-                        if preset_voices:
-                            voice_name = preset_voices[0]
-                            logger.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {voice_name}")
-                        else:
-                            raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
-                else:
-                    voice_name = str(voice_id)
+                voice_name = resolve_task_preset_name(voice_id)
                 
                 # 直接使用synthesize方法，它能处理长文本并生成文件
-                cosyvoice_helper.synthesize(text, voice_name, output_path)
+                call_helper("synthesize", text, voice_name, output_path)
                 
                 # 检查文件是否成功写入
                 if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -319,6 +420,14 @@ def synthesize_speech_for_task(text, voice_id, output_path, is_preset=False):
         if 'db' in locals():
             db.close()
 
+def run_courseware_task(task_id, file_path, voice_id, is_preset):
+    """在后台任务执行器中处理课件，使用独立的数据库会话"""
+    db_session = SessionLocal()
+    try:
+        process_courseware_task(task_id, file_path, voice_id, is_preset, db_session)
+    finally:
+        db_session.close()
+
 def process_courseware_task(task_id, file_path, voice_id, is_preset, db_session):
     """后台处理课件任务"""
     try:
@@ -554,22 +663,25 @@ def process_courseware_task(task_id, file_path, voice_id, is_preset, db_session)
         elif file_ext in ['.docx', '.doc']:
             # DOC文件处理逻辑保持不变（保留原逻辑）
             # ...existing code...
-            extracted_text = extract_text_from_docx(file_path)
-            
-            if not extracted_text:
-                raise Exception("无法从文档中提取文本")
-            
-            # 保存提取的文本
-            text_file = os.path.join(task_dir, "extracted_text.txt")
-            with open(text_file, 'w', encoding='utf-8') as f:
-                f.write(extracted_text)
-            
-            # 合成语音
+            # 边解析文档边合成语音，提取的文本同时保存
             task_status[task_id]['progress'] = 30
             task_status[task_id]['message'] = '正在合成语音'
             
+            def report_progress(count):
+                task_status[task_id]['message'] = f'正在合成语音，已完成 {count} 段'
+            
+            text_file = os.path.join(task_dir, "extracted_text.txt")
             audio_file = os.path.join(task_dir, "narration.wav")
-            if not synthesize_speech_for_task(extracted_text, voice_id, audio_file, is_preset):
+            try:
+                synthesized = synthesize_document_for_task(
+                    iter_docx_paragraphs(file_path), voice_id, audio_file, is_preset,
+                    text_file=text_file, on_progress=report_progress
+                )
+            except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+                raise Exception(f"无法从文档中提取文本: {e}")
+            if not synthesized:
+                if os.path.exists(text_file) and os.path.getsize(text_file) == 0:
+                    raise Exception("无法从文档中提取文本")
                 raise Exception("语音合成失败")
             
             # 修改输出文件命名以及元数据
@@ -766,7 +878,6 @@ async def process_slides_to_video(slides_folder, audio_folder, output_path, slid
 
 @router.post("/courseware/process")
 async def process_courseware(
-    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_user),
     courseware: UploadFile = File(...),
     voice_id: str = Form(...),
@@ -795,19 +906,16 @@ async def process_courseware(
     elif transition_time > 3.0:
         transition_time = 3.0  # 设置最大过渡时间
     
-    # 检查CosyVoiceHelper是否可用
-    try:
-        from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-        helper = CosyVoiceHelper(lazy_load=True)  # 使用懒加载模式
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"无法初始化语音合成Helper: {str(e)}"
-        )
+    # 检查语音模型是否已加载并完成预热，否则返回503，避免首个任务承担模型加载开销
+    ensure_model_ready()
     
     try:
         print(f"Processing courseware: {courseware.filename}, voice_id: {voice_id}, is_preset: {is_preset}, animation_mode: {animation_mode}")
         
+        # 在保存文件和创建记录之前检查任务队列，队列已满时直接拒绝
+        job_executor = get_job_executor()
+        job_executor.check_capacity()
+        
         # 创建唯一任务ID
         task_id = str(uuid.uuid4())
         # 保存上传的文件（保留原始文件名）
@@ -820,7 +928,7 @@ async def process_courseware(
         # 验证声音ID
         try:
             voice_id_int = int(voice_id)
-            voice = db.query(models.Voice).filter(models.Voice.id == voice_id_int).first()
+            voice = voice_registry.get(voice_id_int)
             if not voice:
                 raise HTTPException(
                     status_code=404,
@@ -871,15 +979,20 @@ async def process_courseware(
             'transition_time': transition_time
         } 
         
-        # 传递 is_preset 参数给后台处理任务
-        background_tasks.add_task(
-            process_courseware_task, 
-            task_id, 
-            file_path, 
-            voice_id_int, 
-            is_preset,  # 添加此参数
-            db
-        )
+        # 传递 is_preset 参数给后台处理任务，课件处理在有界的任务执行器中进行
+        try:
+            job_executor.submit(
+                run_courseware_task,
+                task_id,
+                file_path,
+                voice_id_int,
+                is_preset  # 添加此参数
+            )
+        except ExecutorBusyError:
+            courseware_record.status = "failed"
+            db.commit()
+            task_status.pop(task_id, None)
+            raise
 
         # 记录课件合成日志
         synthesis_log = models.SynthesisLog(
@@ -917,6 +1030,9 @@ async def get_task_status(
 @router.get("/courseware/download/{task_id}")
 async def download_courseware(
     task_id: str,
+    request: Request,
+    output_format: Optional[str] = None,
+    bitrate: Optional[int] = None,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -933,6 +1049,11 @@ async def download_courseware(
             detail="找不到课件处理结果文件"
         )
     
+    # 指定output_format（wav / opus / mp3 / flac）时返回转码后的音频，视频只提取音轨
+    audio_format = None
+    if output_format:
+        audio_format, bitrate = parse_output_format(output_format, bitrate)
+    
     # 获取课件记录
     courseware = db.query(models.Courseware).filter(models.Courseware.task_id == task_id).first()
     # 验证权限 - 只有管理员或文件所有者可下载
@@ -957,8 +1078,12 @@ async def download_courseware(
         media_type = 'application/octet-stream'
         filename = f"课件_{original_filename}_{process_date}{file_ext}"
     
-    return FileResponse(
-        path=output_file,
-        media_type=media_type,
-        filename=filename
-    )
\ No newline at end of file
+    # 请求的格式与文件相同时按原文件返回
+    if audio_format is not None and audio_format.extension != file_ext:
+        return await file_audio_response(
+            request, output_file, audio_format, bitrate,
+            filename=f"课件音频_{original_filename}_{process_date}{audio_format.extension}"
+        )
+    
+    # 支持Range、ETag和条件GET，拖动进度和重复下载不再传输整个文件
+    return await file_download_response(request, output_file, media_type, filename)
\ No newline at end of file
@@ -1,26 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import os
-import io
-import wave
+import asyncio
 import numpy as np
-import scipy.io.wavfile as wav  # 添加scipy波形文件支持
 import time
 import sys
 from typing import Optional
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models import models
-from ..utils.security import oauth2_scheme, get_current_user
+from ..utils.security import oauth2_scheme, get_current_user, get_user_from_token
+from ..utils.text_splitter import IncrementalSentenceSplitter
+from ..inference_pool import call_helper, call_helper_async, get_inference_pool
+from ..voice_registry import voice_registry, VoiceDescriptor
+from ..utils.executor import get_inference_executor, ExecutorBusyError
+from ..utils.wav_stream import (
+    iter_wav_stream, iter_pcm_stream, to_pcm16
+)
+from ..utils.audio_encoders import parse_output_format, aiter_encoded, audio_response
+from ..warmup import ensure_model_ready
 
 # 设置路径
 COSYVOICE_PATH = os.path.expanduser('~/CosyVoice')
 MATCHA_TTS_PATH = os.path.join(COSYVOICE_PATH, 'third_party/Matcha-TTS')
 sys.path.extend([COSYVOICE_PATH, MATCHA_TTS_PATH])
 
-# 从cosyvoice_helper导入单例，不再直接初始化模型
-from cosyvoice.utils.file_utils import load_wav
-
 router = APIRouter()
 
 # 设置上传目录
@@ -131,6 +136,7 @@ async def upload_voice(
             db.add(db_voice)
             db.commit()
             db.refresh(db_voice)
+            voice_registry.upsert(db_voice)
             print(f"Voice record added to database with ID: {db_voice.id}")
         except Exception as e:
             print(f"Database error: {str(e)}")
@@ -171,29 +177,28 @@ async def synthesize_voice(
         form = await request.form()
         
         # 获取并验证voice_id
-        voice_id = form.get("voice_id")
-        if not voice_id:
+        voice_ref = form.get("voice_id")
+        if not voice_ref:
             raise HTTPException(
                 status_code=400,
                 detail="voice_id is required"
             )
-            
-        try:
-            voice_id = int(voice_id)
-        except ValueError:
-            # 尝试处理预置声音名称作为ID
-            preset_voices = db.query(models.Voice).filter(
-                models.Voice.name == voice_id,
-                models.Voice.is_preset == True
-            ).all()
-            
-            if preset_voices:
-                voice_id = preset_voices[0].id
-            else:
+        
+        # 模型未就绪时在解析声音之前返回503
+        ensure_model_ready()
+        # 从声音注册表解析，兼容预置声音名称作为ID
+        voice = voice_registry.resolve(voice_ref)
+        if not voice:
+            if not str(voice_ref).isdigit():
                 raise HTTPException(
                     status_code=400,
                     detail="Invalid voice_id format"
                 )
+            raise HTTPException(
+                status_code=404,
+                detail=f"Voice not found with id {voice_ref}"
+            )
+        voice_id = voice.id if voice.id is not None else voice.name
         
         target_text = form.get("target_text", "").strip()
         if not target_text:
@@ -202,166 +207,127 @@ async def synthesize_voice(
                 detail="target_text is required"
             )
 
-        print(f"Processing request - voice_id: {voice_id}, text length: {len(target_text)}")
-
-        # 获取声音
-        voice = db.query(models.Voice).filter(models.Voice.id == voice_id).first()
-        if not voice:
+        # 输出格式：wav（默认）/ opus / mp3 / flac，bitrate为码率(kbps)
+        bitrate = form.get("bitrate")
+        if bitrate is not None and not str(bitrate).isdigit():
             raise HTTPException(
-                status_code=404,
-                detail=f"Voice not found with id {voice_id}"
+                status_code=400,
+                detail="bitrate must be an integer (kbps)"
             )
+        output_format, bitrate = parse_output_format(
+            form.get("output_format"), int(bitrate) if bitrate is not None else None
+        )
+
+        print(f"Processing request - voice_id: {voice_id}, text length: {len(target_text)}, format: {output_format.name}")
 
+        headers = {
+            "Content-Disposition": f'attachment; filename="synthesized_{voice_id}{output_format.extension}"'
+        }
+        
         # 检查是否为预置声音
         if voice.is_preset:
-            # 使用CosyVoice模型的单例实例进行合成
-            from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-            cosyvoice_helper = CosyVoiceHelper()
-            result = cosyvoice_helper.synthesize_speech(target_text, voice.name, is_preset=True)
-            
-            # 确保音频数据是整数类型，防止因为float类型导致无声音
+            # 使用CosyVoice模型进行合成（推理池启动时由工作进程执行）
+            result = await call_helper_async("synthesize_speech", target_text, voice.speaker, is_preset=True)
             audio_data = result["audio_data"]
-            if audio_data.dtype != np.int16:
-                # 将浮点数据归一化到 [-32768, 32767] 范围然后转换为int16
-                if audio_data.max() <= 1.0 and audio_data.min() >= -1.0:
-                    audio_data = (audio_data * 32767).astype(np.int16)
-                else:
-                    audio_data = audio_data.astype(np.int16)
-            
-            # 创建WAV文件在内存中
-            buffer = io.BytesIO()
-            wav.write(buffer, result["sample_rate"], audio_data)
+            sample_rate = result["sample_rate"]
             
-            buffer.seek(0)
-            audio_duration = len(audio_data) / result["sample_rate"]
-
             # 记录语音合成日志
             synthesis_log = models.SynthesisLog(
                 type="voice",
                 user_id=current_user.id,
                 voice_id=None,
                 text_length=len(target_text),
-                duration=audio_duration
+                duration=len(audio_data) / sample_rate
             )
             db.add(synthesis_log)
             db.commit()
-
-            return StreamingResponse(
-                buffer,
-                media_type="audio/wav",
-                headers={
-                    "Content-Disposition": f'attachment; filename="synthesized_{voice_id}.wav"'
-                }
+            
+            # 音频分块转换为int16（或送入编码器）后直接输出
+            return audio_response(
+                audio_data, sample_rate, output_format, bitrate,
+                filename=f"synthesized_{voice_id}{output_format.extension}"
             )
         
         # 非预置声音，使用上传的音频文件
-        # 构建完整的音频文件路径
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-        audio_path = os.path.join(uploads_dir, voice.filename)
+        audio_path = voice.prompt_audio
         
         # 检查文件是否存在
-        if not os.path.exists(audio_path):
+        if not audio_path or not os.path.exists(audio_path):
             raise HTTPException(
                 status_code=404, 
                 detail=f"Voice file not found: {voice.filename}"
             )
         
-        # 使用CosyVoiceHelper而不是直接使用全局变量
-        from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
-        cosyvoice_helper = CosyVoiceHelper()
-        
-        # 加载音频
-        prompt_speech_16k = load_wav(audio_path, 16000)
+        # 提示音频由CosyVoiceHelper的特征缓存统一加载，这里不再重复读取
         
         # 分段合成处理长文本
         sentences = target_text.split('。')
         sentences = [s + '。' for s in sentences if s.strip()]
         
-        all_audio_data = []
-        sample_rate = 22050
-        
-        # 添加短暂的静音作为句子间隔
+        # 句子间隔的静音时长（秒）
         silence_duration = 0.2
-        silence_samples = int(silence_duration * sample_rate)
-        silence = np.zeros(silence_samples, dtype=np.int16)
+        stats = {"samples": 0, "sample_rate": None}
         
-        for i, sentence in enumerate(sentences):
-            if not sentence.strip():
-                continue
-                
-            print(f"Synthesizing sentence {i+1}/{len(sentences)}: {sentence}")
-            
-            try:
-                result = cosyvoice_helper.synthesize_speech(
-                    sentence, 
-                    voice_id, 
-                    is_preset=False,
-                    prompt_audio=audio_path,
-                    prompt_text=voice.transcript
-                )
-
-                # 获取音频数据并确保是int16类型
-                audio_array = result["audio_data"]
+        def synthesize_sentences():
+            """逐句合成，每句完成后立即输出，不在内存中拼接整段音频"""
+            for i, sentence in enumerate(sentences):
+                if not sentence.strip():
+                    continue
+                    
+                print(f"Synthesizing sentence {i+1}/{len(sentences)}: {sentence}")
                 
-                # 检查音频数据的类型和范围
-                print(f"Audio data type: {audio_array.dtype}, shape: {audio_array.shape}")
-                print(f"Audio range: min={audio_array.min()}, max={audio_array.max()}")
+                try:
+                    result = call_helper(
+                        "synthesize_speech",
+                        sentence, 
+                        voice_id, 
+                        is_preset=False,
+                        prompt_audio=audio_path,
+                        prompt_text=voice.prompt_text
+                    )
+                except Exception as e:
+                    print(f"Error synthesizing sentence {i+1}: {str(e)}")
+                    continue
                 
-                # 确保是整数类型，防止因为float类型导致无声音
-                if audio_array.dtype != np.int16:
-                    # 将浮点数据归一化到 [-32768, 32767] 范围然后转换为int16
-                    if audio_array.max() <= 1.0 and audio_array.min() >= -1.0:
-                        audio_array = (audio_array * 32767).astype(np.int16)
-                    else:
-                        audio_array = audio_array.astype(np.int16)
-                
-                if len(audio_array.shape) > 1:
-                    audio_array = audio_array.flatten()
-                all_audio_data.append(audio_array)
+                audio_array = np.asarray(result["audio_data"]).reshape(-1)
+                stats["sample_rate"] = result["sample_rate"]
+                stats["samples"] += len(audio_array)
+                yield audio_array
                 
                 if i < len(sentences) - 1:  # 不在最后一句后添加静音
-                    all_audio_data.append(silence)
-
-            except Exception as e:
-                print(f"Error synthesizing sentence {i+1}: {str(e)}")
-                continue
-
-        if not all_audio_data:
+                    silence = np.zeros(int(silence_duration * stats["sample_rate"]), dtype=np.int16)
+                    stats["samples"] += len(silence)
+                    yield silence
+        
+        # 所有句子在推理执行器的一个工作线程中依次合成，整个请求只做一次准入：
+        # 队列已满时在返回响应头之前拒绝，不会在音频流中途因排队失败而截断
+        audio_chunks = get_inference_executor().iterate(synthesize_sentences())
+        # 先合成第一句再开始响应，使参数错误等问题仍以正常的状态码返回
+        try:
+            first_chunk = await audio_chunks.__anext__()
+        except StopAsyncIteration:
             raise HTTPException(
                 status_code=500,
                 detail="No audio generated"
             )
-
-        print("Concatenating audio segments...")
-        combined_audio = np.concatenate(all_audio_data)
-        print(f"Combined audio shape: {combined_audio.shape}")
-        print(f"Combined audio type: {combined_audio.dtype}")
-        print(f"Combined audio range: min={combined_audio.min()}, max={combined_audio.max()}")
         
-        # 创建WAV文件在内存中
-        buffer = io.BytesIO()
-        wav.write(buffer, sample_rate, combined_audio)
+        async def stream_chunks():
+            try:
+                yield first_chunk
+                async for chunk in audio_chunks:
+                    yield chunk
+            finally:
+                # 客户端中途断开时通知工作线程停止合成，并同样记录已合成的部分
+                await audio_chunks.aclose()
+                await run_in_threadpool(
+                    _record_synthesis_log, current_user.id, voice_id, len(target_text),
+                    stats["samples"] / stats["sample_rate"]
+                )
         
-        buffer.seek(0)
-        audio_duration = len(combined_audio) / sample_rate
-
-        # 记录语音合成日志
-        synthesis_log = models.SynthesisLog(
-            type="voice",
-            user_id=current_user.id,
-            voice_id=voice_id,
-            text_length=len(target_text),
-            duration=audio_duration
-        )
-        db.add(synthesis_log)
-        db.commit()
-
         return StreamingResponse(
-            buffer,
-            media_type="audio/wav",
-            headers={
-                "Content-Disposition": f'attachment; filename="synthesized_{voice_id}.wav"'
-            }
+            aiter_encoded(output_format, stats["sample_rate"], stream_chunks(), bitrate),
+            media_type=output_format.media_type,
+            headers=headers
         )
 
     except HTTPException:
@@ -371,4 +337,279 @@ async def synthesize_voice(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to synthesize speech: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+def _record_synthesis_log(user_id: int, voice_id: Optional[int], text_length: int, duration: float):
+    """在请求会话之外记录语音合成日志（用于流式响应结束时）"""
+    db = SessionLocal()
+    try:
+        db.add(models.SynthesisLog(
+            type="voice",
+            user_id=user_id,
+            voice_id=voice_id,
+            text_length=text_length,
+            duration=duration
+        ))
+        db.commit()
+    except Exception as e:
+        print(f"记录合成日志失败: {str(e)}")
+    finally:
+        db.close()
+
+def _resolve_synthesis_voice(voice_id: str, user: models.User) -> VoiceDescriptor:
+    """
+    从声音注册表查找用于合成的声音并检查权限，兼容预置声音名称作为ID
+
+    模型未加载、预热完成时返回503
+    """
+    ensure_model_ready()
+    voice = voice_registry.resolve(voice_id)
+    if not voice:
+        raise HTTPException(status_code=404, detail=f"Voice not found with id {voice_id}")
+    
+    if not voice.is_preset and voice.user_id != user.id and not user.is_admin:
+        raise HTTPException(status_code=403, detail="没有权限使用此声音")
+    
+    if not voice.is_preset and not (voice.prompt_audio and os.path.exists(voice.prompt_audio)):
+        raise HTTPException(status_code=404, detail=f"Voice file not found: {voice.filename}")
+    
+    return voice
+
+async def _get_local_helper():
+    """获取当前进程内的模型实例（流式合成需要直接驱动模型，不经过推理进程池）"""
+    from ai_voice_server.cosyvoice_helper import CosyVoiceHelper
+    # 推理池模式下Web进程不加载模型，在这里加载会多占用一份模型内存并与工作进程争抢CPU
+    if get_inference_pool() is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="推理进程池模式下不支持流式合成，请使用 /api/synthesize"
+        )
+    # 模型尚未加载、预热完成时返回503
+    ensure_model_ready()
+    cosyvoice_helper = CosyVoiceHelper(lazy_load=True)
+    if not cosyvoice_helper.is_initialized:
+        await run_in_threadpool(cosyvoice_helper._initialize_model)
+    return cosyvoice_helper
+
+@router.post("/synthesize/stream")
+async def synthesize_voice_stream(
+    voice_id: str = Form(...),
+    target_text: str = Form(...),
+    output_format: str = Form("wav"),
+    bitrate: Optional[int] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    流式合成语音
+    
+    逐块调用模型的流式推理，音频一产生就以分块传输编码返回，
+    长文本的首包延迟不再取决于整段文本的合成时间。
+    
+    - voice_id: 声音ID或预置声音名称
+    - target_text: 要合成的文本
+    - output_format: wav（流式WAV头 + 16位PCM）、pcm（裸16位小端PCM），
+      或 opus / mp3 / flac（逐块增量编码）
+    - bitrate: opus / mp3 的码率(kbps)
+    """
+    target_text = target_text.strip()
+    if not target_text:
+        raise HTTPException(status_code=400, detail="target_text is required")
+    if output_format.strip().lower() == "pcm":
+        output_format = None
+    else:
+        output_format, bitrate = parse_output_format(output_format, bitrate)
+    
+    voice = _resolve_synthesis_voice(voice_id, current_user)
+    
+    cosyvoice_helper = await _get_local_helper()
+    sample_rate = cosyvoice_helper.sample_rate
+    
+    audio_chunks = cosyvoice_helper.synthesize_stream(
+        target_text,
+        voice.synthesis_voice_id,
+        is_preset=voice.is_preset,
+        prompt_audio=voice.prompt_audio,
+        prompt_text=voice.prompt_text
+    )
+    
+    user_id = current_user.id
+    log_voice_id = None if voice.is_preset else voice.id
+    
+    def counted_chunks():
+        total_samples = 0
+        for chunk in audio_chunks:
+            total_samples += len(chunk)
+            yield chunk
+        _record_synthesis_log(user_id, log_voice_id, len(target_text), total_samples / sample_rate)
+    
+    # 整个流在推理执行器的一个工作线程中驱动，队列已满时在返回响应头之前拒绝
+    if output_format is None:
+        body = get_inference_executor().iterate(iter_pcm_stream(counted_chunks()))
+        media_type = f"audio/L16;rate={sample_rate};channels=1"
+    elif output_format.codec is None:
+        body = get_inference_executor().iterate(iter_wav_stream(sample_rate, counted_chunks()))
+        media_type = "audio/wav"
+    else:
+        # 压缩格式：工作线程产生音频块，在事件循环中逐块送入编码器
+        body = aiter_encoded(
+            output_format, sample_rate, get_inference_executor().iterate(counted_chunks()), bitrate
+        )
+        media_type = output_format.media_type
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Sample-Rate": str(sample_rate)
+        }
+    )
+
+@router.websocket("/tts/ws")
+async def tts_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    增量文本语音合成会话
+    
+    客户端逐段推送文本，服务端按split_text的标点规则缓冲，每凑齐一个完整句子就立即
+    送入模型合成并返回音频帧，延迟上限为一个句子而不是整段话。声音和提示特征在整个
+    会话内保持不变。
+    
+    协议（文本帧为JSON，音频为二进制帧，16位小端单声道PCM）：
+    - 连接: /api/tts/ws?token=<访问令牌>
+    - 客户端 {"type": "start", "voice_id": "..."}  开始会话，服务端回复 ready（含采样率）
+    - 客户端 {"type": "text", "text": "..."}        推送文本片段
+    - 客户端 {"type": "flush"}                      立即合成缓冲区中的剩余文本
+    - 客户端 {"type": "end"}                        结束输入，合成完毕后服务端回复 done 并关闭
+    - 服务端对每个句子依次发送 sentence_start、若干音频帧、sentence_end
+    """
+    await websocket.accept()
+    
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db) if token else None
+        if user is None:
+            await websocket.send_json({"type": "error", "detail": "无效的凭证"})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        try:
+            message = await websocket.receive_json()
+        except WebSocketDisconnect:
+            return
+        if message.get("type") != "start" or not message.get("voice_id"):
+            await websocket.send_json({"type": "error", "detail": "会话需要以包含voice_id的start消息开始"})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        try:
+            voice = _resolve_synthesis_voice(str(message["voice_id"]), user)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        user_id = user.id
+        log_voice_id = None if voice.is_preset else voice.id
+    finally:
+        db.close()
+    
+    try:
+        cosyvoice_helper = await _get_local_helper()
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    sample_rate = cosyvoice_helper.sample_rate
+    await websocket.send_json({"type": "ready", "sample_rate": sample_rate, "format": "pcm_s16le"})
+    
+    splitter = IncrementalSentenceSplitter()
+    # 句子队列，None表示输入结束
+    sentences: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+    stats = {"sentences": 0, "characters": 0, "samples": 0}
+    
+    async def synthesis_worker():
+        """按顺序合成队列中的句子，模型推理在线程池中执行"""
+        while True:
+            sentence = await sentences.get()
+            if sentence is None:
+                return
+            
+            index = stats["sentences"]
+            await websocket.send_json({"type": "sentence_start", "index": index, "text": sentence})
+            audio_chunks = cosyvoice_helper.synthesize_stream(
+                sentence, voice.synthesis_voice_id,
+                is_preset=voice.is_preset,
+                prompt_audio=voice.prompt_audio,
+                prompt_text=voice.prompt_text
+            )
+            sentence_samples = 0
+            async for chunk in get_inference_executor().iterate(audio_chunks):
+                if len(chunk) == 0:
+                    continue
+                sentence_samples += len(chunk)
+                await websocket.send_bytes(to_pcm16(chunk).tobytes())
+            
+            stats["sentences"] += 1
+            stats["characters"] += len(sentence)
+            stats["samples"] += sentence_samples
+            await websocket.send_json({
+                "type": "sentence_end",
+                "index": index,
+                "duration": sentence_samples / sample_rate
+            })
+    
+    worker = asyncio.create_task(synthesis_worker())
+    try:
+        while True:
+            receive = asyncio.create_task(websocket.receive_json())
+            done, _ = await asyncio.wait({receive, worker}, return_when=asyncio.FIRST_COMPLETED)
+            if worker in done:
+                # 合成任务异常退出
+                receive.cancel()
+                worker.result()
+                break
+            
+            message = receive.result()
+            message_type = message.get("type")
+            if message_type == "text":
+                for sentence in splitter.feed(message.get("text", "")):
+                    await sentences.put(sentence)
+            elif message_type == "flush":
+                for sentence in splitter.flush():
+                    await sentences.put(sentence)
+            elif message_type == "end":
+                for sentence in splitter.flush():
+                    await sentences.put(sentence)
+                await sentences.put(None)
+                await worker
+                break
+            else:
+                await websocket.send_json({"type": "error", "detail": f"未知的消息类型: {message_type}"})
+        
+        duration = stats["samples"] / sample_rate
+        await websocket.send_json({"type": "done", "sentences": stats["sentences"], "duration": duration})
+        await websocket.close()
+    except WebSocketDisconnect:
+        print("TTS会话客户端已断开")
+    except ExecutorBusyError as e:
+        try:
+            await websocket.send_json({"type": "error", "detail": e.detail})
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except Exception:
+            pass
+    except Exception as e:
+        print(f"TTS会话出错: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass
+    finally:
+        if not worker.done():
+            worker.cancel()
+        if stats["sentences"]:
+            await run_in_threadpool(
+                _record_synthesis_log, user_id, log_voice_id,
+                stats["characters"], stats["samples"] / sample_rate
+            )
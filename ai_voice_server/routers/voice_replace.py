@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, status
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Request
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional, List
 import os
@@ -9,29 +9,30 @@ import logging
 import uuid
 import json
 import shutil
+from collections import deque
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..utils.security import oauth2_scheme, get_current_user
 from ..models import models
-from ..utils.audio_recognition import AudioRecognizer, convert_audio_to_wav, get_audio_duration
+from ..utils.audio_recognition import AudioRecognizer, convert_audio_to_wav
 from ..utils.text_splitter import (
     get_audio_from_video, 
     add_subtitles_to_video, 
     replace_audio_in_video,
     create_silent_audio,
-    convert_seconds_to_srt_time,
-    merge_audio_files_exact
+    convert_seconds_to_srt_time
 )
 
 # 导入必要的音频处理库
-import numpy as np
-import soundfile as sf
-try:
-    import librosa
-except ImportError:
-    librosa = None
+from ..utils.audio_encoders import parse_output_format
+from ..utils.http_files import file_download_response, file_audio_response
+from ..utils.audio_merge import SegmentBuffer, to_float32
+from ..utils.time_stretch import stretch_async, PendingAudio, TIME_STRETCH_MAX_PENDING
 
-from ..cosyvoice_helper import CosyVoiceHelper
+from ..inference_pool import call_helper
+from ..utils.executor import get_job_executor, ExecutorBusyError
+from ..voice_registry import voice_registry
+from ..warmup import ensure_model_ready
 
 # 初始化日志
 logger = logging.getLogger(__name__)
@@ -118,7 +119,6 @@ async def get_task_status(
 @router.post("/analyze/{task_id}")
 async def analyze_audio(
     task_id: str,
-    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_user)
 ):
     """分析视频中的音频并识别语音"""
@@ -136,19 +136,23 @@ async def analyze_audio(
         raise HTTPException(status_code=404, detail="视频文件不存在")
     
     # 更新任务状态
+    previous_status = dict(task_status[task_id])
     task_status[task_id]["status"] = "analyzing"
     task_status[task_id]["message"] = "正在提取音频并识别语音"
     task_status[task_id]["progress"] = 20
     
-    # 在后台执行音频分析
-    background_tasks.add_task(process_audio_analysis, task_id, video_path, current_user.id)
+    # 在后台任务执行器中执行音频分析，队列已满时恢复任务状态，客户端可稍后重试
+    try:
+        get_job_executor().submit(process_audio_analysis, task_id, video_path, current_user.id)
+    except ExecutorBusyError:
+        task_status[task_id] = previous_status
+        raise
     
     return {"message": "开始分析音频", "task_id": task_id}
 
 @router.post("/synthesize/{task_id}")
 async def synthesize_audio(
     task_id: str,
-    background_tasks: BackgroundTasks,
     voice_id: str = Form(...),
     is_preset: bool = Form(False),
     add_subtitles: bool = Form(True),
@@ -178,26 +182,21 @@ async def synthesize_audio(
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail="视频文件不存在")
     
+    # 检查语音模型是否已加载并完成预热
+    ensure_model_ready()
+    
     # 验证声音ID
     try:
         # 处理预设声音
         if is_preset:
-            # 验证预设声音是否存在
-            cosyvoice_helper = CosyVoiceHelper(lazy_load=True)
-            preset_voices = cosyvoice_helper.get_preset_voices()
-            
-            # 如果voice_id是数字，尝试作为索引使用
-            if voice_id.isdigit():
-                voice_idx = int(voice_id)
-                if voice_idx < 1 or voice_idx > len(preset_voices):
+            # 验证预设声音是否存在，数字作为序号，否则作为声音名称
+            if not voice_registry.resolve_preset(voice_id):
+                if voice_id.isdigit():
                     raise HTTPException(status_code=400, detail=f"预设声音索引无效: {voice_id}")
-            else:
-                # 否则作为声音名称使用
-                if voice_id not in preset_voices:
-                    raise HTTPException(status_code=400, detail=f"预设声音名称无效: {voice_id}")
+                raise HTTPException(status_code=400, detail=f"预设声音名称无效: {voice_id}")
         else:
             # 验证用户声音
-            voice = db.query(models.Voice).filter(models.Voice.id == voice_id).first()
+            voice = voice_registry.resolve(voice_id, is_preset=False)
             if not voice:
                 raise HTTPException(status_code=404, detail=f"声音ID不存在: {voice_id}")
             
@@ -208,6 +207,7 @@ async def synthesize_audio(
         raise HTTPException(status_code=400, detail="无效的声音ID格式")
     
     # 更新任务状态
+    previous_status = dict(task_status[task_id])
     task_status[task_id]["status"] = "synthesizing"
     task_status[task_id]["message"] = "开始合成新音频"
     task_status[task_id]["progress"] = 40
@@ -215,17 +215,32 @@ async def synthesize_audio(
     task_status[task_id]["is_preset"] = is_preset
     task_status[task_id]["add_subtitles"] = add_subtitles
     
-    # 在后台执行音频合成
-    background_tasks.add_task(process_audio_synthesis, task_id, voice_id, is_preset, add_subtitles, current_user.id, db)
+    # 在后台任务执行器中执行音频合成，队列已满时恢复任务状态，客户端可稍后重试
+    try:
+        get_job_executor().submit(run_audio_synthesis, task_id, voice_id, is_preset, add_subtitles, current_user.id)
+    except ExecutorBusyError:
+        task_status[task_id] = previous_status
+        raise
     
     return {"message": "开始合成音频", "task_id": task_id}
 
 @router.get("/download/{task_id}")
 async def download_result(
     task_id: str,
+    request: Request,
+    output_format: Optional[str] = None,
+    bitrate: Optional[int] = None,
     current_user: models.User = Depends(get_current_user)
 ):
-    """下载处理结果"""
+    """
+    下载处理结果
+
+    指定output_format（wav / opus / mp3 / flac）时只返回置换后的音轨，首次请求时转码并缓存
+    """
+    audio_format = None
+    if output_format:
+        audio_format, bitrate = parse_output_format(output_format, bitrate)
+    
     if task_id not in task_status:
         raise HTTPException(status_code=404, detail="任务不存在")
     
@@ -249,15 +264,16 @@ async def download_result(
     base_name = os.path.splitext(original_filename)[0]
     output_filename = f"{base_name}_replaced.mp4"
     
-    return FileResponse(
-        path=output_path, 
-        filename=output_filename,
-        media_type="video/mp4"
-    )
+    if audio_format is not None:
+        return await file_audio_response(request, output_path, audio_format, bitrate, filename=output_filename)
+    
+    # 支持Range、ETag和条件GET，拖动进度和重复下载不再传输整个文件
+    return await file_download_response(request, output_path, "video/mp4", output_filename)
 
 @router.get("/download-subtitles/{task_id}")
 async def download_subtitles(
     task_id: str,
+    request: Request,
     current_user: models.User = Depends(get_current_user)
 ):
     """下载字幕文件"""
@@ -305,12 +321,12 @@ async def download_subtitles(
         base_name = os.path.splitext(original_filename)[0]
         output_filename = f"{base_name}_subtitles.srt"
         
-        return FileResponse(
-            path=subtitles_path, 
-            filename=output_filename,
-            media_type="text/plain"
+        return await file_download_response(
+            request, subtitles_path, "text/plain; charset=utf-8", output_filename
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"下载字幕文件失败: {e}")
         raise HTTPException(status_code=500, detail=f"下载字幕文件失败: {str(e)}")
@@ -404,6 +420,14 @@ def process_audio_analysis(task_id: str, video_path: str, user_id: int):
         task_status[task_id]["message"] = f"处理失败: {str(e)}"
         task_status[task_id]["progress"] = 0
 
+def run_audio_synthesis(task_id: str, voice_id: str, is_preset: bool, add_subtitles: bool, user_id: int):
+    """在后台任务执行器中处理音频合成，使用独立的数据库会话"""
+    db = SessionLocal()
+    try:
+        process_audio_synthesis(task_id, voice_id, is_preset, add_subtitles, user_id, db)
+    finally:
+        db.close()
+
 def process_audio_synthesis(task_id: str, voice_id: str, is_preset: bool, add_subtitles: bool, user_id: int, db: Session):
     """后台处理音频合成"""
     task_dir = os.path.join(TEMP_DIR, task_id)
@@ -412,7 +436,6 @@ def process_audio_synthesis(task_id: str, voice_id: str, is_preset: bool, add_su
         task_data = task_status[task_id]
         video_path = task_data["video_path"]
         segments_file = os.path.join(task_dir, "segments.json")
-        audio_path = task_data.get("audio_path")
         
         # 确保segments.json文件存在
         if not os.path.exists(segments_file):
@@ -426,293 +449,137 @@ def process_audio_synthesis(task_id: str, voice_id: str, is_preset: bool, add_su
         task_status[task_id]["message"] = "正在初始化语音合成引擎"
         task_status[task_id]["progress"] = 45
         
-        cosyvoice_helper = CosyVoiceHelper()
-        
-        # 创建临时目录用于存储分段音频
+        # 片段写入内存缓冲区，超过内存预算时才写入该目录
         segments_audio_dir = os.path.join(task_dir, "segments_audio")
-        os.makedirs(segments_audio_dir, exist_ok=True)
-        
-        # 获取原始音频的采样率信息
-        sample_rate = 22050  # 默认采样率
-        if os.path.exists(audio_path):
-            try:
-                data, rate = sf.read(audio_path)
-                sample_rate = rate
-            except Exception as e:
-                logger.warning(f"读取原始音频采样率失败，使用默认值: {e}")
-        
-        # 初始化分段音频信息
-        segments_audio_info = []
-        processed_count = 0
-        total_segments = len(segments)
-        
-        # 逐段处理音频合成
-        task_status[task_id]["message"] = "正在分段合成音频"
-        task_status[task_id]["progress"] = 50
         
-        # 处理预置声音
+        # 按声音类型确定单个分段的合成方式
         if is_preset:
             logger.info(f"使用预置声音 {voice_id} 合成音频")
             
-            # 获取预置声音列表
-            preset_voices = cosyvoice_helper.get_preset_voices()
-            
-            # 如果voice_id是数字或数字字符串，尝试将其映射到实际的声音名称
-            if isinstance(voice_id, (int, str)) and str(voice_id).isdigit():
-                voice_idx = int(voice_id)
-                if 0 < voice_idx <= len(preset_voices):
-                    voice_name = preset_voices[voice_idx - 1]
-                    logger.info(f"将数字ID {voice_id} 映射到预置声音: {voice_name}")
-                else:
-                    if preset_voices:
-                        voice_name = preset_voices[0]
-                        logger.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {voice_name}")
-                    else:
-                        raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
+            # 如果voice_id是数字或数字字符串，将其映射到实际的声音名称
+            voice = voice_registry.resolve_preset(voice_id)
+            if voice is not None:
+                voice_name = voice.speaker
+                logger.info(f"预置声音 {voice_id} 解析为: {voice_name}")
+            elif str(voice_id).isdigit():
+                preset_voices = voice_registry.preset_names
+                if not preset_voices:
+                    raise ValueError(f"无效的预置声音索引 {voice_id}，且无可用的预置声音")
+                voice_name = preset_voices[0]
+                logger.warning(f"无效的预置声音索引 {voice_id}，使用默认声音: {voice_name}")
             else:
                 voice_name = str(voice_id)
             
-            # 遍历所有分段，为每个分段合成音频
-            for i, segment in enumerate(segments):
-                processed_count += 1
-                if processed_count % 5 == 0 or processed_count == total_segments:
-                    progress = 50 + int((processed_count / total_segments) * 20)
-                    task_status[task_id]["progress"] = progress
-                    task_status[task_id]["message"] = f"正在合成第 {processed_count}/{total_segments} 个片段"
-                
-                segment_text = segment["text"].strip()
-                if not segment_text:
-                    continue
-                
-                # 为分段创建输出文件路径
-                segment_audio_path = os.path.join(segments_audio_dir, f"segment_{i:04d}.wav")
-                
-                try:
-                    # 使用cosyvoice_helper合成音频
-                    result = cosyvoice_helper.synthesize(segment_text, voice_name, segment_audio_path)
-                    
-                    # 检查音频文件是否成功生成
-                    if os.path.exists(segment_audio_path) and os.path.getsize(segment_audio_path) > 0:
-                        # 获取合成的音频时长
-                        audio_duration = get_audio_duration(segment_audio_path)
-                        
-                        # 记录分段音频信息
-                        segments_audio_info.append({
-                            "index": i,
-                            "original_start": segment["start"],
-                            "original_end": segment["end"],
-                            "original_duration": segment["end"] - segment["start"],
-                            "synthesized_path": segment_audio_path,
-                            "synthesized_duration": audio_duration
-                        })
-                    else:
-                        logger.warning(f"分段 {i} 的音频文件未成功生成")
-                except Exception as e:
-                    logger.error(f"为分段 {i} 合成音频失败: {e}")
+            def synthesize_segment(text, target_duration):
+                # 按原始片段时长选择语速，直接返回音频数据（推理池启动时由工作进程执行）
+                return call_helper("synthesize_for_duration", text, voice_name, target_duration, is_preset=True)
         else:
             # 使用用户上传的声音
             logger.info(f"使用用户上传的声音 {voice_id} 合成音频")
             
-            # 获取声音信息
-            voice = db.query(models.Voice).filter(models.Voice.id == voice_id).first()
+            # 从声音注册表获取声音信息
+            voice = voice_registry.get(int(voice_id))
             if not voice:
                 raise ValueError(f"声音ID不存在: {voice_id}")
             
             # 获取音频文件路径
-            uploads_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
-            prompt_audio_path = os.path.join(uploads_dir, voice.filename)
+            prompt_audio_path = voice.prompt_audio
             
-            if not os.path.exists(prompt_audio_path):
+            if not prompt_audio_path or not os.path.exists(prompt_audio_path):
                 raise FileNotFoundError(f"提示音频文件不存在: {prompt_audio_path}")
             
             # 获取提示文本
-            prompt_text = voice.transcript or "这是一段示例语音。"
+            prompt_text = voice.prompt_text
             
-            # 遍历所有分段，为每个分段合成音频
-            for i, segment in enumerate(segments):
-                processed_count += 1
-                if processed_count % 5 == 0 or processed_count == total_segments:
-                    progress = 50 + int((processed_count / total_segments) * 20)
-                    task_status[task_id]["progress"] = progress
-                    task_status[task_id]["message"] = f"正在合成第 {processed_count}/{total_segments} 个片段"
-                
-                segment_text = segment["text"].strip()
-                if not segment_text:
-                    continue
-                
-                # 为分段创建输出文件路径
-                segment_audio_path = os.path.join(segments_audio_dir, f"segment_{i:04d}.wav")
-                
-                try:
-                    # 使用cosyvoice_helper合成音频
-                    result = cosyvoice_helper.synthesize_speech(
-                        segment_text,
-                        voice_id,
-                        is_preset=False,
-                        prompt_audio=prompt_audio_path,
-                        prompt_text=prompt_text
-                    )
-                    
-                    # 保存合成的音频
-                    audio_data = result["audio_data"]
-                    sample_rate = result["sample_rate"]
-                    
-                    # 确保音频数据类型正确
-                    if audio_data.dtype != np.int16:
-                        if np.issubdtype(audio_data.dtype, np.floating) and audio_data.max() <= 1.0 and audio_data.min() >= -1.0:
-                            audio_data = (audio_data * 32767).astype(np.int16)
-                        else:
-                            audio_data = audio_data.astype(np.int16)
-                    
-                    # 保存到WAV文件
-                    sf.write(segment_audio_path, audio_data, sample_rate)
-                    
-                    # 检查音频文件是否成功生成
-                    if os.path.exists(segment_audio_path) and os.path.getsize(segment_audio_path) > 0:
-                        # 获取合成的音频时长
-                        audio_duration = get_audio_duration(segment_audio_path)
-                        
-                        # 记录分段音频信息
-                        segments_audio_info.append({
-                            "index": i,
-                            "original_start": segment["start"],
-                            "original_end": segment["end"],
-                            "original_duration": segment["end"] - segment["start"],
-                            "synthesized_path": segment_audio_path,
-                            "synthesized_duration": audio_duration
-                        })
-                    else:
-                        logger.warning(f"分段 {i} 的音频文件未成功生成")
-                except Exception as e:
-                    logger.error(f"为分段 {i} 合成音频失败: {e}")
-        
-        # 检查是否有成功合成的音频
-        if not segments_audio_info:
-            raise Exception("没有成功合成的音频片段")
-        
-        # 调整音频时长以匹配原始音频时间
-        task_status[task_id]["message"] = "正在调整音频时间轴"
-        task_status[task_id]["progress"] = 70
-        
-        # 创建最终合成的音频文件路径
-        final_audio_path = os.path.join(task_dir, "synthesized_audio.wav")
-        
-        # 计算所有音频段的总持续时间
-        total_original_duration = sum(info["original_duration"] for info in segments_audio_info)
-        total_synthesized_duration = sum(info["synthesized_duration"] for info in segments_audio_info)
-        
-        logger.info(f"原始音频总时长: {total_original_duration:.2f}秒")
-        logger.info(f"合成音频总时长: {total_synthesized_duration:.2f}秒")
-        
-        # 根据原始时长调整音频
-        adjusted_segments = []
-        current_position = 0
-        
-        # 创建一个列表存储所有音频片段及其时间位置
-        aligned_segments = []
+            def synthesize_segment(text, target_duration):
+                return call_helper(
+                    "synthesize_for_duration",
+                    text,
+                    voice_id,
+                    target_duration,
+                    is_preset=False,
+                    prompt_audio=prompt_audio_path,
+                    prompt_text=prompt_text
+                )
+        
+        # 逐段按原始时长合成，合成结果直接在内存中调整时长、按原始时间轴对齐。
+        # 时长调整在进程池中与后续片段的合成并行，pending按时间轴顺序保存尚未写入合并缓冲区的片段
+        task_status[task_id]["message"] = "正在分段合成音频"
+        task_status[task_id]["progress"] = 50
         
-        for info in segments_audio_info:
-            original_start = info["original_start"]
-            original_duration = info["original_duration"]
-            synthesized_path = info["synthesized_path"]
+        segment_buffer = None
+        processed_count = 0
+        synthesized_count = 0
+        total_segments = len(segments)
+        total_original_duration = 0.0
+        total_synthesized_duration = 0.0
+        current_position = 0.0
+        pending = deque()
+        
+        for i, segment in enumerate(segments):
+            processed_count += 1
+            if processed_count % 5 == 0 or processed_count == total_segments:
+                progress = 50 + int((processed_count / total_segments) * 30)
+                task_status[task_id]["progress"] = progress
+                task_status[task_id]["message"] = f"正在合成第 {processed_count}/{total_segments} 个片段"
+            
+            segment_text = segment["text"].strip()
+            if not segment_text:
+                continue
+            
+            original_start = segment["start"]
+            original_duration = segment["end"] - segment["start"]
+            
+            try:
+                result = synthesize_segment(segment_text, original_duration)
+            except Exception as e:
+                logger.error(f"为分段 {i} 合成音频失败: {e}")
+                continue
+            
+            if not result or result.get("audio_data") is None or len(result["audio_data"]) == 0:
+                logger.warning(f"分段 {i} 的音频未成功生成")
+                continue
+            
+            # 静音和所有片段都使用模型输出的采样率
+            sample_rate = result["sample_rate"]
+            if segment_buffer is None:
+                segment_buffer = SegmentBuffer(segments_audio_dir, sample_rate)
+            audio_data = to_float32(result["audio_data"])
+            
+            synthesized_count += 1
+            total_original_duration += original_duration
+            total_synthesized_duration += len(audio_data) / sample_rate
             
             # 如果当前位置小于原始开始时间，添加一段静音
             if current_position < original_start:
-                silence_duration = original_start - current_position
-                silence_path = os.path.join(segments_audio_dir, f"silence_{len(aligned_segments):04d}.wav")
-                
-                # 创建静音文件
-                silent_data = create_silent_audio(silence_duration, sample_rate, silence_path)
-                
-                aligned_segments.append({
-                    "path": silence_path,
-                    "start": current_position,
-                    "duration": silence_duration,
-                    "end": original_start
-                })
-                
+                silence = create_silent_audio(original_start - current_position, sample_rate)
+                pending.append(PendingAudio(to_float32(silence)))
                 current_position = original_start
             
-            # 添加合成的音频段
-            try:
-                # 读取音频数据和采样率
-                audio_data, audio_sample_rate = sf.read(synthesized_path)
-                 
-                # 检查音频长度是否需要调整
-                audio_duration = len(audio_data) / audio_sample_rate
-                
-                # 根据原始时长调整音频
-                if abs(audio_duration - original_duration) > 0.1:  # 如果差异超过0.1秒
-                    # 检查是否可用librosa，否则跳过调整
-                    if librosa is None:
-                        logger.warning("librosa模块不可用，跳过音频时长调整")
-                        aligned_segments.append({
-                            "path": synthesized_path,
-                            "start": original_start,
-                            "duration": original_duration,
-                            "end": original_start + original_duration
-                        })
-                    else:
-                        # 将音频缩放到原始时长
-                        try:
-                            # 调整音频速度但保持音高
-                            y, sr = librosa.load(synthesized_path, sr=audio_sample_rate)
-                            y_adjusted = librosa.effects.time_stretch(y, rate=audio_duration/original_duration)
-                            
-                            # 保存调整后的音频
-                            adjusted_path = os.path.join(segments_audio_dir, f"adjusted_{len(aligned_segments):04d}.wav")
-                            sf.write(adjusted_path, y_adjusted, sr)
-                            
-                            aligned_segments.append({
-                                "path": adjusted_path,
-                                "start": original_start,
-                                "duration": original_duration,
-                                "end": original_start + original_duration
-                            })
-                        except Exception as e:
-                            logger.error(f"调整音频时长失败: {e}")
-                            # 使用原始音频
-                            aligned_segments.append({
-                                "path": synthesized_path,
-                                "start": original_start,
-                                "duration": original_duration,
-                                "end": original_start + original_duration
-                            })
-                else:
-                    # 不需要调整
-                    aligned_segments.append({
-                        "path": synthesized_path,
-                        "start": original_start,
-                        "duration": original_duration,
-                        "end": original_start + original_duration
-                    })
-                
-                current_position = original_start + original_duration
-                
-            except Exception as e:
-                logger.error(f"处理音频段失败: {e}")
-                # 如果处理失败，使用静音代替
-                silence_path = os.path.join(segments_audio_dir, f"error_silence_{len(aligned_segments):04d}.wav")
-                silent_data = create_silent_audio(original_duration, sample_rate, silence_path)
-                
-                aligned_segments.append({
-                    "path": silence_path,
-                    "start": original_start,
-                    "duration": original_duration,
-                    "end": original_start + original_duration
-                })
-                
-                current_position = original_start + original_duration
+            # 合成时已按原始时长选择语速，语速超出范围或仍有偏差的片段再调整时长
+            pending.append(stretch_async(audio_data, sample_rate, original_duration))
+            current_position = original_start + original_duration
+            while len(pending) > TIME_STRETCH_MAX_PENDING:
+                segment_buffer.append(pending.popleft().result())
+        
+        while pending:
+            segment_buffer.append(pending.popleft().result())
+        
+        # 检查是否有成功合成的音频
+        if not synthesized_count:
+            raise Exception("没有成功合成的音频片段")
+        
+        logger.info(f"原始音频总时长: {total_original_duration:.2f}秒")
+        logger.info(f"合成音频总时长: {total_synthesized_duration:.2f}秒")
         
         # 合并所有音频段
         task_status[task_id]["message"] = "正在合并音频片段"
         task_status[task_id]["progress"] = 80
         
-        # 准备要合并的音频文件列表
-        audio_files = [segment["path"] for segment in aligned_segments]
+        # 创建最终合成的音频文件路径
+        final_audio_path = os.path.join(task_dir, "synthesized_audio.wav")
         
-        # 直接合并音频文件，无需再导入merge_audio_files_exact
-        merge_result = merge_audio_files_exact(audio_files, final_audio_path, crossfade_duration=0.05)
+        merge_result = segment_buffer.merge(final_audio_path, crossfade_duration=0.05)
         
         if not os.path.exists(final_audio_path) or os.path.getsize(final_audio_path) == 0:
             raise Exception("合并音频失败，输出文件不存在或为空")
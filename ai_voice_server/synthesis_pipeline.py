@@ -0,0 +1,213 @@
+"""
+长文本流水线合成
+
+逐块合成时，每个文本块都要依次经过 文本前端 -> LLM生成语音token -> flow matching -> HiFT声码器，
+下一块的前端和LLM计算要等上一块的声码器完成后才开始。流水线把这些阶段拆到两个线程上：
+生产线程按顺序执行前端和LLM，主线程执行flow和声码器，二者通过有界队列衔接，
+使第N+1块的LLM计算与第N块的flow/声码器计算重叠。输出按原始块顺序重新组装。
+
+实现复用CosyVoice模型内部的 llm_job / token2wav（与其自带的流式模式相同的线程划分），
+不支持的CosyVoice版本由 LongTextPipeline.is_supported 检测，调用方回退到逐块合成。
+"""
+
+import os
+import uuid
+import queue
+import inspect
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Tuple, Union
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 是否对长文本使用流水线合成
+LONG_TEXT_PIPELINE = os.environ.get("LONG_TEXT_PIPELINE", "1") != "0"
+# LLM阶段最多领先声码器阶段的片段数
+PIPELINE_QUEUE_DEPTH = int(os.environ.get("PIPELINE_QUEUE_DEPTH", "2"))
+
+# 模型内部按uuid保存中间状态的字典
+_STATE_DICTS = ("tts_speech_token_dict", "llm_end_dict", "hift_cache_dict", "mel_overlap_dict", "flow_cache_dict")
+
+_END = object()
+
+
+class LongTextPipeline:
+    """
+    两阶段合成流水线
+
+    model 为CosyVoice/CosyVoice2实例。run() 接收 (键, 构造模型输入的函数) 列表，
+    构造函数在生产线程中执行（文本前端），返回该块各个规范化片段的模型输入。
+    """
+
+    def __init__(self, model, queue_depth: int = PIPELINE_QUEUE_DEPTH):
+        self.cosyvoice = model
+        self.model = model.model
+        self.queue_depth = max(1, queue_depth)
+
+        # 按当前CosyVoice版本的签名准备参数
+        self._tts_defaults = {
+            name: param.default
+            for name, param in inspect.signature(self.model.tts).parameters.items()
+            if param.default is not inspect.Parameter.empty
+        }
+        self._token2wav_params = inspect.signature(self.model.token2wav).parameters
+
+    @staticmethod
+    def is_supported(model) -> bool:
+        """检查模型是否提供流水线所需的内部接口"""
+        inner = getattr(model, "model", None)
+        if inner is None:
+            return False
+        required = ("llm_job", "token2wav", "tts", "tts_speech_token_dict", "llm_end_dict", "lock")
+        if not all(hasattr(inner, name) for name in required):
+            return False
+
+        params = inspect.signature(inner.token2wav).parameters
+        known = {"token", "prompt_token", "prompt_feat", "embedding", "token_offset", "uuid",
+                 "stream", "finalize", "speed"}
+        for name, param in params.items():
+            if name not in known and param.default is inspect.Parameter.empty:
+                return False
+        return True
+
+    def _tts_kwargs(self, model_input: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = dict(self._tts_defaults)
+        kwargs.update(model_input)
+        return kwargs
+
+    def _register(self) -> str:
+        """与model.tts相同，为一次合成初始化按uuid保存的中间状态"""
+        this_uuid = str(uuid.uuid1())
+        inner = self.model
+        with inner.lock:
+            inner.tts_speech_token_dict[this_uuid] = []
+            inner.llm_end_dict[this_uuid] = False
+            if hasattr(inner, "hift_cache_dict"):
+                inner.hift_cache_dict[this_uuid] = None
+            if hasattr(inner, "mel_overlap_dict"):
+                inner.mel_overlap_dict[this_uuid] = torch.zeros(1, 80, 0)
+            if hasattr(inner, "flow_cache_dict"):
+                if hasattr(inner, "init_flow_cache"):
+                    inner.flow_cache_dict[this_uuid] = inner.init_flow_cache()
+                else:
+                    inner.flow_cache_dict[this_uuid] = torch.zeros(1, 80, 0, 2)
+        return this_uuid
+
+    def _release(self, this_uuid: str) -> None:
+        inner = self.model
+        with inner.lock:
+            for name in _STATE_DICTS:
+                state = getattr(inner, name, None)
+                if state is not None:
+                    state.pop(this_uuid, None)
+
+    def _token2wav(self, kwargs: Dict[str, Any], this_uuid: str) -> np.ndarray:
+        token = torch.tensor(self.model.tts_speech_token_dict[this_uuid]).unsqueeze(dim=0)
+        candidates = {
+            "token": token,
+            "prompt_token": kwargs["flow_prompt_speech_token"],
+            "prompt_feat": kwargs["prompt_speech_feat"],
+            "embedding": kwargs["flow_embedding"],
+            "token_offset": 0,
+            "uuid": this_uuid,
+            "stream": False,
+            "finalize": True,
+            "speed": kwargs.get("speed", 1.0),
+        }
+        args = {name: value for name, value in candidates.items() if name in self._token2wav_params}
+        speech = self.model.token2wav(**args)
+        return speech.cpu().numpy().flatten()
+
+    def _produce(self, jobs: List[Tuple[Hashable, Callable[[], List[Dict[str, Any]]]]],
+                 out: "queue.Queue", stop: threading.Event) -> None:
+        """生产线程：按顺序执行文本前端和LLM，把语音token交给声码器阶段"""
+        try:
+            with torch.no_grad():
+                for key, build_inputs in jobs:
+                    if stop.is_set():
+                        break
+                    try:
+                        inputs = build_inputs()
+                        if not inputs:
+                            out.put(("empty", key, None, None, True))
+                            continue
+                        for i, model_input in enumerate(inputs):
+                            kwargs = self._tts_kwargs(model_input)
+                            this_uuid = self._register()
+                            try:
+                                self.model.llm_job(kwargs["text"], kwargs["prompt_text"],
+                                                   kwargs["llm_prompt_speech_token"], kwargs["llm_embedding"],
+                                                   this_uuid)
+                            except Exception:
+                                self._release(this_uuid)
+                                raise
+                            out.put(("segment", key, kwargs, this_uuid, i == len(inputs) - 1))
+                    except Exception as e:
+                        out.put(("error", key, e, None, True))
+        finally:
+            out.put(_END)
+
+    def run(self, jobs: List[Tuple[Hashable, Callable[[], List[Dict[str, Any]]]]]
+            ) -> Dict[Hashable, Union[np.ndarray, Exception]]:
+        """
+        执行流水线
+
+        返回:
+            键 -> 该块的音频（各片段按顺序拼接），失败的块对应异常对象
+        """
+        stage_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_depth)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(jobs, stage_queue, stop),
+                                    name="long-text-llm", daemon=True)
+        producer.start()
+
+        results: Dict[Hashable, Union[np.ndarray, Exception]] = {}
+        pieces: Dict[Hashable, List[np.ndarray]] = {}
+        try:
+            with torch.no_grad():
+                while True:
+                    item = stage_queue.get()
+                    if item is _END:
+                        break
+                    kind, key, payload, this_uuid, last = item
+
+                    if kind == "error":
+                        pieces.pop(key, None)
+                        results[key] = payload
+                        continue
+                    if kind == "empty":
+                        results[key] = np.zeros(0, dtype=np.float32)
+                        continue
+                    if isinstance(results.get(key), Exception):
+                        # 该块之前的片段已失败，丢弃剩余片段
+                        self._release(this_uuid)
+                        continue
+
+                    try:
+                        pieces.setdefault(key, []).append(self._token2wav(payload, this_uuid))
+                    except Exception as e:
+                        pieces.pop(key, None)
+                        results[key] = e
+                    finally:
+                        self._release(this_uuid)
+
+                    if last and key in pieces:
+                        results[key] = np.concatenate(pieces.pop(key))
+        finally:
+            # 异常退出时让生产线程尽快结束，并释放已生成但未消费的中间状态
+            stop.set()
+            while producer.is_alive() or not stage_queue.empty():
+                try:
+                    item = stage_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                if item[0] == "segment":
+                    self._release(item[3])
+            producer.join()
+
+        return results
@@ -0,0 +1,281 @@
+"""
+合成音频的内容寻址缓存（内存 + 磁盘两级）
+
+教师经常重复生成相同的课件和短语（如"第1页"、重复的幻灯片标题、修改后的课件），
+这里以 模型目录、模型类型、声音标识、规范化文本、随机种子 计算缓存键，
+命中时直接返回已合成的音频，避免再跑一遍 LLM + flow + HiFT。
+"""
+
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 磁盘缓存目录
+AUDIO_CACHE_DIR = os.environ.get(
+    "AUDIO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "audio")
+)
+# 内存层上限（MB）
+AUDIO_CACHE_MEMORY_MB = int(os.environ.get("AUDIO_CACHE_MEMORY_MB", "128"))
+# 磁盘层上限（MB），为0时关闭磁盘层
+AUDIO_CACHE_DISK_MB = int(os.environ.get("AUDIO_CACHE_DISK_MB", "2048"))
+# 是否启用合成音频缓存
+AUDIO_CACHE_ENABLED = os.environ.get("AUDIO_CACHE_ENABLED", "1") != "0"
+
+# 文件内容哈希缓存：(路径, 修改时间, 大小) -> sha256
+_file_digests: Dict[Tuple[str, float, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """规范化合成文本：去掉首尾空白并合并连续空白"""
+    return " ".join(text.split())
+
+
+def file_digest(path: str) -> str:
+    """计算文件内容的sha256，按路径+修改时间+大小缓存结果"""
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    with _file_digests_lock:
+        digest = _file_digests.get(cache_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    with _file_digests_lock:
+        _file_digests[cache_key] = digest
+    return digest
+
+
+class SynthesisCache:
+    """
+    两级合成音频缓存
+
+    内存层为按字节数限制的LRU；磁盘层以 <key>.npz 保存，按修改时间近似LRU淘汰，
+    命中时刷新修改时间。磁盘层命中的条目会被提升到内存层。
+    """
+
+    def __init__(self, cache_dir: str = AUDIO_CACHE_DIR,
+                 max_memory_bytes: int = AUDIO_CACHE_MEMORY_MB * 1024 * 1024,
+                 max_disk_bytes: int = AUDIO_CACHE_DISK_MB * 1024 * 1024,
+                 enabled: bool = AUDIO_CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        # 磁盘索引：key -> 文件大小，顺序即淘汰顺序
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled and self.max_disk_bytes > 0:
+            self._load_disk_index()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def _load_disk_index(self) -> None:
+        """启动时扫描磁盘缓存目录，按修改时间重建淘汰顺序"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        logger.info(f"合成音频磁盘缓存: {len(self._disk)} 个条目, {self._disk_bytes / 1024 / 1024:.1f}MB")
+
+    @staticmethod
+    def make_key(model_dir: str, model_type: Optional[str], voice: str, text: str, seed: int, **extra: Any) -> str:
+        """
+        计算缓存键
+
+        参数:
+            model_dir: 模型目录
+            model_type: 模型类型
+            voice: 声音标识（预置声音名称，或提示音频哈希加提示文本）
+            text: 合成文本，会先进行规范化
+            seed: 随机种子
+            extra: 其他影响输出的参数
+        """
+        parts = [str(model_dir), str(model_type), voice, normalize_text(text), str(seed)]
+        parts.extend(f"{k}={extra[k]}" for k in sorted(extra))
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int]]:
+        """查找缓存，返回 (音频数据副本, 采样率)，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0].copy(), entry[1]
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._disk_path(key)
+            try:
+                with np.load(path) as data:
+                    audio = data["audio"]
+                    sample_rate = int(data["sample_rate"])
+                os.utime(path)
+            except Exception as e:
+                logger.warning(f"读取磁盘缓存失败，忽略该条目: {e}")
+                self._drop_disk_entry(key)
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                self._put_memory(key, audio, sample_rate)
+                return audio.copy(), sample_rate
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio: np.ndarray, sample_rate: int) -> None:
+        """写入缓存（内存层和磁盘层）"""
+        if not self.enabled or audio is None or audio.size == 0:
+            return
+
+        audio = np.array(audio, copy=True)
+        self._put_memory(key, audio, sample_rate)
+        if self.max_disk_bytes > 0:
+            self._put_disk(key, audio, sample_rate)
+
+    def _put_memory(self, key: str, audio: np.ndarray, sample_rate: int) -> None:
+        nbytes = int(audio.nbytes)
+        if nbytes > self.max_memory_bytes:
+            return
+        audio.setflags(write=False)
+
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[0].nbytes
+            self._memory[key] = (audio, sample_rate)
+            self._memory_bytes += nbytes
+            while self._memory and self._memory_bytes > self.max_memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def _put_disk(self, key: str, audio: np.ndarray, sample_rate: int) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, audio=audio, sample_rate=np.int64(sample_rate))
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception as e:
+            logger.warning(f"写入磁盘缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        evicted_keys = []
+        with self._lock:
+            old_size = self._disk.pop(key, None)
+            if old_size is not None:
+                self._disk_bytes -= old_size
+            self._disk[key] = size
+            self._disk_bytes += size
+            while len(self._disk) > 1 and self._disk_bytes > self.max_disk_bytes:
+                evicted_key, evicted_size = self._disk.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                self.evictions += 1
+                evicted_keys.append(evicted_key)
+
+        for evicted_key in evicted_keys:
+            try:
+                os.remove(self._disk_path(evicted_key))
+            except OSError:
+                pass
+
+    def _drop_disk_entry(self, key: str) -> None:
+        with self._lock:
+            size = self._disk.pop(key, None)
+            if size is not None:
+                self._disk_bytes -= size
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """清空内存层和磁盘层"""
+        with self._lock:
+            keys = list(self._disk)
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._disk_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_synthesis_cache: Optional[SynthesisCache] = None
+_synthesis_cache_lock = threading.Lock()
+
+
+def get_synthesis_cache() -> SynthesisCache:
+    """获取进程内共享的合成音频缓存实例"""
+    global _synthesis_cache
+    if _synthesis_cache is None:
+        with _synthesis_cache_lock:
+            if _synthesis_cache is None:
+                _synthesis_cache = SynthesisCache()
+    return _synthesis_cache
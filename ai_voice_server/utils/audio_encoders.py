@@ -0,0 +1,331 @@
+"""
+压缩音频输出格式（Opus/Ogg、MP3、FLAC）
+
+16位WAV约2.6MB/分钟，对语音而言Opus 32kbps即可保持清晰，体积约为WAV的1/20。
+编码由ffmpeg子进程完成：16位PCM从stdin输入，编码结果从stdout边产生边输出，
+流式合成时每句音频合成后立即编码发送，不需要先生成完整文件再转码。
+课件、声音置换等结果文件按格式转码一次后缓存在源文件旁，之后按普通文件下载。
+"""
+
+import os
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+import subprocess
+from functools import lru_cache
+from urllib.parse import quote
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Dict, FrozenSet, Optional, Tuple
+
+import numpy as np
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .wav_stream import to_pcm16, aiter_wav_stream, iter_audio_blocks, iter_wav_stream, wav_size
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg可执行文件
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+# 编码输出每次读取的字节数
+ENCODER_READ_SIZE = 32 * 1024
+# 查询ffmpeg编码器列表的超时时间（秒）
+ENCODER_PROBE_TIMEOUT = 10
+# 转码整个结果文件的超时时间（秒）
+ENCODE_FILE_TIMEOUT = 1800
+# 结果文件转码缓存的子目录，位于源文件所在目录，随任务目录一起清理
+ENCODED_CACHE_SUBDIR = ".encoded"
+
+
+class AudioEncoderError(RuntimeError):
+    """ffmpeg编码失败；在流式响应中抛出时连接中断，客户端不会收到截断的音频"""
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """输出格式的编码参数"""
+    name: str
+    extension: str
+    media_type: str
+    codec: Optional[str] = None         # ffmpeg编码器，WAV为None（不经过ffmpeg）
+    container: Optional[str] = None     # ffmpeg输出容器格式
+    default_bitrate: Optional[int] = None  # 默认码率(kbps)，无损格式为None
+    bitrate_range: Tuple[int, int] = (0, 0)
+    sample_rates: Tuple[int, ...] = ()  # 编码器支持的采样率，为空表示不限
+
+
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    "wav": AudioFormat("wav", ".wav", "audio/wav"),
+    "opus": AudioFormat("opus", ".ogg", "audio/ogg", codec="libopus", container="ogg",
+                        default_bitrate=32, bitrate_range=(6, 256),
+                        sample_rates=(48000, 24000, 16000, 12000, 8000)),
+    "mp3": AudioFormat("mp3", ".mp3", "audio/mpeg", codec="libmp3lame", container="mp3",
+                       default_bitrate=64, bitrate_range=(8, 320)),
+    "flac": AudioFormat("flac", ".flac", "audio/flac", codec="flac", container="flac"),
+}
+
+
+@lru_cache(maxsize=1)
+def _available_encoders() -> Optional[FrozenSet[str]]:
+    """ffmpeg支持的编码器名称，ffmpeg不可用时返回None"""
+    if shutil.which(FFMPEG_BINARY) is None:
+        return None
+    try:
+        result = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-encoders"],
+                                capture_output=True, text=True, timeout=ENCODER_PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"查询ffmpeg编码器失败: {e}")
+        return None
+    # 列表在 " ------" 一行之后，每行为 " A....D libopus   说明"
+    lines = result.stdout.splitlines()
+    start = next((i + 1 for i, line in enumerate(lines) if line.strip().startswith("---")), len(lines))
+    return frozenset(line.split()[1] for line in lines[start:] if len(line.split()) > 1)
+
+
+def ensure_encoder_available(fmt: AudioFormat) -> None:
+    """
+    检查ffmpeg及格式所需的编码器是否可用，不可用时抛出503
+
+    在开始响应之前调用，避免响应头已发送后编码进程才失败、客户端收到200和截断的音频。
+    WAV格式需要ffmpeg从视频文件中提取音轨时也应调用（codec为None时只检查ffmpeg）。
+    """
+    encoders = _available_encoders()
+    if encoders is None:
+        raise HTTPException(status_code=503, detail=f"服务器未安装ffmpeg，无法输出 {fmt.name} 格式")
+    if fmt.codec is not None and fmt.codec not in encoders:
+        raise HTTPException(status_code=503, detail=f"服务器的ffmpeg不支持 {fmt.codec} 编码，无法输出 {fmt.name} 格式")
+
+
+def parse_output_format(output_format: Optional[str], bitrate: Optional[int] = None) -> Tuple[AudioFormat, Optional[int]]:
+    """
+    校验输出格式和码率
+
+    参数:
+        output_format: wav / opus / mp3 / flac，为空时为wav
+        bitrate: 码率(kbps)，为空时使用格式的默认码率；无损格式忽略
+
+    返回:
+        (格式, 码率)，参数无效时抛出400，编码器不可用时抛出503
+    """
+    name = (output_format or "wav").strip().lower()
+    if name == "ogg":
+        name = "opus"
+    fmt = AUDIO_FORMATS.get(name)
+    if fmt is None:
+        raise HTTPException(status_code=400,
+                            detail=f"不支持的输出格式: {output_format}，可选: {', '.join(AUDIO_FORMATS)}")
+    if fmt.codec is not None:
+        ensure_encoder_available(fmt)
+    if fmt.default_bitrate is None:
+        return fmt, None
+    if bitrate is None:
+        return fmt, fmt.default_bitrate
+    low, high = fmt.bitrate_range
+    if not low <= bitrate <= high:
+        raise HTTPException(status_code=400, detail=f"{fmt.name} 码率应在 {low}-{high} kbps 之间")
+    return fmt, bitrate
+
+
+def _encoder_args(fmt: AudioFormat, bitrate: Optional[int], sample_rate: int, output: str = "pipe:1") -> list:
+    if fmt.codec is None:
+        # 从视频中提取WAV音轨
+        return ["-vn", "-c:a", "pcm_s16le", "-f", "wav", output]
+    args = ["-vn", "-c:a", fmt.codec]
+    if bitrate is not None:
+        args += ["-b:a", f"{bitrate}k"]
+    if fmt.name == "opus":
+        # 针对语音优化
+        args += ["-application", "voip"]
+    if fmt.sample_rates and sample_rate not in fmt.sample_rates:
+        # Opus只支持固定的几种采样率，其他采样率重采样到48kHz
+        args += ["-ar", str(fmt.sample_rates[0])]
+    args += ["-f", fmt.container, output]
+    return args
+
+
+def pcm_encoder_command(fmt: AudioFormat, sample_rate: int, bitrate: Optional[int] = None,
+                        num_channels: int = 1) -> list:
+    """从stdin读取16位小端PCM、向stdout输出编码结果的ffmpeg命令"""
+    return [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", str(num_channels), "-i", "pipe:0",
+        *_encoder_args(fmt, bitrate, sample_rate),
+    ]
+
+
+def file_encoder_command(fmt: AudioFormat, input_path: str, bitrate: Optional[int] = None,
+                         output: str = "pipe:1") -> list:
+    """读取音频/视频文件的音轨、把编码结果写入output（默认stdout）的ffmpeg命令"""
+    return [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", input_path,
+        *_encoder_args(fmt, bitrate, 0, output),
+    ]
+
+
+async def _read_output(proc: asyncio.subprocess.Process) -> AsyncIterator[bytes]:
+    while True:
+        data = await proc.stdout.read(ENCODER_READ_SIZE)
+        if not data:
+            break
+        yield data
+
+
+async def _finish(proc: asyncio.subprocess.Process) -> None:
+    """等待编码进程结束，被提前中止（客户端断开）时终止进程"""
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    await proc.wait()
+
+
+async def aiter_encode_pcm(fmt: AudioFormat, sample_rate: int, chunks: AsyncIterable,
+                           bitrate: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    把异步产生的音频块增量编码为指定格式，编码结果边产生边输出
+
+    参数:
+        fmt: 输出格式（非WAV）
+        sample_rate: 输入音频的采样率
+        chunks: 音频块（numpy数组，浮点数据按[-1, 1]缩放）
+        bitrate: 码率(kbps)
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *pcm_encoder_command(fmt, sample_rate, bitrate),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                if chunk is None or len(chunk) == 0:
+                    continue
+                proc.stdin.write(to_pcm16(chunk.reshape(-1)).tobytes())
+                await proc.stdin.drain()
+        finally:
+            if not proc.stdin.is_closing():
+                proc.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    completed = False
+    try:
+        async for data in _read_output(proc):
+            yield data
+        await feeder
+        await proc.wait()
+        completed = True
+        if proc.returncode != 0:
+            error = (await proc.stderr.read()).decode(errors="ignore").strip()
+            logger.error(f"{fmt.name} 编码失败: {error}")
+            raise AudioEncoderError(f"{fmt.name} 编码失败 (exitcode={proc.returncode}): {error}")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if not completed:
+            await _finish(proc)
+
+
+_encode_locks: Dict[str, threading.Lock] = {}
+_encode_locks_guard = threading.Lock()
+
+
+def encoded_file_path(fmt: AudioFormat, input_path: str, bitrate: Optional[int] = None) -> str:
+    """结果文件转码缓存的路径，由(源文件, 大小, 修改时间, 格式, 码率)确定，源文件重新生成后路径随之改变"""
+    stat_result = os.stat(input_path)
+    key = f"{os.path.abspath(input_path)}|{stat_result.st_size}|{stat_result.st_mtime_ns}|{fmt.name}|{bitrate}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(os.path.dirname(input_path), ENCODED_CACHE_SUBDIR, f"{base}.{digest}{fmt.extension}")
+
+
+def encode_file(fmt: AudioFormat, input_path: str, bitrate: Optional[int] = None) -> str:
+    """
+    把音频/视频文件的音轨转码为指定格式并缓存
+
+    同一文件和格式只转码一次，并发请求等待同一次转码；转码失败时抛出AudioEncoderError。
+
+    返回:
+        转码结果的路径
+    """
+    output_path = encoded_file_path(fmt, input_path, bitrate)
+    with _encode_locks_guard:
+        lock = _encode_locks.setdefault(output_path, threading.Lock())
+    with lock:
+        if os.path.exists(output_path):
+            return output_path
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # 先写入临时文件，完成后再改名，下载不会读到未完成的文件
+        part_path = output_path + ".part"
+        try:
+            result = subprocess.run(file_encoder_command(fmt, input_path, bitrate, output=part_path),
+                                    capture_output=True, text=True, timeout=ENCODE_FILE_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise AudioEncoderError(f"{fmt.name} 编码失败: {e}") from e
+        if result.returncode != 0:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            error = result.stderr.strip()
+            logger.error(f"{fmt.name} 编码失败: {input_path}: {error}")
+            raise AudioEncoderError(f"{fmt.name} 编码失败 (exitcode={result.returncode}): {error}")
+        os.replace(part_path, output_path)
+        logger.info(f"已转码 {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+    return output_path
+
+
+def encoded_filename(basename: str, fmt: AudioFormat) -> str:
+    """下载文件名替换为输出格式的扩展名"""
+    return os.path.splitext(basename)[0] + fmt.extension
+
+
+def content_disposition(filename: str) -> str:
+    """附件下载头，中文文件名按RFC 5987编码（与FileResponse一致）"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+async def aiter_encoded(fmt: AudioFormat, sample_rate: int, chunks: AsyncIterable,
+                        bitrate: Optional[int] = None) -> AsyncIterator[bytes]:
+    """按输出格式输出异步产生的音频块：WAV直接输出流式WAV，其他格式经ffmpeg增量编码"""
+    if fmt.codec is None:
+        body = aiter_wav_stream(sample_rate, chunks)
+    else:
+        body = aiter_encode_pcm(fmt, sample_rate, chunks, bitrate)
+    async for data in body:
+        yield data
+
+
+async def aiter_encoded_audio(fmt: AudioFormat, sample_rate: int, audio: np.ndarray,
+                              bitrate: Optional[int] = None) -> AsyncIterator[bytes]:
+    """把整段音频分块编码为指定格式（非WAV）"""
+    async def blocks():
+        for block in iter_audio_blocks(audio):
+            yield block
+
+    async for data in aiter_encode_pcm(fmt, sample_rate, blocks(), bitrate):
+        yield data
+
+
+def audio_response(audio: np.ndarray, sample_rate: int, fmt: AudioFormat, bitrate: Optional[int] = None,
+                   filename: Optional[str] = None) -> StreamingResponse:
+    """
+    以指定格式流式返回整段音频
+
+    WAV总长度已知，文件头写入实际长度并带Content-Length；压缩格式分块送入编码器，
+    编码结果边产生边输出。
+    """
+    audio = np.asarray(audio).reshape(-1)
+    headers = {}
+    if filename:
+        headers["Content-Disposition"] = content_disposition(encoded_filename(filename, fmt))
+    if fmt.codec is None:
+        headers["Content-Length"] = str(wav_size(len(audio)))
+        body = iter_wav_stream(sample_rate, iter_audio_blocks(audio), total_samples=len(audio))
+    else:
+        body = aiter_encoded_audio(fmt, sample_rate, audio, bitrate)
+    return StreamingResponse(body, media_type=fmt.media_type, headers=headers)
@@ -0,0 +1,292 @@
+"""
+音频片段合并
+
+原先每合并一个片段就用np.concatenate重建整段结果，片段时间信息也在每次合并后逐个修正，
+片段数为n时两者都是O(n²)，声音置换的几百个片段主要耗时都在这里。
+
+这里先根据各片段长度一次算出每个片段在输出中的位置，只分配一次输出缓冲区，
+交叉淡入淡出在缓冲区上原地按向量计算，时间信息一次遍历得到。
+运算顺序与原实现相同，输出的采样值逐位一致。
+
+输出超过MERGE_MEMORY_BUDGET时改用流式合并（merge_files_streaming）：只读取文件头确定各片段位置，
+输入逐块读取、输出逐块写入，内存中只保留交叉淡化窗口，一个半小时的配音也不需要整段放入内存。
+
+SegmentBuffer供逐段生成音频的流程（如声音置换）直接在内存中收集片段再合并，
+不必每段先写成WAV再读回；超过预算后才把片段写入临时目录，按流式合并处理。
+"""
+
+import os
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+# 合并结果（float64）超过该字节数时使用流式合并
+MERGE_MEMORY_BUDGET = int(os.environ.get("MERGE_MEMORY_BUDGET_MB", "256")) * 1024 * 1024
+# 流式合并时每次读写的采样点数
+MERGE_BLOCK_SAMPLES = 64 * 1024
+
+
+@lru_cache(maxsize=8)
+def _fade_curves(crossfade_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+    """淡出、淡入权重（只读）"""
+    fade_out = np.linspace(1, 0, crossfade_samples)
+    fade_in = np.linspace(0, 1, crossfade_samples)
+    fade_out.setflags(write=False)
+    fade_in.setflags(write=False)
+    return fade_out, fade_in
+
+
+def plan_merge(lengths: Sequence[int], crossfade_samples: int) -> Tuple[List[int], List[int], int]:
+    """
+    计算各片段在合并结果中的起始采样点
+
+    相邻片段重叠crossfade_samples个采样点；片段（或已合并部分）短于交叉淡化长度时，
+    重叠长度缩短为两者中较短的一方。
+
+    返回:
+        (各片段的起始采样点, 各片段与前一片段的重叠采样点数（第一个为0）, 总采样点数)
+    """
+    offsets, overlaps = [], []
+    total = 0
+    for i, length in enumerate(lengths):
+        overlap = 0 if i == 0 else max(0, min(crossfade_samples, total, length))
+        offsets.append(total - overlap)
+        overlaps.append(overlap)
+        total = total - overlap + length
+    return offsets, overlaps, total
+
+
+def crossfade_into(out: np.ndarray, offset: int, segment: np.ndarray, overlap: int) -> None:
+    """
+    把segment写入out[offset:]，前overlap个采样点与out中已有内容交叉淡化
+
+    与原实现相同：已有内容乘以淡出权重，再加上乘以淡入权重的新片段
+    """
+    if overlap:
+        fade_out, fade_in = _fade_curves(overlap)
+        if segment.ndim > 1:
+            fade_out, fade_in = fade_out[:, None], fade_in[:, None]
+        region = out[offset:offset + overlap]
+        region *= fade_out
+        region += segment[:overlap] * fade_in
+    out[offset + overlap:offset + len(segment)] = segment[overlap:]
+
+
+def check_channels(segments: Sequence[np.ndarray]) -> None:
+    shapes = {segment.shape[1:] for segment in segments}
+    if len(shapes) > 1:
+        raise ValueError(f"声道数不一致: {sorted(shapes)}")
+
+
+def merge_segments(segments: Sequence[np.ndarray], crossfade_samples: int) -> Tuple[np.ndarray, List[int]]:
+    """
+    合并音频片段，相邻片段交叉淡化
+
+    返回:
+        (合并后的音频, 各片段与前一片段的重叠采样点数)
+    """
+    if not segments:
+        return np.zeros(0), []
+    check_channels(segments)
+    offsets, overlaps, total = plan_merge([len(segment) for segment in segments], crossfade_samples)
+    dtype = np.result_type(*segments, np.float64)
+    out = np.empty((total,) + segments[0].shape[1:], dtype=dtype)
+    for segment, offset, overlap in zip(segments, offsets, overlaps):
+        crossfade_into(out, offset, segment, overlap)
+    return out, overlaps
+
+
+def segment_timing(files: Sequence[str], durations: Sequence[float], overlaps: Sequence[int],
+                   crossfade_duration: float, sample_rate: int) -> List[Dict[str, Any]]:
+    """
+    一次遍历计算各片段在合并音频中的时间信息
+
+    沿用merge_audio_files_exact原有的计算方式：每个片段的位置先按前面片段的时长减去重叠累计，
+    之后每次合并再把后续片段整体提前一个交叉淡化时长，因此第j个片段共提前 2×(j-1) 个交叉淡化时长。
+    重叠被缩短的片段按实际重叠时长计算。
+    """
+    crossfade_samples = int(crossfade_duration * sample_rate)
+    info = []
+    position = 0.0   # 按时长累计的位置
+    shift = 0.0      # 合并时累计的提前量
+    for audio_file, duration, overlap in zip(files, durations, overlaps):
+        start = position - shift
+        info.append({
+            'file': audio_file,
+            'start': start,
+            'duration': duration,
+            'end': start + duration
+        })
+        # 第一个片段完整计算，之后的片段扣除与前一片段的重叠
+        fade = crossfade_duration if overlap == crossfade_samples else overlap / sample_rate
+        position += duration - fade
+        shift += fade
+    return info
+
+
+def read_audio_info(audio_files: Sequence[str]) -> Tuple[int, int, List[int]]:
+    """
+    只读取文件头，返回(采样率, 声道数, 各文件的采样点数)
+
+    采样率或声道数不一致时抛出ValueError
+    """
+    sample_rate = channels = None
+    lengths = []
+    for audio_file in audio_files:
+        info = sf.info(audio_file)
+        if sample_rate is None:
+            sample_rate, channels = info.samplerate, info.channels
+        elif info.samplerate != sample_rate:
+            raise ValueError(f"采样率不匹配: {info.samplerate} != {sample_rate}")
+        elif info.channels != channels:
+            raise ValueError(f"声道数不一致: {info.channels} != {channels}")
+        lengths.append(info.frames)
+    return sample_rate, channels, lengths
+
+
+def exceeds_memory_budget(total_samples: int, channels: int, budget: int = MERGE_MEMORY_BUDGET) -> bool:
+    """合并结果按float64保存在内存中是否超过预算"""
+    return total_samples * channels * 8 > budget
+
+
+def merge_files_streaming(audio_files: Sequence[str], output_path: str, crossfade_samples: int,
+                          block_samples: int = MERGE_BLOCK_SAMPLES) -> Tuple[int, List[int], List[int]]:
+    """
+    流式合并音频文件，与merge_segments的结果逐位一致
+
+    已合并但可能与下一个片段交叉淡化的末尾采样点暂不写出，其余部分逐块写入输出文件，
+    内存中只有一个读取块和一个交叉淡化窗口。
+
+    返回:
+        (采样率, 各文件的采样点数, 各片段与前一片段的重叠采样点数)
+    """
+    sample_rate, channels, lengths = read_audio_info(audio_files)
+    _, overlaps, _ = plan_merge(lengths, crossfade_samples)
+    # 第i个片段合并后需要保留的末尾采样点数：之后的片段交叉淡化时会修改的部分。
+    # 通常等于与下一个片段的重叠；下一个片段很短时，再下一个片段的重叠可能延伸到更前面
+    holds = [0] * len(lengths)
+    for i in range(len(lengths) - 2, -1, -1):
+        added = lengths[i + 1] - overlaps[i + 1]
+        holds[i] = max(overlaps[i + 1], holds[i + 1] - added)
+    always_2d = channels > 1
+
+    # 尚未写出的合并结果末尾
+    pending = np.zeros((0, channels) if always_2d else 0, dtype=np.float64)
+    with sf.SoundFile(output_path, 'w', samplerate=sample_rate, channels=channels) as out:
+        for audio_file, length, overlap, hold in zip(audio_files, lengths, overlaps, holds):
+            with sf.SoundFile(audio_file) as source:
+                if overlap:
+                    head = source.read(overlap, dtype='float64', always_2d=always_2d)
+                    crossfade_into(pending, len(pending) - overlap, head, overlap)
+                remaining = length - overlap
+                while remaining > 0:
+                    block = source.read(min(block_samples, remaining), dtype='float64', always_2d=always_2d)
+                    if len(block) == 0:
+                        break
+                    remaining -= len(block)
+                    pending = np.concatenate([pending, block])
+                    # 本片段之后的采样点不足以填满下一次重叠时，保留末尾部分
+                    keep = max(0, hold - remaining)
+                    if len(pending) > keep:
+                        out.write(pending[:len(pending) - keep])
+                        pending = pending[len(pending) - keep:].copy()
+        if len(pending):
+            out.write(pending)
+    return sample_rate, lengths, overlaps
+
+
+def to_float32(audio: np.ndarray) -> np.ndarray:
+    """
+    转换为[-1, 1]范围的float32采样
+
+    整数采样按位宽缩放（与soundfile读取PCM文件的结果一致），浮点采样截断到[-1, 1]
+    """
+    audio = np.asarray(audio)
+    if np.issubdtype(audio.dtype, np.integer):
+        return audio.astype(np.float32) / np.float32(-np.iinfo(audio.dtype).min)
+    return np.clip(audio, -1.0, 1.0).astype(np.float32, copy=False)
+
+
+class SegmentBuffer:
+    """
+    按顺序收集待合并的音频片段
+
+    片段以float32保存在内存中，总大小超过budget后全部写入spill_dir（FLOAT格式，不损失精度），
+    之后的片段直接写入文件。merge的结果与先写文件再调用merge_audio_files_exact相同。
+    """
+
+    def __init__(self, spill_dir: str, sample_rate: int, budget: int = MERGE_MEMORY_BUDGET):
+        self.spill_dir = spill_dir
+        self.sample_rate = sample_rate
+        self.budget = budget
+        self.lengths: List[int] = []
+        self._segments: List[np.ndarray] = []
+        self._files: List[str] = []
+        self._nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self._files)
+
+    def append(self, audio: np.ndarray) -> None:
+        """添加一个片段（float32，采样率为sample_rate）"""
+        self.lengths.append(len(audio))
+        if not self._files and self._nbytes + audio.nbytes <= self.budget:
+            self._segments.append(audio)
+            self._nbytes += audio.nbytes
+            return
+        if not self._files:
+            logger.info(f"待合并片段超过内存预算 {self.budget // (1024 * 1024)}MB，写入 {self.spill_dir}")
+        self._spill_all()
+        self._spill(audio)
+
+    def _spill(self, audio: np.ndarray) -> None:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"segment_{len(self._files):04d}.wav")
+        sf.write(path, audio, self.sample_rate, subtype="FLOAT")
+        self._files.append(path)
+
+    def _spill_all(self) -> None:
+        for segment in self._segments:
+            self._spill(segment)
+        self._segments, self._nbytes = [], 0
+
+    def merge(self, output_path: str, crossfade_duration: float = 0.05) -> Dict[str, Any]:
+        """
+        合并所有片段并写入output_path
+
+        返回:
+            与merge_audio_files_exact相同格式的时间信息，内存中片段的'file'为None
+        """
+        if not self.lengths:
+            return {'path': None, 'duration': 0, 'segments': []}
+        crossfade_samples = int(crossfade_duration * self.sample_rate)
+        if not self._files:
+            channels = self._segments[0].shape[1] if self._segments[0].ndim > 1 else 1
+            if exceeds_memory_budget(plan_merge(self.lengths, crossfade_samples)[2], channels):
+                self._spill_all()
+
+        if self._files:
+            _, _, overlaps = merge_files_streaming(self._files, output_path, crossfade_samples)
+            files = list(self._files)
+        else:
+            result, overlaps = merge_segments(self._segments, crossfade_samples)
+            sf.write(output_path, result, self.sample_rate)
+            files = [None] * len(self._segments)
+
+        durations = [length / self.sample_rate for length in self.lengths]
+        total_duration = plan_merge(self.lengths, crossfade_samples)[2] / self.sample_rate
+        logger.info(f"已合并 {len(self.lengths)} 个音频片段到 {output_path}，总时长: {total_duration:.2f}秒")
+        return {
+            'path': output_path,
+            'duration': total_duration,
+            'segments': segment_timing(files, durations, overlaps, crossfade_duration, self.sample_rate)
+        }
@@ -0,0 +1,139 @@
+"""
+音频/视频文件的时长、采样率等元数据
+
+原先获取时长时用sf.read解码整个文件再除以采样率，几十分钟的音轨要解码数百MB数据。
+这里只读取文件头：音频文件用sf.info，libsndfile不支持的格式（视频、AAC等）用ffprobe。
+结果按(路径, 大小, 修改时间)缓存，文件被重新生成后自动重新读取。
+"""
+
+import os
+import json
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+# ffprobe可执行文件
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+# ffprobe超时时间（秒）
+FFPROBE_TIMEOUT = 30
+# 最多缓存的文件数
+AUDIO_METADATA_CACHE_SIZE = int(os.environ.get("AUDIO_METADATA_CACHE_SIZE", "1024"))
+
+
+@dataclass(frozen=True)
+class AudioMetadata:
+    """音频流信息"""
+    duration: float
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    frames: Optional[int] = None        # 采样点数，ffprobe读取时可能未知
+    format: Optional[str] = None        # 容器格式，如 WAV / FLAC / mov,mp4,m4a,3gp,3g2,mj2
+
+
+_metadata_cache: "OrderedDict[str, Tuple[int, int, AudioMetadata]]" = OrderedDict()
+_metadata_lock = threading.Lock()
+
+
+def _read_soundfile_info(path: str) -> AudioMetadata:
+    info = sf.info(path)
+    return AudioMetadata(
+        duration=info.frames / info.samplerate if info.samplerate else 0.0,
+        sample_rate=info.samplerate,
+        channels=info.channels,
+        frames=info.frames,
+        format=info.format
+    )
+
+
+def _read_ffprobe_info(path: str) -> AudioMetadata:
+    result = subprocess.run(
+        [FFPROBE_BINARY, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, text=True, timeout=FFPROBE_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise ValueError(result.stderr.strip() or f"ffprobe退出码 {result.returncode}")
+    probe = json.loads(result.stdout)
+    streams = probe.get("streams", [])
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    # 没有音频流时按视频流或容器的时长计算
+    stream = audio or next((s for s in streams if s.get("codec_type") == "video"), None) or {}
+    duration = stream.get("duration") or probe.get("format", {}).get("duration") or 0
+    sample_rate = channels = frames = None
+    if audio:
+        sample_rate = int(audio["sample_rate"]) if audio.get("sample_rate") else None
+        channels = int(audio["channels"]) if audio.get("channels") else None
+        # 时间基为1/采样率时duration_ts即采样点数
+        if audio.get("duration_ts") and sample_rate and audio.get("time_base") == f"1/{sample_rate}":
+            frames = int(audio["duration_ts"])
+    return AudioMetadata(
+        duration=float(duration),
+        sample_rate=sample_rate,
+        channels=channels,
+        frames=frames,
+        format=probe.get("format", {}).get("format_name")
+    )
+
+
+def probe_audio(path: str) -> AudioMetadata:
+    """
+    读取文件头获取元数据
+
+    参数:
+        path: 音频或视频文件路径
+
+    返回:
+        AudioMetadata；文件无法识别时抛出ValueError，文件不存在时抛出OSError
+    """
+    stat_result = os.stat(path)
+    key = os.path.abspath(path)
+    with _metadata_lock:
+        cached = _metadata_cache.get(key)
+        if cached and cached[0] == stat_result.st_size and cached[1] == stat_result.st_mtime_ns:
+            _metadata_cache.move_to_end(key)
+            return cached[2]
+
+    try:
+        metadata = _read_soundfile_info(path)
+    except Exception as sf_error:
+        try:
+            metadata = _read_ffprobe_info(path)
+        except Exception as e:
+            raise ValueError(f"无法读取音频信息 {os.path.basename(path)}: {sf_error}; ffprobe: {e}") from e
+
+    with _metadata_lock:
+        _metadata_cache[key] = (stat_result.st_size, stat_result.st_mtime_ns, metadata)
+        _metadata_cache.move_to_end(key)
+        while len(_metadata_cache) > AUDIO_METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return metadata
+
+
+def get_audio_duration(path: str) -> float:
+    """
+    获取音频/视频文件的时长（秒），失败时返回0
+    """
+    try:
+        duration = probe_audio(path).duration
+        logger.debug(f"文件 {os.path.basename(path)} 时长: {duration:.2f}秒")
+        return duration
+    except Exception as e:
+        logger.error(f"获取文件时长失败: {str(e)}")
+        return 0.0
+
+
+def get_sample_rate(path: str, default: Optional[int] = None) -> Optional[int]:
+    """
+    获取音频文件的采样率，失败或没有音频流时返回default
+    """
+    try:
+        return probe_audio(path).sample_rate or default
+    except Exception as e:
+        logger.warning(f"获取采样率失败: {str(e)}")
+        return default
@@ -11,16 +11,17 @@ import tempfile
 from typing import List, Dict, Any, Optional, Tuple, Union
 
 import numpy as np
-import ffmpeg
+
+from .lazy_import import lazy_import, is_available
+from .audio_metadata import get_audio_duration
 
 logger = logging.getLogger(__name__)
 
-# 检查是否安装了whisper
-try:
-    import whisper
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
+# 检查是否安装了whisper；whisper会连带导入torch，首次加载模型时才真正导入
+WHISPER_AVAILABLE = is_available("whisper")
+if WHISPER_AVAILABLE:
+    whisper = lazy_import("whisper")
+else:
     logger.warning("未安装whisper模块，语音识别功能将不可用")
 
 class AudioRecognizer:
@@ -164,35 +165,3 @@ def convert_audio_to_wav(audio_path: str, output_path: Optional[str] = None) ->
     except Exception as e:
         logger.error(f"转换音频过程中发生错误: {str(e)}")
         raise
-
-def get_audio_duration(file_path: str) -> float:
-    """
-    获取音频/视频文件的时长（秒）
-    
-    参数:
-        file_path: 文件路径
-    
-    返回:
-        文件时长（秒）
-    """
-    try:
-        # 首先尝试使用sf.read获取音频时长
-        try:
-            import soundfile as sf
-            data, sample_rate = sf.read(file_path)
-            duration = len(data) / sample_rate
-            logger.debug(f"音频文件 {os.path.basename(file_path)} 时长: {duration:.2f}秒")
-            return duration
-        except Exception:
-            # 如果失败，尝试使用ffmpeg
-            probe = ffmpeg.probe(file_path)
-            # 获取音频或视频流
-            stream = next((stream for stream in probe['streams'] if stream['codec_type'] in ['audio', 'video']), None)
-            if stream:
-                duration = float(stream.get('duration', 0))
-                logger.debug(f"文件 {os.path.basename(file_path)} 时长: {duration:.2f}秒")
-                return duration
-        return 0
-    except Exception as e:
-        logger.error(f"获取文件时长失败: {str(e)}")
-        return 0
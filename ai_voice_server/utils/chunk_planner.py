@@ -0,0 +1,206 @@
+"""
+按模型文本token规划合成分块
+
+原先固定按70个字符分块：字符数与模型的计算量并不对应，一个汉字约为1个token，
+一个英文单词只占若干个字符却可能是1个token，中英混合文本的分块大小很不均匀，模型调用次数偏多。
+
+ChunkPlanner用模型自身的分词器计算长度，并根据实测的“分块长度-耗时”曲线选择分块大小:
+    每块耗时近似为 a + b*n + c*n²（固定开销 + 线性部分 + 注意力的平方项），
+    每token耗时 a/n + b + c*n 在 n = sqrt(a/c) 处最小；没有平方项时取允许的最大长度。
+曲线由 benchmarks/bench_chunk_planner.py --calibrate 测得并写入JSON文件。
+
+分块只在split_text切分出的句子边界处进行，句子按token数装箱，
+同一文档的各块大小尽量均匀，避免最后剩下一个很短的块。
+"""
+
+import os
+import re
+import json
+import math
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 单块最大token数。CosyVoice前端的text_normalize按80个token再切分文本，
+# 分块不超过该长度时每块正好对应一次模型推理
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "80"))
+# 单块最小token数，曲线给出的最优长度不低于该值
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", "20"))
+# 固定的目标token数，为0时根据耗时曲线选择
+CHUNK_TARGET_TOKENS = int(os.environ.get("CHUNK_TARGET_TOKENS", "0"))
+# 耗时曲线文件，为空时使用 <模型目录>/chunk_curve.json
+CHUNK_CURVE_PATH = os.environ.get("CHUNK_CURVE_PATH", "")
+
+CURVE_FILENAME = "chunk_curve.json"
+
+# 没有分词器时估算token数：CJK字符每字1个token，其他连续字母数字每4个字符约1个token
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿぀-ヿ가-힯]")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """不加载分词器时估算文本的token数"""
+    cjk = len(_CJK_RE.findall(text))
+    words = sum(max(1, math.ceil(len(word) / 4)) for word in _WORD_RE.findall(text))
+    return cjk + words
+
+
+def model_token_counter(model) -> Optional[Callable[[str], int]]:
+    """
+    返回使用CosyVoice前端分词器计数的函数
+
+    与text_normalize切分文本时的计数方式一致；模型没有分词器时返回None
+    """
+    frontend = getattr(model, "frontend", None)
+    tokenizer = getattr(frontend, "tokenizer", None)
+    if tokenizer is None:
+        return None
+    allowed_special = getattr(frontend, "allowed_special", "all")
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, allowed_special=allowed_special))
+
+    return count
+
+
+def fit_latency_curve(points: Sequence[Tuple[int, float]]) -> Tuple[float, float, float]:
+    """
+    用最小二乘拟合 耗时 = a + b*n + c*n²
+
+    参数:
+        points: (token数, 耗时秒) 列表
+
+    返回:
+        (a, b, c)，系数为负时截断为0
+    """
+    tokens = np.array([p[0] for p in points], dtype=np.float64)
+    seconds = np.array([p[1] for p in points], dtype=np.float64)
+    degree = 2 if len(set(tokens.tolist())) >= 3 else 1
+    coeffs = np.polyfit(tokens, seconds, degree)[::-1]
+    a, b = float(coeffs[0]), float(coeffs[1])
+    c = float(coeffs[2]) if degree == 2 else 0.0
+    return max(a, 0.0), max(b, 0.0), max(c, 0.0)
+
+
+def optimal_chunk_tokens(curve: Tuple[float, float, float], min_tokens: int, max_tokens: int) -> int:
+    """每token耗时最小的分块长度，限制在[min_tokens, max_tokens]内"""
+    a, _, c = curve
+    if c <= 0 or a <= 0:
+        return max_tokens
+    return int(min(max(round(math.sqrt(a / c)), min_tokens), max_tokens))
+
+
+def load_curve(path: str) -> Optional[Dict]:
+    """读取校准得到的耗时曲线，文件不存在或格式错误时返回None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        data["coefficients"] = tuple(float(v) for v in data["coefficients"])
+        return data
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"读取分块耗时曲线失败: {path}: {e}")
+        return None
+
+
+def save_curve(path: str, points: Sequence[Tuple[int, float]], **info) -> Dict:
+    """拟合并保存耗时曲线"""
+    curve = fit_latency_curve(points)
+    data = {
+        "coefficients": list(curve),
+        "points": [[int(n), float(s)] for n, s in points],
+        **info,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return data
+
+
+class ChunkPlanner:
+    """按token数把句子装箱为合成分块"""
+
+    def __init__(self, token_counter: Optional[Callable[[str], int]] = None,
+                 target_tokens: Optional[int] = None, max_tokens: int = CHUNK_MAX_TOKENS,
+                 min_tokens: int = CHUNK_MIN_TOKENS, curve: Optional[Tuple[float, float, float]] = None):
+        """
+        参数:
+            token_counter: 计算文本token数的函数，为None时按estimate_tokens估算
+            target_tokens: 目标分块token数，为None时根据curve选择，没有curve时为max_tokens
+            max_tokens: 单块最大token数
+            min_tokens: 根据曲线选择时的最小token数
+            curve: 耗时曲线系数(a, b, c)
+        """
+        self.count_tokens = token_counter or estimate_tokens
+        self.max_tokens = max_tokens
+        self.curve = curve
+        if target_tokens:
+            self.target_tokens = min(target_tokens, max_tokens)
+        elif curve is not None:
+            self.target_tokens = optimal_chunk_tokens(curve, min(min_tokens, max_tokens), max_tokens)
+        else:
+            self.target_tokens = max_tokens
+
+    @classmethod
+    def for_model(cls, model, model_dir: Optional[str] = None) -> "ChunkPlanner":
+        """使用模型分词器和校准曲线创建分块规划器"""
+        curve_path = CHUNK_CURVE_PATH or (os.path.join(model_dir, CURVE_FILENAME) if model_dir else "")
+        curve_data = load_curve(curve_path)
+        curve = curve_data["coefficients"] if curve_data else None
+        counter = model_token_counter(model)
+        if counter is None:
+            logger.warning("模型没有可用的分词器，分块按估算的token数进行")
+        planner = cls(counter, target_tokens=CHUNK_TARGET_TOKENS or None, curve=curve)
+        logger.info(f"分块规划: 目标 {planner.target_tokens} tokens，最大 {planner.max_tokens} tokens，"
+                    f"耗时曲线: {curve_path if curve_data else '未校准'}")
+        return planner
+
+    def needs_split(self, text: str) -> bool:
+        """文本是否超过单块长度，需要分块合成"""
+        return self.count_tokens(text) > self.max_tokens
+
+    def plan(self, sentences: Iterable[str]) -> List[str]:
+        """
+        把split_text切分出的句子合并为文本块
+
+        各块token数不超过max_tokens，并按文档总长度均分到接近target_tokens；
+        超过max_tokens的单个句子单独成块。块内句子之间的连接方式与merge_sentences_into_chunks相同。
+        """
+        items = [(sentence, self.count_tokens(sentence)) for sentence in sentences if sentence.strip()]
+        if not items:
+            return []
+
+        # 按总长度确定块数后均分，避免最后剩下一个很短的块
+        total = sum(tokens for _, tokens in items)
+        num_chunks = max(1, math.ceil(total / self.target_tokens))
+        budget = min(self.max_tokens, math.ceil(total / num_chunks))
+
+        chunks = []
+        current: List[str] = []
+        current_tokens = 0
+        for sentence, tokens in items:
+            if tokens > self.max_tokens:
+                if current:
+                    chunks.append(" ".join(current))
+                    current, current_tokens = [], 0
+                chunks.append(sentence)
+                continue
+            # 超过均分长度后，只有放得下且更接近均分长度时才继续加入当前块
+            if current and (current_tokens + tokens > self.max_tokens or
+                            current_tokens >= budget or
+                            current_tokens + tokens - budget > budget - current_tokens):
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(sentence)
+            current_tokens += tokens
+        if current:
+            chunks.append(" ".join(current))
+
+        logger.debug(f"分块规划: {len(items)} 个句子，{total} tokens，合并为 {len(chunks)} 个块")
+        return chunks
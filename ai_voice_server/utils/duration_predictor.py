@@ -0,0 +1,72 @@
+"""
+按目标时长选择合成语速
+
+声音置换在合成前就知道每个片段在原视频中的时长。原先按正常语速合成后再做变速处理，
+既耗CPU又损失音质。CosyVoice的非流式推理支持speed参数（在声码器之前对梅尔谱插值），
+输出时长约为自然时长除以speed，因此只需预测文本在speed=1时的自然时长。
+
+DurationPredictor按声音记录每token的自然时长（滑动平均），据此选择speed；
+合成后用实测时长更新记录。同一随机种子下语速不影响LLM生成的语音token，
+实测的 时长×speed 就是准确的自然时长，需要修正时再合成一次即可命中目标。
+"""
+
+import os
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+from .chunk_planner import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 语速范围，超出范围的部分由后续的时长调整处理
+SYNTH_SPEED_MIN = float(os.environ.get("SYNTH_SPEED_MIN", "0.8"))
+SYNTH_SPEED_MAX = float(os.environ.get("SYNTH_SPEED_MAX", "1.5"))
+# 没有实测记录时每token的自然时长（秒），约为中文每秒4.5个字
+DEFAULT_SECONDS_PER_TOKEN = 0.22
+# 每token时长滑动平均的平滑系数
+SECONDS_PER_TOKEN_EMA_ALPHA = 0.3
+
+
+def clamp_speed(speed: float) -> float:
+    """限制在[SYNTH_SPEED_MIN, SYNTH_SPEED_MAX]内并保留两位小数（作为合成音频缓存键的一部分）"""
+    return round(min(max(speed, SYNTH_SPEED_MIN), SYNTH_SPEED_MAX), 2)
+
+
+class DurationPredictor:
+    """按声音预测文本在speed=1时的合成时长"""
+
+    def __init__(self, token_counter: Optional[Callable[[str], int]] = None,
+                 default_rate: float = DEFAULT_SECONDS_PER_TOKEN, alpha: float = SECONDS_PER_TOKEN_EMA_ALPHA):
+        """
+        参数:
+            token_counter: 计算文本token数的函数，为None时按estimate_tokens估算
+            default_rate: 没有实测记录的声音每token的时长（秒）
+            alpha: 滑动平均的平滑系数
+        """
+        self.count_tokens = token_counter or estimate_tokens
+        self.default_rate = default_rate
+        self.alpha = alpha
+        self._rates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def predict(self, voice: str, text: str) -> float:
+        """预测text用voice合成的自然时长（秒）"""
+        with self._lock:
+            rate = self._rates.get(voice, self.default_rate)
+        return max(1, self.count_tokens(text)) * rate
+
+    def observe(self, voice: str, text: str, natural_duration: float) -> None:
+        """记录一次合成的自然时长（实测时长×speed）"""
+        if natural_duration <= 0:
+            return
+        rate = natural_duration / max(1, self.count_tokens(text))
+        with self._lock:
+            previous = self._rates.get(voice)
+            self._rates[voice] = rate if previous is None else previous + self.alpha * (rate - previous)
+
+    def speed_for(self, voice: str, text: str, target_duration: float) -> float:
+        """使合成时长接近target_duration的语速"""
+        if target_duration <= 0:
+            return 1.0
+        return clamp_speed(self.predict(voice, text) / target_duration)
@@ -0,0 +1,252 @@
+"""
+有界任务执行器，带准入控制和背压
+
+模型推理、ffmpeg、librosa等耗时数秒的同步操作不能直接在事件循环上执行，
+否则一次合成会卡住包括登录、任务状态轮询在内的所有请求。这里把这些操作放到
+固定大小的线程池中执行，并限制排队深度：队列已满时立即拒绝新请求（503 + Retry-After），
+而不是无限堆积。
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+# 进程内同时执行的推理调用数，为0时自动选择（推理池工作进程数，至少为2）
+INFERENCE_MAX_CONCURRENCY = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", "0"))
+# 推理调用的最大排队数
+INFERENCE_QUEUE_DEPTH = int(os.environ.get("INFERENCE_QUEUE_DEPTH", "16"))
+# 同时执行的后台任务数（课件生成、声音置换等）
+JOB_MAX_CONCURRENCY = int(os.environ.get("JOB_MAX_CONCURRENCY", "2"))
+# 后台任务的最大排队数
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", "16"))
+
+# 耗时滑动平均的平滑系数
+DURATION_EMA_ALPHA = 0.2
+# iterate()中已产生但尚未被消费的最大元素数，超过后工作线程等待
+ITERATE_QUEUE_SIZE = 4
+
+
+class ExecutorBusyError(HTTPException):
+    """执行器队列已满，返回503并通过Retry-After提示客户端稍后重试"""
+
+    def __init__(self, name: str, queue_position: int, retry_after: int):
+        self.executor_name = name
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={
+                "message": "服务繁忙，请稍后重试",
+                "queue_position": queue_position,
+                "retry_after": retry_after,
+            },
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class BoundedExecutor:
+    """
+    有界线程池执行器
+
+    同时执行的任务数不超过max_workers，等待执行的任务数不超过max_queue，
+    超出时submit抛出ExecutorBusyError。按任务耗时的滑动平均估算排队等待时间。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, initial_duration: float = 5.0):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        self._running = 0
+        self._queued = 0
+        self._avg_duration = initial_duration
+
+        self.completed = 0
+        self.rejected = 0
+
+    def _estimate_wait(self, queued_ahead: int) -> int:
+        """估算排在queued_ahead个任务之后需要等待的秒数"""
+        rounds = queued_ahead / self.max_workers + 1
+        return max(1, int(math.ceil(self._avg_duration * rounds)))
+
+    def check_capacity(self) -> None:
+        """队列已满时抛出ExecutorBusyError，用于在产生副作用之前提前拒绝请求"""
+        with self._lock:
+            self._check_capacity_locked()
+
+    def _check_capacity_locked(self) -> None:
+        if self._running + self._queued >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            position = self._queued + 1
+            retry_after = self._estimate_wait(self._queued)
+            logger.warning(f"{self.name}: 队列已满（执行中 {self._running}，排队 {self._queued}），拒绝新任务")
+            raise ExecutorBusyError(self.name, position, retry_after)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """提交任务，队列已满时抛出ExecutorBusyError"""
+        with self._lock:
+            self._check_capacity_locked()
+            self._queued += 1
+
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            start = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self._avg_duration += DURATION_EMA_ALPHA * (elapsed - self._avg_duration)
+
+        future = self._executor.submit(run)
+
+        def on_done(f: Future) -> None:
+            # 尚未开始就被取消的任务不会执行run，需要在这里归还排队名额
+            if f.cancelled():
+                with self._lock:
+                    self._queued -= 1
+
+        future.add_done_callback(on_done)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在执行器中运行任务并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def iterate(self, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """
+        在一个工作线程中驱动同步迭代器（如流式合成生成器），返回异步迭代器
+
+        任务在调用时立即提交，队列已满会在开始响应之前抛出ExecutorBusyError；
+        整个迭代过程只占用一个工作线程，不会在流的中途被拒绝。
+        最多缓存ITERATE_QUEUE_SIZE个元素，客户端读取慢时工作线程等待，不会无限堆积音频块。
+        """
+        loop = asyncio.get_running_loop()
+        items: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=ITERATE_QUEUE_SIZE)
+        stop = threading.Event()
+        end = object()
+
+        def put(entry) -> bool:
+            """阻塞直到放入队列，消费端已停止时放弃并返回False"""
+            try:
+                future = asyncio.run_coroutine_threadsafe(items.put(entry), loop)
+            except RuntimeError:
+                # 事件循环已关闭
+                return False
+            while True:
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def drive():
+            try:
+                for item in iterator:
+                    if stop.is_set() or not put((item, None)):
+                        break
+            except BaseException as e:
+                put((end, e))
+            else:
+                put((end, None))
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        self.submit(drive)
+
+        async def consume():
+            try:
+                while True:
+                    item, error = await items.get()
+                    if item is end:
+                        if error is not None:
+                            raise error
+                        return
+                    yield item
+            finally:
+                # 客户端断开时通知工作线程停止迭代
+                stop.set()
+
+        return consume()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "avg_duration": round(self._avg_duration, 3),
+                "estimated_wait": self._estimate_wait(self._queued),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(name: str, factory: Callable[[], BoundedExecutor]) -> BoundedExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = factory()
+    return executor
+
+
+def get_inference_executor() -> BoundedExecutor:
+    """获取模型推理执行器"""
+    def factory():
+        workers = INFERENCE_MAX_CONCURRENCY
+        if workers <= 0:
+            workers = max(2, int(os.environ.get("INFERENCE_WORKERS", "0")))
+        return BoundedExecutor("inference", workers, INFERENCE_QUEUE_DEPTH, initial_duration=5.0)
+    return _get_executor("inference", factory)
+
+
+def get_job_executor() -> BoundedExecutor:
+    """获取后台任务执行器（课件生成、声音置换等长任务）"""
+    return _get_executor(
+        "jobs",
+        lambda: BoundedExecutor("jobs", JOB_MAX_CONCURRENCY, JOB_QUEUE_DEPTH, initial_duration=120.0)
+    )
+
+
+def executor_stats() -> Dict[str, Any]:
+    """返回已创建的执行器的统计信息"""
+    with _executors_lock:
+        executors = dict(_executors)
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
+def shutdown_executors(wait: bool = False) -> None:
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
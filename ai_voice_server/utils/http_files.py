@@ -0,0 +1,213 @@
+"""
+结果文件下载：字节范围请求、强ETag与条件GET
+
+课件视频、声音置换结果等文件可达数百MB。下载接口支持:
+    - Range: bytes=start-end，返回206和Content-Range，播放器拖动进度、断点续传不必重新下载整个文件
+    - 强ETag：由文件内容的SHA-256生成，按(路径, 大小, 修改时间)缓存，文件只在首次下载时计算一次
+    - If-None-Match / If-Modified-Since：文件未变化时返回304
+    - If-Range：文件已变化时忽略Range，返回完整文件
+指定音频格式下载时先转码为缓存文件（每个文件和格式只转码一次），再按同样的方式返回。
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from .audio_encoders import (
+    AudioFormat, AudioEncoderError, content_disposition, encoded_filename, encoded_file_path,
+    encode_file, ensure_encoder_available
+)
+from .executor import get_job_executor
+
+logger = logging.getLogger(__name__)
+
+# 读取文件时每块的字节数
+FILE_CHUNK_SIZE = 256 * 1024
+# 计算ETag时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+# 已认证用户的下载结果，只允许浏览器缓存，每次使用前向服务器验证
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+_etag_cache: Dict[str, Tuple[int, int, str]] = {}
+_etag_lock = threading.Lock()
+
+
+def file_etag(path: str, stat_result: Optional[os.stat_result] = None) -> str:
+    """
+    由文件内容生成强ETag
+
+    结果按(大小, 修改时间)缓存，文件被重新生成后自动重新计算。
+    """
+    stat_result = stat_result or os.stat(path)
+    key = os.path.abspath(path)
+    with _etag_lock:
+        cached = _etag_cache.get(key)
+    if cached and cached[0] == stat_result.st_size and cached[1] == stat_result.st_mtime_ns:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    with _etag_lock:
+        _etag_cache[key] = (stat_result.st_size, stat_result.st_mtime_ns, etag)
+    return etag
+
+
+def _etag_list(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """按If-None-Match（优先）或If-Modified-Since判断客户端缓存是否仍然有效"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match使用弱比较
+        tags = _etag_list(if_none_match)
+        return "*" in tags or _strip_weak(etag) in {_strip_weak(tag) for tag in tags}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def _range_applies(request: Request, etag: str, mtime: float) -> bool:
+    """If-Range与当前文件匹配（或未携带）时才按Range返回部分内容"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range使用强比较，弱ETag永远不匹配
+        return if_range == etag
+    try:
+        return int(mtime) == parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围
+
+    返回:
+        (start, end)，end包含在内；格式无法识别或包含多个范围时返回None（按完整文件返回）；
+        范围超出文件大小时抛出ValueError
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_str, sep, end_str = (part.strip() for part in ranges.strip().partition("-"))
+    if not sep or not (start_str or end_str) or not all(s.isdigit() for s in (start_str, end_str) if s):
+        return None
+    if not start_str:
+        # 后缀范围：最后N个字节
+        length = int(end_str)
+        if length == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if end_str and end < start:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[bytes]:
+    """逐块读取文件的[start, end]字节"""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+async def file_download_response(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """
+    返回结果文件，支持Range、ETag和条件GET
+
+    参数:
+        request: 当前请求
+        path: 文件路径
+        media_type: 内容类型
+        filename: 下载文件名
+    """
+    stat_result = await run_in_threadpool(os.stat, path)
+    etag = await run_in_threadpool(file_etag, path, stat_result)
+    size = stat_result.st_size
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+    }
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition(filename)
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and size > 0 and _range_applies(request, etag, stat_result.st_mtime):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1 if size > 0 else 0)
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+async def file_audio_response(request: Request, path: str, fmt: AudioFormat, bitrate: Optional[int],
+                              filename: str) -> Response:
+    """
+    以指定格式返回音频/视频结果文件的音轨
+
+    源文件已是WAV且请求WAV时直接返回文件；否则首次请求时由ffmpeg转码为缓存文件
+    （视频只提取音轨），转码经后台任务执行器准入，队列已满时返回503。
+    之后的请求直接返回缓存文件，同样支持Range、ETag和条件GET。
+    """
+    download_name = encoded_filename(filename, fmt)
+    if fmt.codec is None and path.lower().endswith(".wav"):
+        return await file_download_response(request, path, fmt.media_type, download_name)
+
+    ensure_encoder_available(fmt)
+    encoded_path = await run_in_threadpool(encoded_file_path, fmt, path, bitrate)
+    if not os.path.exists(encoded_path):
+        try:
+            encoded_path = await get_job_executor().run(encode_file, fmt, path, bitrate)
+        except AudioEncoderError as e:
+            raise HTTPException(status_code=500, detail=f"音频转码失败: {e}")
+    return await file_download_response(request, encoded_path, fmt.media_type, download_name)
@@ -0,0 +1,76 @@
+"""
+延迟导入工具
+
+torch、CosyVoice、moviepy、whisper、librosa 等模块导入一次需要数秒并占用数百MB内存，
+只在课件生成、声音置换、语音合成等功能中使用。模块级别改为 lazy_import() 返回的代理对象，
+首次访问属性时才真正导入；只处理登录、管理等请求的进程不会加载它们。
+"""
+
+import sys
+import time
+import types
+import logging
+import importlib
+import importlib.util
+import threading
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+# 导入开销大、应当延迟导入的模块
+HEAVY_MODULES = ("torch", "torchaudio", "cosyvoice", "moviepy", "whisper", "librosa")
+
+_import_lock = threading.Lock()
+
+
+def is_available(name: str) -> bool:
+    """检查模块是否已安装，不执行导入"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule(types.ModuleType):
+    """首次访问属性时才导入的模块代理"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with _import_lock:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                name = self.__dict__["_lazy_name"]
+                start = time.perf_counter()
+                module = importlib.import_module(name)
+                logger.info(f"已延迟导入 {name}，耗时 {time.perf_counter() - start:.2f}s")
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_lazy_name']}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """返回模块的延迟导入代理，已导入的模块同样返回代理"""
+    return LazyModule(name)
+
+
+def imported_heavy_modules() -> List[str]:
+    """当前进程中已导入的重量级模块"""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
@@ -0,0 +1,136 @@
+"""
+零样本合成的提示音频特征缓存
+
+同一个上传声音在课件、声音置换等场景下会被重复使用成百上千次，
+这里按 声音ID + 文件修改时间 缓存重采样后的提示音频以及CosyVoice前端提取的
+语音token、说话人向量和梅尔特征，避免每次合成都重新加载和提取。
+"""
+
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 缓存条目数上限
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", "32"))
+# 缓存内存上限（MB）
+PROMPT_CACHE_MAX_MB = int(os.environ.get("PROMPT_CACHE_MAX_MB", "256"))
+
+
+def estimate_nbytes(value: Any) -> int:
+    """估算缓存对象占用的内存字节数（支持torch张量、numpy数组及其容器）"""
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    # torch张量，避免在此处导入torch
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return int(value.element_size() * value.nelement())
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 0
+
+
+class PromptFeatureCache:
+    """
+    有界LRU缓存，按条目数和内存占用双重限制淘汰最久未使用的提示特征
+    """
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES, max_bytes: int = PROMPT_CACHE_MAX_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(voice_id: Any, prompt_audio: str, prompt_text: Optional[str]) -> Tuple:
+        """
+        生成缓存键
+
+        文件被重新上传或修改后修改时间变化，旧条目自然失效；
+        提示文本参与前端特征提取，因此也纳入键中。
+        """
+        mtime = os.path.getmtime(prompt_audio)
+        return (str(voice_id), os.path.abspath(prompt_audio), mtime, prompt_text or "")
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, features: Dict[str, Any]) -> None:
+        nbytes = estimate_nbytes(features)
+        if nbytes > self.max_bytes:
+            logger.warning(f"提示特征大小 {nbytes / 1024 / 1024:.1f}MB 超过缓存上限，不进行缓存")
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (features, nbytes)
+            self._total_bytes += nbytes
+
+            # 按LRU顺序淘汰，直到满足条目数和内存上限
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                evicted_key, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                logger.debug(f"提示特征缓存淘汰: {evicted_key[0]}")
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """命中则直接返回，否则调用factory提取特征并写入缓存"""
+        features = self.get(key)
+        if features is not None:
+            return features
+
+        # 特征提取耗时较长，不持有锁执行
+        features = factory()
+        self.put(key, features)
+        return features
+
+    def invalidate(self, voice_id: Any) -> int:
+        """删除指定声音的所有缓存条目，返回删除的条目数"""
+        voice_key = str(voice_id)
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == voice_key]
+            for k in keys:
+                _, nbytes = self._entries.pop(k)
+                self._total_bytes -= nbytes
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# 进程内共享的缓存实例
+prompt_feature_cache = PromptFeatureCache()
@@ -0,0 +1,139 @@
+"""
+推理请求串行去重器
+
+并发的合成请求可能包含相同的文本和声音（如多人同时合成同一段提示语、客户端重试）。
+去重器由单个工作线程依次执行请求：每次取出队列中已在等待的请求，相同的请求只推理一次，
+再把结果分发给各自的调用方。
+
+CosyVoice的推理接口一次只处理一条文本，这里没有真正的批处理，吞吐量不会高于直接并发调用；
+启用后所有经过去重器的推理都串行执行，只在重复请求较多时才有收益，因此默认关闭。
+"""
+
+import os
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 是否让预置声音(SFT)推理经过串行去重器（默认关闭，各请求直接并发推理）
+SFT_DEDUP_ENABLED = os.environ.get("SFT_DEDUP_ENABLED", "0") != "0"
+# 每轮最多取出的请求数
+SFT_DEDUP_MAX_SIZE = int(os.environ.get("SFT_DEDUP_MAX_SIZE", "8"))
+
+
+class SerialDeduplicator:
+    """
+    串行去重器
+
+    run_fn 接收去重后的请求列表并依次执行，返回等长的结果列表；
+    结果列表中的异常对象会作为对应请求的异常抛给调用方，不影响同一轮的其他请求。
+    """
+
+    def __init__(self, run_fn: Callable[[List[Hashable]], List[Any]],
+                 max_size: int = SFT_DEDUP_MAX_SIZE,
+                 name: str = "request-dedup"):
+        self.run_fn = run_fn
+        self.max_size = max(1, max_size)
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        self.rounds = 0
+        self.requests = 0
+        self.coalesced = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Hashable) -> Future:
+        """提交一个请求，返回Future"""
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def infer(self, item: Hashable, timeout: Optional[float] = None) -> Any:
+        """提交请求并阻塞等待结果"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _take_waiting(self, first: tuple) -> List[tuple]:
+        # 只取已在排队的请求，不等待后续请求
+        taken = [first]
+        while len(taken) < self.max_size:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # 关闭信号放回队列，处理完当前请求后退出
+                self._queue.put(None)
+                break
+            taken.append(entry)
+        return taken
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            taken = self._take_waiting(first)
+
+            # 相同的请求只推理一次
+            waiters: Dict[Hashable, List[Future]] = {}
+            for item, future in taken:
+                if future.set_running_or_notify_cancel():
+                    waiters.setdefault(item, []).append(future)
+            if not waiters:
+                continue
+
+            items = list(waiters)
+            self.rounds += 1
+            self.requests += len(taken)
+            self.coalesced += len(taken) - len(items)
+            logger.debug(f"{self.name}: {len(taken)} 个请求，去重后 {len(items)} 个")
+
+            try:
+                results = self.run_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"结果数量不匹配: {len(results)} != {len(items)}")
+            except Exception as e:
+                logger.error(f"{self.name}: 执行失败: {e}")
+                results = [e] * len(items)
+
+            for item, result in zip(items, results):
+                for future in waiters[item]:
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+    def shutdown(self) -> None:
+        """停止工作线程，已提交的请求会先执行完"""
+        with self._lock:
+            if self._thread is None or self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+            thread = self._thread
+        thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "max_size": self.max_size,
+        }
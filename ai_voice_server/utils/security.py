@@ -53,6 +53,19 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     
     return encoded_jwt
 
+def get_user_from_token(token: str, db: Session):
+    """解析访问令牌并返回对应用户，令牌无效时返回None（用于WebSocket等无法使用依赖注入的场景）"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    
+    username = payload.get("sub")
+    if username is None:
+        return None
+    
+    return db.query(models.User).filter(models.User.username == username).first()
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """获取当前用户"""
     credentials_exception = HTTPException(
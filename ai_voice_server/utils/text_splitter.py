@@ -9,17 +9,80 @@ import os
 import numpy as np
 import soundfile as sf
 from scipy import signal
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 import subprocess
 import json
 
+from .audio_metadata import get_audio_duration
+from .audio_merge import (
+    merge_segments, segment_timing, merge_files_streaming, read_audio_info, plan_merge, exceeds_memory_budget
+)
+
 logger = logging.getLogger(__name__)
 
 # 中文文本分割标点符号 - 增加更多标点以获得更好的分段效果
 CHINESE_SENT_SEP = r'[，。！？；：、\n,.!?;:\r"]'
-# 最大文本长度（字符数，根据测试调整）
+# 最大文本长度（字符数），用于增量切分的缓冲区和按字符数分块；
+# 合成分块按模型token数由chunk_planner规划
 MAX_TEXT_LENGTH = 70
 
+# split_text的句末标点，切分结果保留标点
+SENTENCE_SPLIT_PATTERN = re.compile(r'([。！？?!,，;；\n])')
+
+def _split_paragraph(paragraph: str) -> Iterator[str]:
+    """按标点符号切分一个段落（不含换行符），依次产出句子"""
+    parts = SENTENCE_SPLIT_PATTERN.split(paragraph)
+    
+    current_sentence = ""
+    for i in range(0, len(parts)):
+        current_sentence += parts[i]
+        
+        # 如果是标点符号则将句子添加到结果中
+        if i % 2 == 1:
+            if current_sentence.strip():
+                yield current_sentence.strip()
+            current_sentence = ""
+    
+    # 处理不以标点符号结尾的剩余文本
+    if current_sentence.strip():
+        yield current_sentence.strip()
+
+def iter_paragraphs(fragments: Iterable[str]) -> Iterator[str]:
+    """
+    把任意切分的文本片段（如逐块读取的文件）重新组合为按换行符分隔的段落
+    
+    只缓存尚未遇到换行符的部分，内存占用为一个段落
+    """
+    buffer = ""
+    for fragment in fragments:
+        if not fragment:
+            continue
+        buffer += fragment
+        if "\n" not in fragment:
+            continue
+        *paragraphs, buffer = buffer.split("\n")
+        for paragraph in paragraphs:
+            yield paragraph
+    if buffer:
+        yield buffer
+
+def iter_sentences(paragraphs: Iterable[str]) -> Iterator[str]:
+    """
+    split_text的生成器版本：逐段切分，依次产出句子
+    
+    参数:
+        paragraphs: 段落的可迭代对象，每项为一个或多个完整段落（段落内的换行符同样作为分隔）；
+                    任意切分的文本片段先经过iter_paragraphs
+    
+    对各段落依次产出的句子与对 "\n".join(paragraphs) 调用split_text的结果相同
+    """
+    for text in paragraphs:
+        if not text:
+            continue
+        for paragraph in text.split('\n'):
+            if paragraph.strip():
+                yield from _split_paragraph(paragraph)
+
 def split_text(text: str) -> List[str]:
     """
     将文本按标点符号分割成句子
@@ -35,34 +98,9 @@ def split_text(text: str) -> List[str]:
     
     # 记录原始文本信息
     logger.debug(f"分割文本，原始长度: {len(text)}")
-        
-    # 按标点符号切分文本
-    pattern = r'([。！？?!,，;；\n])'
-    sentences = []
-    
-    # 先按段落分割
-    paragraphs = text.split('\n')
     
-    for paragraph in paragraphs:
-        if not paragraph.strip():
-            continue
-            
-        # 按标点符号分割段落
-        parts = re.split(pattern, paragraph)
-        
-        current_sentence = ""
-        for i in range(0, len(parts)):
-            current_sentence += parts[i]
-            
-            # 如果是标点符号则将句子添加到结果中
-            if i % 2 == 1:
-                if current_sentence.strip():
-                    sentences.append(current_sentence.strip())
-                current_sentence = ""
-        
-        # 处理不以标点符号结尾的剩余文本
-        if current_sentence.strip():
-            sentences.append(current_sentence.strip())
+    # 先按段落分割，再按标点符号分割段落
+    sentences = list(iter_sentences([text]))
     
     # 记录分割结果
     logger.debug(f"文本分割完成，共 {len(sentences)} 个句子")
@@ -72,32 +110,90 @@ def split_text(text: str) -> List[str]:
     
     return sentences
 
-def merge_sentences_into_chunks(sentences: List[str], max_chunk_length: int) -> List[str]:
+class IncrementalSentenceSplitter:
     """
-    将句子合并为合适长度的文本块
+    增量句子切分器，用于逐段接收文本（如大模型流式输出）的场景
+    
+    文本片段先缓存在缓冲区中，遇到split_text使用的句末标点时，把标点之前的完整部分
+    按split_text的规则切分并立即返回，剩余部分继续等待后续片段。
+    缓冲区始终不超过max_buffer_length时，所有片段送入并flush后得到的句子与对完整文本
+    调用split_text的结果一致；超过该长度的无标点文本会被强制切开，切点处与split_text的结果不同。
+    """
+    
+    BOUNDARY_CHARS = "。！？?!,，;；\n"
+    
+    def __init__(self, max_buffer_length: int = MAX_TEXT_LENGTH * 2):
+        """
+        参数:
+            max_buffer_length: 缓冲区无标点时的最大长度，超过后整体作为一个句子输出，
+                               避免没有标点的输入一直得不到合成
+        """
+        self.max_buffer_length = max_buffer_length
+        self._buffer = ""
+    
+    def feed(self, fragment: str) -> List[str]:
+        """
+        送入一个文本片段
+        
+        返回:
+            本次新完成的句子列表（可能为空）
+        """
+        if not fragment:
+            return []
+        self._buffer += fragment
+        
+        # 找到缓冲区中最后一个句末标点，之前的部分已是完整句子
+        cut = -1
+        for i in range(len(self._buffer) - 1, -1, -1):
+            if self._buffer[i] in self.BOUNDARY_CHARS:
+                cut = i
+                break
+        
+        if cut >= 0:
+            completed, self._buffer = self._buffer[:cut + 1], self._buffer[cut + 1:]
+            sentences = split_text(completed)
+        else:
+            sentences = []
+        
+        if len(self._buffer) >= self.max_buffer_length:
+            sentences.extend(split_text(self._buffer))
+            self._buffer = ""
+        
+        return sentences
+    
+    def flush(self) -> List[str]:
+        """输出缓冲区中剩余的文本（输入结束或客户端要求立即合成时调用）"""
+        sentences = split_text(self._buffer)
+        self._buffer = ""
+        return sentences
+    
+    @property
+    def pending(self) -> str:
+        """尚未形成完整句子的缓冲文本"""
+        return self._buffer
+
+def iter_chunks(sentences: Iterable[str], max_chunk_length: int) -> Iterator[str]:
+    """
+    merge_sentences_into_chunks的生成器版本：每凑满一个文本块就立即产出
     
     参数:
-        sentences: 句子列表
+        sentences: 句子的可迭代对象（如iter_sentences）
         max_chunk_length: 每个块的最大字符数
-        
-    返回:
-        文本块列表
     """
-    chunks = []
     current_chunk = ""
     
     for sentence in sentences:
         # 如果单个句子长度超过最大长度，则单独作为一个块
         if len(sentence) > max_chunk_length:
             if current_chunk:
-                chunks.append(current_chunk)
+                yield current_chunk
                 current_chunk = ""
-            chunks.append(sentence)
+            yield sentence
             continue
         
         # 判断添加当前句子后是否超过最大长度
         if len(current_chunk) + len(sentence) > max_chunk_length:
-            chunks.append(current_chunk)
+            yield current_chunk
             current_chunk = sentence
         else:
             if current_chunk:
@@ -106,7 +202,20 @@ def merge_sentences_into_chunks(sentences: List[str], max_chunk_length: int) ->
     
     # 添加最后一个块
     if current_chunk:
-        chunks.append(current_chunk)
+        yield current_chunk
+
+def merge_sentences_into_chunks(sentences: List[str], max_chunk_length: int) -> List[str]:
+    """
+    将句子合并为合适长度的文本块
+    
+    参数:
+        sentences: 句子列表
+        max_chunk_length: 每个块的最大字符数
+        
+    返回:
+        文本块列表
+    """
+    chunks = list(iter_chunks(sentences, max_chunk_length))
     
     # 记录合并结果
     logger.debug(f"合并为 {len(chunks)} 个文本块")
@@ -161,65 +270,17 @@ def merge_audio_files(audio_files: List[str], output_path: str, crossfade_durati
         sf.write(output_path, audio_segments[0], sample_rate)
         return output_path
     
-    # 计算交叉淡入淡出样本数
+    # 预先计算各片段位置，在一个缓冲区中原地交叉淡化
     crossfade_samples = int(crossfade_duration * sample_rate)
-    
-    # 合并音频段
-    result = audio_segments[0]
-    
-    for i in range(1, len(audio_segments)):
-        # 当前段
-        current_audio = audio_segments[i]
-        
-        # 计算合并点
-        merge_point = len(result) - crossfade_samples
-        
-        # 创建渐变权重
-        fade_out = np.linspace(1, 0, crossfade_samples)
-        fade_in = np.linspace(0, 1, crossfade_samples)
-        
-        # 确保数据形状兼容（处理单声道/多声道）
-        if len(result.shape) > 1 and len(current_audio.shape) > 1:
-            # 多声道情况
-            for channel in range(result.shape[1]):
-                result[merge_point:merge_point+crossfade_samples, channel] *= fade_out
-                current_audio[:crossfade_samples, channel] *= fade_in
-        else:
-            # 单声道情况
-            result[merge_point:merge_point+crossfade_samples] *= fade_out
-            current_audio[:crossfade_samples] *= fade_in
-        
-        # 合并音频
-        merged = np.concatenate([result[:merge_point], 
-                                result[merge_point:merge_point+crossfade_samples] + current_audio[:crossfade_samples], 
-                                current_audio[crossfade_samples:]])
-        result = merged
+    result, _ = merge_segments(audio_segments, crossfade_samples)
     
     # 保存结果
     sf.write(output_path, result, sample_rate)
     logger.info(f"已合并 {len(audio_files)} 个音频片段到 {output_path}")
     return output_path
 
-def get_audio_duration(audio_file: str) -> float:
-    """
-    获取音频文件的播放时长（秒）
-    
-    参数:
-        audio_file: 音频文件路径
-        
-    返回:
-        音频时长（秒）
-    """
-    try:
-        data, sample_rate = sf.read(audio_file)
-        duration = len(data) / sample_rate
-        logger.debug(f"音频文件 {os.path.basename(audio_file)} 时长: {duration:.2f}秒")
-        return duration
-    except Exception as e:
-        logger.error(f"获取音频时长失败: {str(e)}")
-        return 0.0
-
-def merge_audio_files_exact(audio_files: List[str], output_path: str, crossfade_duration: float = 0.05) -> Dict[str, Any]:
+def merge_audio_files_exact(audio_files: List[str], output_path: str, crossfade_duration: float = 0.05,
+                            streaming: Optional[bool] = None) -> Dict[str, Any]:
     """
     合并多个音频文件，添加精确的交叉淡入淡出效果，并返回时间信息
     
@@ -227,6 +288,8 @@ def merge_audio_files_exact(audio_files: List[str], output_path: str, crossfade_
         audio_files: 音频文件路径列表
         output_path: 输出文件路径
         crossfade_duration: 交叉淡入淡出时长(秒)
+        streaming: 是否逐块读写（内存中只保留交叉淡化窗口），为None时合并结果超过
+                   MERGE_MEMORY_BUDGET才使用；两种方式的输出逐位一致
         
     返回:
         包含时间信息的字典：{
@@ -261,11 +324,28 @@ def merge_audio_files_exact(audio_files: List[str], output_path: str, crossfade_
             'segments': [{'file': audio_files[0], 'start': 0, 'duration': duration, 'end': duration}]
         }
     
+    # 只读取文件头，确定采样率和合并后的长度
+    sample_rate, channels, lengths = read_audio_info(audio_files)
+    crossfade_samples = int(crossfade_duration * sample_rate)
+    if streaming is None:
+        streaming = exceeds_memory_budget(plan_merge(lengths, crossfade_samples)[2], channels)
+    
+    if streaming:
+        _, lengths, overlaps = merge_files_streaming(audio_files, output_path, crossfade_samples)
+        durations = [length / sample_rate for length in lengths]
+        segment_info = segment_timing(audio_files, durations, overlaps, crossfade_duration, sample_rate)
+        total_duration = plan_merge(lengths, crossfade_samples)[2] / sample_rate
+        logger.info(f"已流式合并 {len(audio_files)} 个音频片段到 {output_path}，总时长: {total_duration:.2f}秒")
+        return {
+            'path': output_path,
+            'duration': total_duration,
+            'segments': segment_info
+        }
+    
     # 读取所有音频文件
     audio_segments = []
+    durations = []
     sample_rate = None
-    segment_info = []
-    current_position = 0  # 当前位置(秒)
     
     for audio_file in audio_files:
         data, rate = sf.read(audio_file)
@@ -278,72 +358,12 @@ def merge_audio_files_exact(audio_files: List[str], output_path: str, crossfade_
             # 在实际项目中可以使用librosa.resample等进行更复杂的处理
             raise ValueError(f"采样率不匹配: {rate} != {sample_rate}")
         
-        # 记录原始持续时间
-        orig_duration = len(data) / sample_rate
-        
-        # 存储数据和对应信息
         audio_segments.append(data)
-        segment_info.append({
-            'file': audio_file,
-            'start': current_position,
-            'duration': orig_duration,
-            'end': current_position + orig_duration
-        })
-        
-        # 更新当前位置，考虑到交叉淡入淡出的重叠
-        if len(audio_segments) > 1:  # 第二个及后续片段考虑交叉淡入淡出
-            current_position += orig_duration - crossfade_duration
-        else:  # 第一个片段完整计算
-            current_position += orig_duration
-    
-    # 如果只有一个音频文件，直接返回
-    if len(audio_segments) == 1:
-        sf.write(output_path, audio_segments[0], sample_rate)
-        return {
-            'path': output_path, 
-            'duration': segment_info[0]['duration'],
-            'segments': segment_info
-        }
-    
-    # 计算交叉淡入淡出样本数
-    crossfade_samples = int(crossfade_duration * sample_rate)
-    
-    # 合并音频段，同时更新时间信息
-    result = audio_segments[0]
+        durations.append(len(data) / sample_rate)
     
-    for i in range(1, len(audio_segments)):
-        # 当前段
-        current_audio = audio_segments[i]
-        
-        # 计算合并点
-        merge_point = len(result) - crossfade_samples
-        
-        # 创建渐变权重
-        fade_out = np.linspace(1, 0, crossfade_samples)
-        fade_in = np.linspace(0, 1, crossfade_samples)
-        
-        # 确保数据形状兼容（处理单声道/多声道）
-        if len(result.shape) > 1 and len(current_audio.shape) > 1:
-            # 多声道情况
-            for channel in range(result.shape[1]):
-                result[merge_point:merge_point+crossfade_samples, channel] *= fade_out
-                current_audio[:crossfade_samples, channel] *= fade_in
-        else:
-            # 单声道情况
-            result[merge_point:merge_point+crossfade_samples] *= fade_out
-            current_audio[:crossfade_samples] *= fade_in
-        
-        # 合并音频
-        merged = np.concatenate([result[:merge_point], 
-                                result[merge_point:merge_point+crossfade_samples] + current_audio[:crossfade_samples], 
-                                current_audio[crossfade_samples:]])
-        result = merged
-        
-        # 更新后续片段的时间信息（因为交叉淡入淡出导致实际开始时间提前）
-        for j in range(i+1, len(segment_info)):
-            # 每个后续片段的开始和结束时间都要考虑当前的交叉淡入淡出时间
-            segment_info[j]['start'] -= crossfade_duration
-            segment_info[j]['end'] -= crossfade_duration
+    # 预先计算各片段位置，在一个缓冲区中原地交叉淡化，时间信息一次遍历得到
+    result, overlaps = merge_segments(audio_segments, crossfade_samples)
+    segment_info = segment_timing(audio_files, durations, overlaps, crossfade_duration, sample_rate)
     
     # 计算实际的总时长
     total_duration = len(result) / sample_rate
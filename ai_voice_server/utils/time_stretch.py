@@ -0,0 +1,218 @@
+"""
+合成片段的时长调整（变速不变调）
+
+声音置换时每个合成片段都要调整到原视频中对应片段的时长。原先在任务线程中逐段调用
+librosa.effects.time_stretch（相位声码器），首次调用还要等待numba编译，几百个片段的视频要数分钟。
+
+这里提供两种实现，按TIME_STRETCH_QUALITY分为三个档位:
+    fast:     WSOLA（波形相似重叠相加），逐帧在容差范围内寻找与上一帧自然延续最相似的位置，
+              先抽取粗搜再逐点细化；对语音没有相位声码器的“金属声”，速度快一个数量级
+    standard: librosa相位声码器（原实现）
+    high:     librosa相位声码器，帧移减半，瞬态更清晰，耗时约为standard的两倍
+librosa不可用时standard/high退回fast。
+
+调整在进程池（TIME_STRETCH_WORKERS）中执行，与后续片段的合成并行；
+比例接近1的片段（时长差不超过TIME_STRETCH_TOLERANCE秒或比例偏差小于TIME_STRETCH_MIN_DEVIATION）不做处理。
+"""
+
+import os
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from .lazy_import import lazy_import, is_available
+
+logger = logging.getLogger(__name__)
+
+# librosa只在standard/high质量下使用，首次使用时才导入
+librosa = lazy_import("librosa") if is_available("librosa") else None
+
+# 质量档位: fast / standard / high
+TIME_STRETCH_QUALITY = os.environ.get("TIME_STRETCH_QUALITY", "fast").lower()
+# 时长调整进程数，为0时在调用线程中直接处理
+TIME_STRETCH_WORKERS = int(os.environ.get("TIME_STRETCH_WORKERS", "2"))
+# 时长差不超过该秒数的片段不调整
+TIME_STRETCH_TOLERANCE = float(os.environ.get("TIME_STRETCH_TOLERANCE", "0.1"))
+# 比例偏差（|rate - 1|）小于该值的片段不调整
+TIME_STRETCH_MIN_DEVIATION = float(os.environ.get("TIME_STRETCH_MIN_DEVIATION", "0.01"))
+
+QUALITY_TIERS = ("fast", "standard", "high")
+if TIME_STRETCH_QUALITY not in QUALITY_TIERS:
+    logger.warning(f"无效的TIME_STRETCH_QUALITY: {TIME_STRETCH_QUALITY}，使用fast")
+    TIME_STRETCH_QUALITY = "fast"
+# 声音置换时最多同时等待的调整任务数，超过后按顺序取回结果写入合并缓冲区
+TIME_STRETCH_MAX_PENDING = 32
+
+# WSOLA帧长与搜索容差（毫秒）
+WSOLA_FRAME_MS = 30
+WSOLA_TOLERANCE_MS = 10
+# 粗搜时的抽取间隔
+WSOLA_DECIMATION = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def needs_stretch(duration: float, target_duration: float) -> bool:
+    """片段时长与目标时长的差异是否需要调整"""
+    if target_duration <= 0 or duration <= 0:
+        return False
+    if abs(duration - target_duration) <= TIME_STRETCH_TOLERANCE:
+        return False
+    return abs(duration / target_duration - 1) >= TIME_STRETCH_MIN_DEVIATION
+
+
+def _wsola_mono(audio: np.ndarray, rate: float, out_len: int, frame: int, delta: int) -> np.ndarray:
+    hop = frame // 2
+    window = signal.get_window("hann", frame).astype(np.float32)
+    n_frames = out_len // hop + 2
+    # 两端补零，边界处的帧也能在容差范围内搜索
+    needed = int(np.ceil(n_frames * hop * rate)) + 2 * frame + 2 * delta
+    padded = np.zeros(max(needed, len(audio) + 2 * delta + frame), dtype=np.float32)
+    padded[delta:delta + len(audio)] = audio
+
+    out = np.zeros(n_frames * hop + frame, dtype=np.float32)
+    norm = np.zeros_like(out)
+    prev = delta
+    for k in range(n_frames):
+        nominal = int(round(k * hop * rate)) + delta
+        if k == 0:
+            pos = nominal
+        else:
+            # 上一帧在输入中的自然延续，与候选位置的片段做互相关：
+            # 先按WSOLA_DECIMATION抽取后粗搜，再在粗搜结果附近逐点细化
+            template = padded[prev + hop:prev + hop + frame]
+            region = padded[nominal - delta:nominal + delta + frame]
+            step = WSOLA_DECIMATION
+            coarse = np.correlate(region[::step], template[::step], mode="valid")
+            best = int(np.argmax(coarse)) * step
+            low, high = max(0, best - step), min(2 * delta, best + step)
+            fine = sliding_window_view(region[low:high + frame], frame) @ template
+            pos = nominal - delta + low + int(np.argmax(fine))
+        out[k * hop:k * hop + frame] += padded[pos:pos + frame] * window
+        norm[k * hop:k * hop + frame] += window
+        prev = pos
+    np.divide(out, norm, out=out, where=norm > 1e-3)
+    return out[:out_len]
+
+
+def wsola_stretch(audio: np.ndarray, rate: float, sample_rate: int) -> np.ndarray:
+    """
+    WSOLA变速不变调
+
+    参数:
+        audio: float32采样，(n,) 或 (n, channels)
+        rate: 速度比例，大于1时变快（变短）
+        sample_rate: 采样率
+
+    返回:
+        长度为 round(n / rate) 的音频
+    """
+    out_len = int(round(len(audio) / rate))
+    frame = 2 * max(8, int(WSOLA_FRAME_MS * sample_rate / 2000))
+    delta = max(1, int(WSOLA_TOLERANCE_MS * sample_rate / 1000))
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim == 1:
+        return _wsola_mono(audio, rate, out_len, frame, delta)
+    return np.stack([_wsola_mono(audio[:, c], rate, out_len, frame, delta)
+                     for c in range(audio.shape[1])], axis=1)
+
+
+def phase_vocoder_stretch(audio: np.ndarray, rate: float, quality: str) -> np.ndarray:
+    """librosa相位声码器，high档位使用一半的帧移"""
+    hop_length = 256 if quality == "high" else 512
+    audio = np.asarray(audio, dtype=np.float32)
+    # librosa按最后一维为时间轴处理多声道
+    stretched = librosa.effects.time_stretch(audio.T, rate=rate, n_fft=2048, hop_length=hop_length)
+    return stretched.T
+
+
+def stretch_to_duration(audio: np.ndarray, sample_rate: int, target_duration: float,
+                        quality: str = TIME_STRETCH_QUALITY) -> np.ndarray:
+    """
+    把音频调整到target_duration秒（保持音高）
+
+    不需要调整或调整失败时返回原音频
+    """
+    duration = len(audio) / sample_rate
+    if not needs_stretch(duration, target_duration):
+        return audio
+    rate = duration / target_duration
+    try:
+        if quality in ("standard", "high") and librosa is not None:
+            stretched = phase_vocoder_stretch(audio, rate, quality)
+        else:
+            stretched = wsola_stretch(audio, rate, sample_rate)
+        return stretched.astype(np.float32, copy=False)
+    except Exception as e:
+        logger.error(f"调整音频时长失败: {e}")
+        return audio
+
+
+def get_time_stretch_pool() -> Optional[ProcessPoolExecutor]:
+    """获取时长调整进程池，TIME_STRETCH_WORKERS为0时返回None"""
+    global _pool
+    if TIME_STRETCH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # 使用spawn，避免fork已加载模型和推理线程的Web进程
+            _pool = ProcessPoolExecutor(max_workers=TIME_STRETCH_WORKERS, mp_context=mp.get_context("spawn"))
+            logger.info(f"时长调整进程池已启动，{TIME_STRETCH_WORKERS} 个进程，质量档位: {TIME_STRETCH_QUALITY}")
+        return _pool
+
+
+def shutdown_time_stretch_pool(wait: bool = False) -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+class PendingAudio:
+    """
+    按顺序等待的片段：已就绪的音频或进程池中的调整任务
+
+    工作进程异常退出时返回未调整的原音频，不影响整个任务
+    """
+
+    def __init__(self, audio: np.ndarray, future: Optional[Future] = None):
+        self._audio = audio
+        self._future = future
+
+    def result(self) -> np.ndarray:
+        if self._future is None:
+            return self._audio
+        try:
+            return self._future.result()
+        except Exception as e:
+            logger.error(f"调整音频时长失败，使用原音频: {e}")
+            return self._audio
+
+
+def stretch_async(audio: np.ndarray, sample_rate: int, target_duration: float,
+                  quality: str = TIME_STRETCH_QUALITY) -> PendingAudio:
+    """
+    提交时长调整，立即返回
+
+    不需要调整的片段不经过进程池；进程池不可用时在当前线程中处理
+    """
+    if not needs_stretch(len(audio) / sample_rate, target_duration):
+        return PendingAudio(audio)
+    pool = get_time_stretch_pool()
+    if pool is not None:
+        try:
+            return PendingAudio(audio, pool.submit(stretch_to_duration, audio, sample_rate,
+                                                   target_duration, quality))
+        except Exception as e:
+            # 进程池已损坏（工作进程被杀死等），下次使用时重新创建
+            logger.warning(f"时长调整进程池不可用，在当前线程中处理: {e}")
+            shutdown_time_stretch_pool()
+    return PendingAudio(stretch_to_duration(audio, sample_rate, target_duration, quality))
@@ -0,0 +1,98 @@
+"""
+流式WAV输出工具，用于边合成边返回音频
+
+响应不再先把整段音频拼接、写入内存缓冲区或临时文件：先输出WAV文件头，
+再逐块输出16位PCM数据，峰值内存为一个句子（或一个数据块）的音频。
+总长度已知时文件头写入实际长度，否则使用流式长度占位值。
+"""
+
+import struct
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+import numpy as np
+
+# 流式输出时长度未知，RIFF和data块大小使用该占位值（多数播放器按流处理）
+STREAMING_SIZE = 0xFFFFFFFF
+# 把整段音频分块输出时每块的采样点数
+STREAM_BLOCK_SAMPLES = 64 * 1024
+
+
+def wav_header(sample_rate: int, num_channels: int = 1, bits_per_sample: int = 16,
+               data_size: int = STREAMING_SIZE) -> bytes:
+    """
+    生成44字节的PCM WAV文件头
+
+    参数:
+        sample_rate: 采样率
+        num_channels: 声道数
+        bits_per_sample: 位深
+        data_size: 音频数据字节数，未知时使用STREAMING_SIZE
+
+    返回:
+        WAV文件头字节串
+    """
+    block_align = num_channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+    riff_size = STREAMING_SIZE if data_size == STREAMING_SIZE else min(36 + data_size, STREAMING_SIZE)
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, num_channels, sample_rate, byte_rate, block_align, bits_per_sample,
+        b"data", data_size,
+    )
+
+
+def to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """将模型输出的音频转换为int16，浮点数据按[-1, 1]缩放"""
+    if audio.dtype == np.int16:
+        return audio
+    if np.issubdtype(audio.dtype, np.floating):
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    return audio.astype(np.int16)
+
+
+def wav_size(num_samples: int, num_channels: int = 1, bits_per_sample: int = 16) -> int:
+    """已知采样点数时WAV文件的总字节数，用于Content-Length"""
+    return 44 + num_samples * num_channels * bits_per_sample // 8
+
+
+def iter_audio_blocks(audio: np.ndarray, block_samples: int = STREAM_BLOCK_SAMPLES) -> Iterator[np.ndarray]:
+    """把整段音频切分为数据块，避免一次性转换出整段int16副本"""
+    audio = np.asarray(audio).reshape(-1)
+    for start in range(0, len(audio), block_samples):
+        yield audio[start:start + block_samples]
+
+
+def iter_wav_stream(sample_rate: int, chunks: Iterable[np.ndarray],
+                    total_samples: Optional[int] = None) -> Iterator[bytes]:
+    """
+    先输出WAV文件头，再逐块输出16位PCM数据
+
+    参数:
+        sample_rate: 采样率
+        chunks: 音频块
+        total_samples: 总采样点数，已知时文件头写入实际长度，否则使用流式长度
+    """
+    data_size = STREAMING_SIZE if total_samples is None else total_samples * 2
+    yield wav_header(sample_rate, data_size=data_size)
+    for chunk in chunks:
+        if chunk is None or len(chunk) == 0:
+            continue
+        yield to_pcm16(np.asarray(chunk).reshape(-1)).tobytes()
+
+
+async def aiter_wav_stream(sample_rate: int, chunks: AsyncIterable[np.ndarray]) -> AsyncIterator[bytes]:
+    """iter_wav_stream的异步版本，用于逐句异步合成的场景，使用流式长度"""
+    yield wav_header(sample_rate)
+    async for chunk in chunks:
+        if chunk is None or len(chunk) == 0:
+            continue
+        yield to_pcm16(np.asarray(chunk).reshape(-1)).tobytes()
+
+
+def iter_pcm_stream(chunks: Iterable[np.ndarray]) -> Iterator[bytes]:
+    """逐块输出不带文件头的16位小端PCM数据"""
+    for chunk in chunks:
+        if chunk is None or len(chunk) == 0:
+            continue
+        yield to_pcm16(np.asarray(chunk).reshape(-1)).tobytes()
@@ -0,0 +1,277 @@
+"""
+声音注册表
+
+合成接口需要把各种形式的声音标识（数据库Voice.id、预置声音序号、预置声音名称）
+解析为可直接用于合成的声音描述：预置声音对应模型的说话人名称，上传声音对应提示音频路径
+和提示文本。注册表在启动时一次性从数据库和模型加载，之后的解析都是内存中的字典查找，
+不再需要数据库查询或模型调用；上传、删除声音时更新对应条目。
+
+解析在请求处理中直接调用，因此首次使用时的自动加载只读取数据库，不会为了获取预置声音
+而加载模型或等待推理池；模型的预置说话人由启动流程（模型就绪后）调用build()加入，
+或在当前进程内的模型已加载时自动补充。
+"""
+
+import os
+import sys
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 上传声音文件目录
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+
+# 上传声音缺少提示文本时使用的默认文本
+DEFAULT_PROMPT_TEXT = "这是一段示例语音。"
+
+
+@dataclass(frozen=True)
+class VoiceDescriptor:
+    """解析后的声音描述"""
+    id: Optional[int]                   # 数据库Voice.id，模型自带但未导入数据库的预置声音为None
+    name: str
+    is_preset: bool
+    user_id: Optional[int] = None
+    speaker: Optional[str] = None       # 预置声音的模型说话人名称
+    filename: Optional[str] = None      # 上传声音的文件名
+    prompt_audio: Optional[str] = None  # 上传声音的提示音频完整路径
+    prompt_text: Optional[str] = None   # 上传声音的提示文本
+
+    @property
+    def synthesis_voice_id(self) -> Any:
+        """传给CosyVoiceHelper的voice_id：预置声音为说话人名称，上传声音为数据库ID"""
+        return self.speaker if self.is_preset else self.id
+
+
+def _describe(voice) -> VoiceDescriptor:
+    """由数据库Voice记录生成声音描述"""
+    if voice.is_preset:
+        return VoiceDescriptor(
+            id=voice.id,
+            name=voice.name,
+            is_preset=True,
+            user_id=voice.user_id,
+            speaker=voice.name,
+        )
+    return VoiceDescriptor(
+        id=voice.id,
+        name=voice.name,
+        is_preset=False,
+        user_id=voice.user_id,
+        filename=voice.filename,
+        prompt_audio=os.path.join(UPLOAD_DIR, voice.filename) if voice.filename else None,
+        prompt_text=voice.transcript or DEFAULT_PROMPT_TEXT,
+    )
+
+
+def _loaded_model_presets() -> Optional[List[str]]:
+    """当前进程内已加载模型的预置说话人，模型未加载时返回None（不触发导入或加载）"""
+    module = sys.modules.get(f"{__package__}.cosyvoice_helper")
+    helper = getattr(getattr(module, "CosyVoiceHelper", None), "_instance", None)
+    if helper is None or getattr(helper, "model", None) is None:
+        return None
+    try:
+        return list(helper._get_preset_voices())
+    except Exception as e:
+        logger.warning(f"获取模型预置声音失败: {e}")
+        return None
+
+
+class VoiceRegistry:
+    """
+    声音注册表
+
+    以数据库ID、预置声音名称和预置声音序号（从1开始，对应模型的说话人列表）建立索引。
+    首次使用前未调用build()时自动加载（只读数据库）；invalidate()后下次使用时重新加载。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id: Dict[int, VoiceDescriptor] = {}
+        self._presets: Dict[str, VoiceDescriptor] = {}
+        self._preset_names: List[str] = []
+        self._loaded = False
+        # 预置声音序号是否已按模型的说话人列表建立
+        self._model_presets = False
+
+    def build(self, db=None, preset_names: Optional[List[str]] = None, query_model: bool = True) -> None:
+        """
+        从数据库和模型加载所有声音
+
+        参数:
+            db: 数据库会话，为None时自动创建
+            preset_names: 模型的预置说话人列表，为None时通过CosyVoiceHelper获取
+            query_model: 为False时不调用模型（可能加载模型或等待推理池），
+                         预置声音使用数据库中的记录和已获取过的模型说话人列表
+        """
+        if preset_names is None and query_model:
+            try:
+                from .inference_pool import call_helper
+                preset_names = list(call_helper("get_preset_voices"))
+            except Exception as e:
+                logger.warning(f"获取模型预置声音失败，仅使用数据库中的预置声音: {e}")
+                preset_names = None
+        elif preset_names is None and self._model_presets:
+            # 重新加载时沿用已获取的模型说话人列表
+            with self._lock:
+                preset_names = list(self._preset_names)
+
+        from .models import models
+        own_session = db is None
+        if own_session:
+            from .database import SessionLocal
+            db = SessionLocal()
+        try:
+            voices = db.query(models.Voice).all()
+        finally:
+            if own_session:
+                db.close()
+
+        by_id = {}
+        presets = {}
+        for voice in voices:
+            descriptor = _describe(voice)
+            by_id[voice.id] = descriptor
+            if descriptor.is_preset:
+                presets.setdefault(descriptor.name, descriptor)
+
+        model_presets = preset_names is not None
+        if preset_names is None:
+            preset_names = list(presets)
+        for name in preset_names:
+            # 模型自带但尚未导入数据库的预置声音
+            presets.setdefault(name, VoiceDescriptor(id=None, name=name, is_preset=True, speaker=name))
+
+        with self._lock:
+            self._by_id = by_id
+            self._presets = presets
+            self._preset_names = list(preset_names)
+            self._model_presets = model_presets
+            self._loaded = True
+        logger.info(f"声音注册表已加载: {len(by_id)} 个数据库声音, {len(preset_names)} 个预置声音")
+
+    def _add_model_presets(self, preset_names: List[str]) -> None:
+        """按模型的说话人列表补充预置声音和序号"""
+        with self._lock:
+            presets = dict(self._presets)
+            for name in preset_names:
+                presets.setdefault(name, VoiceDescriptor(id=None, name=name, is_preset=True, speaker=name))
+            self._presets = presets
+            self._preset_names = list(preset_names)
+            self._model_presets = True
+        logger.info(f"声音注册表已加入模型的 {len(preset_names)} 个预置声音")
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    # 在请求处理中调用，只读数据库，不加载模型
+                    self.build(query_model=False)
+        if not self._model_presets:
+            preset_names = _loaded_model_presets()
+            if preset_names is not None:
+                self._add_model_presets(preset_names)
+
+    def invalidate(self) -> None:
+        """标记注册表失效，下次使用时重新加载"""
+        with self._lock:
+            self._loaded = False
+
+    def upsert(self, voice) -> VoiceDescriptor:
+        """新增或更新一条数据库声音记录"""
+        descriptor = _describe(voice)
+        with self._lock:
+            self._by_id[voice.id] = descriptor
+            if descriptor.is_preset:
+                self._presets[descriptor.name] = descriptor
+        return descriptor
+
+    def remove(self, voice_id: int) -> None:
+        """删除一条数据库声音记录"""
+        with self._lock:
+            descriptor = self._by_id.pop(voice_id, None)
+            if descriptor is not None and descriptor.is_preset:
+                self._presets.pop(descriptor.name, None)
+
+    def get(self, voice_id: int) -> Optional[VoiceDescriptor]:
+        """按数据库ID查找；注册表中没有时（如由其他进程新增）查询一次数据库"""
+        self._ensure_loaded()
+        descriptor = self._by_id.get(voice_id)
+        if descriptor is not None:
+            return descriptor
+
+        from .database import SessionLocal
+        from .models import models
+        db = SessionLocal()
+        try:
+            voice = db.query(models.Voice).filter(models.Voice.id == voice_id).first()
+        finally:
+            db.close()
+        return self.upsert(voice) if voice else None
+
+    def get_preset(self, name: str) -> Optional[VoiceDescriptor]:
+        """按名称查找预置声音"""
+        self._ensure_loaded()
+        return self._presets.get(name)
+
+    def get_preset_by_index(self, index: int) -> Optional[VoiceDescriptor]:
+        """按序号（从1开始）查找模型预置声音"""
+        self._ensure_loaded()
+        if 0 < index <= len(self._preset_names):
+            return self._presets.get(self._preset_names[index - 1])
+        return None
+
+    def resolve(self, ref: Any, is_preset: Optional[bool] = None) -> Optional[VoiceDescriptor]:
+        """
+        解析声音标识
+
+        参数:
+            ref: 数据库ID、预置声音序号或预置声音名称
+            is_preset: True时数字按预置声音序号解析；False时只按数据库ID解析；
+                       None时数字按数据库ID解析，其他按预置声音名称解析
+        """
+        ref = str(ref).strip()
+        if is_preset:
+            if ref.isdigit():
+                return self.get_preset_by_index(int(ref))
+            return self.get_preset(ref)
+        if ref.isdigit():
+            return self.get(int(ref))
+        if is_preset is None:
+            return self.get_preset(ref)
+        return None
+
+    def resolve_preset(self, ref: Any) -> Optional[VoiceDescriptor]:
+        """
+        解析前端传来的预置声音标识
+
+        前端的预置声音选项使用数据库Voice.id，因此数字先按预置声音的数据库ID解析，
+        找不到时再按模型预置声音序号解析；其他按预置声音名称解析。
+        """
+        ref = str(ref).strip()
+        if ref.isdigit():
+            voice = self.get(int(ref))
+            if voice is not None and voice.is_preset:
+                return voice
+            return self.get_preset_by_index(int(ref))
+        return self.get_preset(ref)
+
+    @property
+    def preset_names(self) -> List[str]:
+        """模型预置声音名称列表（顺序即预置声音序号）"""
+        self._ensure_loaded()
+        return list(self._preset_names)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "voices": len(self._by_id),
+                "presets": len(self._presets),
+            }
+
+
+# 进程内共享的注册表实例
+voice_registry = VoiceRegistry()
@@ -0,0 +1,116 @@
+"""
+模型预热与就绪状态
+
+模型加载完成后，首次推理仍要承担内存分配、算子实现选择、各级缓存填充等一次性开销。
+启动时在后台加载模型，并用每个预置声音合成若干预热文本，完成前 /api/ready 返回503，
+推理接口也返回503提示客户端稍后重试；登录、管理等不依赖模型的接口不受影响。
+
+启动各阶段（导入、模型加载、声音注册表、预热）的耗时记录在 startup_report 中。
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+# 是否在启动时预热模型
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") != "0"
+# 预热文本，以 | 分隔
+WARMUP_TEXTS = [
+    text.strip()
+    for text in os.environ.get(
+        "WARMUP_TEXTS", "你好，欢迎使用语音合成服务。|同学们好，今天我们来学习新的知识，请大家认真听讲。"
+    ).split("|")
+    if text.strip()
+]
+# 预热的预置声音数，为0时预热全部预置声音
+WARMUP_MAX_VOICES = int(os.environ.get("WARMUP_MAX_VOICES", "0"))
+# 模型加载期间推理接口返回的Retry-After秒数
+NOT_READY_RETRY_AFTER = 10
+
+
+def warm_up_helper(helper) -> Dict[str, Any]:
+    """按配置预热CosyVoiceHelper，返回预热统计"""
+    return helper.warm_up(WARMUP_TEXTS, max_voices=WARMUP_MAX_VOICES)
+
+
+class StartupReport:
+    """记录启动各阶段的耗时和模型就绪状态"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: "OrderedDict[str, float]" = OrderedDict()
+        self._ready = threading.Event()
+        self.error: Optional[str] = None
+        self.details: Dict[str, Any] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个启动阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._phases[name] = round(seconds, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def mark_ready(self) -> None:
+        self._ready.set()
+        self.log_summary()
+
+    def mark_failed(self, error: Exception) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        logger.error(f"模型启动失败: {self.error}")
+        self.log_summary()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = dict(self._phases)
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "phases": phases,
+            "total": round(sum(phases.values()), 3),
+            **self.details,
+        }
+
+    def log_summary(self) -> None:
+        report = self.as_dict()
+        phases = "，".join(f"{name} {seconds:.2f}s" for name, seconds in report["phases"].items())
+        logger.info(f"启动耗时: {phases}（共 {report['total']:.2f}s），模型就绪: {report['ready']}")
+
+
+startup_report = StartupReport()
+
+
+def ensure_model_ready() -> None:
+    """模型尚未加载或预热完成时抛出503"""
+    if startup_report.ready:
+        return
+    if startup_report.error:
+        message = f"语音模型加载失败: {startup_report.error}"
+    else:
+        message = "语音模型正在加载，请稍后重试"
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=message,
+        headers={"Retry-After": str(NOT_READY_RETRY_AFTER)},
+    )
+
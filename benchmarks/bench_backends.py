@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+推理后端基准测试：在相同文本上对比各后端的实时率(RTF)
+
+用法:
+    python benchmarks/bench_backends.py --backends eager torchscript onnxruntime --runs 3
+    python benchmarks/bench_backends.py --intra-op 8 --voice 中文女
+"""
+
+import gc
+import os
+import sys
+import time
+import argparse
+import logging
+
+# 基准测试需要每次真实推理，关闭合成音频缓存和请求去重
+os.environ["AUDIO_CACHE_ENABLED"] = "0"
+os.environ["SFT_DEDUP_ENABLED"] = "0"
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+BENCH_TEXTS = [
+    "同学们好，今天我们来学习光合作用。",
+    "光合作用是绿色植物利用光能，把二氧化碳和水转化成储存能量的有机物，并且释放出氧气的过程。",
+    "请大家思考一下，为什么植物在夜晚不能进行光合作用？",
+    "这个过程主要发生在叶绿体中，叶绿体里含有叶绿素，能够吸收太阳光，为后续的暗反应提供能量物质。",
+]
+
+
+def bench_backend(backend: str, args) -> dict:
+    from ai_voice_server.cosyvoice_helper import CosyVoiceHelper, SYNTHESIS_SEED
+    from cosyvoice.utils.common import set_all_random_seed
+
+    # CosyVoiceHelper是单例，每个后端重新创建一个实例
+    CosyVoiceHelper._instance = None
+    helper = CosyVoiceHelper(model_dir=args.model_dir, backend=backend)
+    if helper.backend != backend:
+        print(f"{backend:>12}: 不可用（回退到 {helper.backend}），跳过")
+        return {}
+
+    voice = args.voice or helper.get_preset_voices()[0]
+    # 预热，排除首次推理的初始化开销
+    set_all_random_seed(SYNTHESIS_SEED)
+    helper._inference_sft_chunk(BENCH_TEXTS[0], voice)
+
+    elapsed_total = 0.0
+    audio_total = 0.0
+    for _ in range(args.runs):
+        for text in BENCH_TEXTS:
+            set_all_random_seed(SYNTHESIS_SEED)
+            start = time.perf_counter()
+            audio = helper._inference_sft_chunk(text, voice)
+            elapsed_total += time.perf_counter() - start
+            audio_total += len(audio) / helper.sample_rate
+
+    result = {"elapsed": elapsed_total, "audio": audio_total, "rtf": elapsed_total / audio_total}
+    print(f"{backend:>12}: 耗时 {elapsed_total:.2f}s, 音频 {audio_total:.2f}s, RTF {result['rtf']:.3f}")
+
+    del helper
+    CosyVoiceHelper._instance = None
+    gc.collect()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比eager/TorchScript/ONNX Runtime后端的实时率")
+    parser.add_argument("--backends", nargs="+", default=["eager", "torchscript", "onnxruntime"])
+    parser.add_argument("--voice", help="预置声音名称，默认使用第一个预置声音")
+    parser.add_argument("--runs", type=int, default=3, help="每个后端重复合成测试文本的轮数")
+    parser.add_argument("--model-dir", help="模型目录")
+    parser.add_argument("--intra-op", type=int, default=0, help="算子内线程数，0为默认值")
+    parser.add_argument("--inter-op", type=int, default=0, help="算子间线程数，0为默认值")
+    args = parser.parse_args()
+
+    # 线程配置在导入推理模块时读取
+    os.environ["INFERENCE_INTRA_OP_THREADS"] = str(args.intra_op)
+    os.environ["INFERENCE_INTER_OP_THREADS"] = str(args.inter_op)
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    for backend in args.backends:
+        result = bench_backend(backend, args)
+        if result:
+            results[backend] = result
+
+    baseline = results.get("eager")
+    if baseline:
+        print()
+        for backend, result in results.items():
+            print(f"{backend:>12}: 相对eager加速 {baseline['rtf'] / result['rtf']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
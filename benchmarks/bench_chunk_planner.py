@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+分块规划基准测试
+
+--calibrate: 用不同token数的文本块测量单块合成耗时，拟合“分块长度-耗时”曲线，
+             写入 <模型目录>/chunk_curve.json（或CHUNK_CURVE_PATH），服务启动时据此选择分块大小
+默认模式:    对同一文档分别按固定70字符和按token规划分块合成，对比块数、耗时和实时率
+
+用法:
+    python benchmarks/bench_chunk_planner.py --calibrate --runs 3
+    python benchmarks/bench_chunk_planner.py --chars 2000 --mixed
+    python benchmarks/bench_chunk_planner.py --text-file lecture.txt --runs 2
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import statistics
+
+# 基准测试需要每次真实推理，关闭合成音频缓存和请求去重
+os.environ["AUDIO_CACHE_ENABLED"] = "0"
+os.environ["SFT_DEDUP_ENABLED"] = "0"
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from ai_voice_server.cosyvoice_helper import CosyVoiceHelper, SYNTHESIS_SEED
+from ai_voice_server.utils.chunk_planner import (
+    ChunkPlanner, save_curve, optimal_chunk_tokens, CHUNK_CURVE_PATH, CURVE_FILENAME
+)
+from ai_voice_server.utils.text_splitter import split_text, MAX_TEXT_LENGTH
+from cosyvoice.utils.common import set_all_random_seed
+
+SAMPLE_PASSAGE = (
+    "同学们好，今天我们来学习光合作用。光合作用是绿色植物利用光能，把二氧化碳和水转化成储存能量的有机物，"
+    "并且释放出氧气的过程。这个过程主要发生在叶绿体中，叶绿体里含有叶绿素，能够吸收太阳光。"
+    "光合作用可以分为光反应和暗反应两个阶段。在光反应阶段，水被分解，产生氧气，同时生成能量物质；"
+    "在暗反应阶段，二氧化碳被固定，最终合成糖类。请大家思考一下，为什么植物在夜晚不能进行光合作用？"
+)
+MIXED_PASSAGE = (
+    "今天我们学习 Python 中的 list comprehension。它可以用一行代码生成列表，"
+    "for example, squares = [x * x for x in range(10)]. 和普通的 for 循环相比，代码更加简洁。"
+    "In machine learning, we often use NumPy arrays instead of lists for better performance. "
+    "请注意，过于复杂的推导式会降低可读性。"
+)
+CALIBRATION_TOKENS = (10, 20, 40, 60, 80, 100, 120)
+
+
+def build_text(passage: str, chars: int) -> str:
+    text = ""
+    while len(text) < chars:
+        text += passage
+    return text[:chars]
+
+
+def text_with_tokens(planner: ChunkPlanner, tokens: int) -> str:
+    """从示例文本中截取约有指定token数的片段"""
+    source = build_text(SAMPLE_PASSAGE, tokens * 4)
+    low, high = 1, len(source)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if planner.count_tokens(source[:mid]) <= tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return source[:low]
+
+
+def calibrate(helper: CosyVoiceHelper, voice: str, args) -> None:
+    planner = helper.chunk_planner
+    points = []
+    print(f"{'tokens':>8} {'耗时(s)':>10} {'ms/token':>10}")
+    for tokens in CALIBRATION_TOKENS:
+        text = text_with_tokens(planner, tokens)
+        actual = planner.count_tokens(text)
+        times = []
+        for _ in range(args.runs):
+            set_all_random_seed(SYNTHESIS_SEED)
+            start = time.perf_counter()
+            helper._inference_sft_chunk(text, voice)
+            times.append(time.perf_counter() - start)
+        seconds = statistics.median(times)
+        points.append((actual, seconds))
+        print(f"{actual:>8} {seconds:>10.3f} {seconds / actual * 1000:>10.1f}")
+
+    path = args.output or CHUNK_CURVE_PATH or os.path.join(helper.model_dir, CURVE_FILENAME)
+    data = save_curve(path, points, model_type=helper.model_type, backend=helper.backend,
+                      quantized=",".join(helper.quantized))
+    a, b, c = data["coefficients"]
+    best = optimal_chunk_tokens(data["coefficients"], 1, planner.max_tokens)
+    print(f"\n耗时 ≈ {a:.3f} + {b * 1000:.2f}ms·n + {c * 1e6:.3f}µs·n²")
+    print(f"最优分块长度: {best} tokens（上限 {planner.max_tokens}），曲线已写入 {path}")
+
+
+def run_document(helper: CosyVoiceHelper, text: str, voice: str, max_chunk_length) -> tuple:
+    set_all_random_seed(SYNTHESIS_SEED)
+    start = time.perf_counter()
+    result = helper._synthesize_long_text_inner(text, voice, max_chunk_length)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(result["audio_data"]) / result["sample_rate"]
+
+
+def compare(helper: CosyVoiceHelper, voice: str, args) -> None:
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = build_text(MIXED_PASSAGE if args.mixed else SAMPLE_PASSAGE, args.chars)
+
+    sentences = split_text(text)
+    planner = helper.chunk_planner
+    modes = (("fixed-70", MAX_TEXT_LENGTH), ("planner", None))
+    print(f"文本长度: {len(text)} 字符，{planner.count_tokens(text)} tokens，"
+          f"分块目标: {planner.target_tokens} tokens\n")
+
+    results = {}
+    for mode, max_chunk_length in modes:
+        chunks = helper._plan_chunks(sentences, max_chunk_length)
+        sizes = [planner.count_tokens(chunk) for chunk in chunks]
+        times = []
+        for _ in range(args.runs):
+            elapsed, duration = run_document(helper, text, voice, max_chunk_length)
+            times.append(elapsed)
+        best = min(times)
+        results[mode] = best
+        print(f"{mode:>10}: {len(chunks):>4} 块，tokens/块 {statistics.mean(sizes):.1f}"
+              f"（{min(sizes)}-{max(sizes)}），耗时 {best:.2f}s，RTF {best / duration:.3f}，"
+              f"{len(text) / best:.1f} 字符/秒")
+
+    print(f"\n吞吐提升: {results['fixed-70'] / results['planner']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校准分块耗时曲线，对比固定字符分块与按token规划分块")
+    parser.add_argument("--calibrate", action="store_true", help="测量分块耗时曲线并写入JSON")
+    parser.add_argument("--output", help="曲线文件路径，默认 <模型目录>/chunk_curve.json")
+    parser.add_argument("--chars", type=int, default=1500, help="对比模式的文本长度（字符数）")
+    parser.add_argument("--mixed", action="store_true", help="对比模式使用中英混合文本")
+    parser.add_argument("--text-file", help="从文件读取对比文本，优先于--chars")
+    parser.add_argument("--voice", help="预置声音名称，默认使用第一个预置声音")
+    parser.add_argument("--runs", type=int, default=3, help="每项测量的重复次数")
+    parser.add_argument("--model-dir", help="模型目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    helper = CosyVoiceHelper(model_dir=args.model_dir)
+    voice = args.voice or helper.get_preset_voices()[0]
+    print(f"模型: {helper.model_type}, 声音: {voice}")
+
+    # 预热，排除首次推理的初始化开销
+    set_all_random_seed(SYNTHESIS_SEED)
+    helper._inference_sft_chunk(SAMPLE_PASSAGE[:40], voice)
+
+    if args.calibrate:
+        calibrate(helper, voice, args)
+    else:
+        compare(helper, voice, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+长文本合成基准测试：对比逐块合成与流水线合成的耗时
+
+用法:
+    python benchmarks/bench_long_text.py --chars 1200 --voice 中文女 --runs 3
+    python benchmarks/bench_long_text.py --text-file lecture.txt
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+# 基准测试需要每次真实推理，关闭合成音频缓存
+os.environ["AUDIO_CACHE_ENABLED"] = "0"
+os.environ["SFT_DEDUP_ENABLED"] = "0"
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from ai_voice_server.cosyvoice_helper import CosyVoiceHelper, SYNTHESIS_SEED
+from cosyvoice.utils.common import set_all_random_seed
+
+SAMPLE_PASSAGE = (
+    "同学们好，今天我们来学习光合作用。光合作用是绿色植物利用光能，把二氧化碳和水转化成储存能量的有机物，"
+    "并且释放出氧气的过程。这个过程主要发生在叶绿体中，叶绿体里含有叶绿素，能够吸收太阳光。"
+    "光合作用可以分为光反应和暗反应两个阶段。在光反应阶段，水被分解，产生氧气，同时生成能量物质；"
+    "在暗反应阶段，二氧化碳被固定，最终合成糖类。请大家思考一下，为什么植物在夜晚不能进行光合作用？"
+)
+
+
+def build_text(chars: int) -> str:
+    text = ""
+    while len(text) < chars:
+        text += SAMPLE_PASSAGE
+    return text[:chars]
+
+
+def run_once(helper: CosyVoiceHelper, text: str, voice: str, pipelined: bool) -> tuple:
+    # 切换流水线：None表示按需创建，False表示禁用
+    helper._long_text_pipeline = None if pipelined else False
+    set_all_random_seed(SYNTHESIS_SEED)
+    start = time.perf_counter()
+    result = helper._synthesize_long_text_inner(text, voice)
+    elapsed = time.perf_counter() - start
+    duration = len(result["audio_data"]) / result["sample_rate"]
+    return elapsed, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长文本逐块合成与流水线合成的耗时对比")
+    parser.add_argument("--chars", type=int, default=1200, help="合成文本长度（字符数）")
+    parser.add_argument("--text-file", help="从文件读取合成文本，优先于--chars")
+    parser.add_argument("--voice", help="预置声音名称，默认使用第一个预置声音")
+    parser.add_argument("--runs", type=int, default=3, help="每种模式的运行次数")
+    parser.add_argument("--model-dir", help="模型目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = build_text(args.chars)
+
+    helper = CosyVoiceHelper(model_dir=args.model_dir)
+    voice = args.voice or helper.get_preset_voices()[0]
+    print(f"模型: {helper.model_type}, 声音: {voice}, 文本长度: {len(text)} 字符")
+
+    # 预热，排除首次推理的初始化开销
+    run_once(helper, SAMPLE_PASSAGE[:40], voice, pipelined=False)
+
+    results = {}
+    for mode, pipelined in (("sequential", False), ("pipelined", True)):
+        times = []
+        for i in range(args.runs):
+            elapsed, duration = run_once(helper, text, voice, pipelined)
+            times.append(elapsed)
+            print(f"{mode:>10} 第{i + 1}次: {elapsed:.2f}s, 音频 {duration:.2f}s, RTF {elapsed / duration:.3f}")
+        results[mode] = min(times)
+
+    speedup = results["sequential"] / results["pipelined"]
+    print(f"\n最佳耗时 逐块: {results['sequential']:.2f}s, 流水线: {results['pipelined']:.2f}s, 加速比: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+int8量化基准测试：对比fp32与动态int8量化的实时率(RTF)和合成质量
+
+质量指标（LLM按随机采样生成语音token，量化后无法逐点比较波形）:
+    - 说话人相似度：两段音频的CAM++说话人向量的余弦相似度
+    - 频谱相似度：两段音频平均对数幅度谱的余弦相似度
+    - 时长比：int8音频时长 / fp32音频时长
+
+用法:
+    python benchmarks/bench_quantization.py --quantize llm --runs 2
+    python benchmarks/bench_quantization.py --quantize llm,flow --voice 中文女
+"""
+
+import gc
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+# 基准测试需要每次真实推理，关闭合成音频缓存和请求去重
+os.environ["AUDIO_CACHE_ENABLED"] = "0"
+os.environ["SFT_DEDUP_ENABLED"] = "0"
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import torch
+import torchaudio
+
+from ai_voice_server.cosyvoice_helper import CosyVoiceHelper, SYNTHESIS_SEED
+from cosyvoice.utils.common import set_all_random_seed
+
+BENCH_TEXTS = [
+    "同学们好，今天我们来学习光合作用。",
+    "光合作用是绿色植物利用光能，把二氧化碳和水转化成储存能量的有机物，并且释放出氧气的过程。",
+    "请大家思考一下，为什么植物在夜晚不能进行光合作用？",
+    "这个过程主要发生在叶绿体中，叶绿体里含有叶绿素，能够吸收太阳光，为后续的暗反应提供能量物质。",
+]
+
+
+def run_variant(quantize: str, args) -> dict:
+    """用指定的量化配置加载模型，合成全部测试文本"""
+    # CosyVoiceHelper是单例，每种配置重新创建一个实例
+    CosyVoiceHelper._instance = None
+    start = time.perf_counter()
+    helper = CosyVoiceHelper(model_dir=args.model_dir, quantize=quantize)
+    load_time = time.perf_counter() - start
+
+    voice = args.voice or helper.get_preset_voices()[0]
+    set_all_random_seed(SYNTHESIS_SEED)
+    helper._inference_sft_chunk(BENCH_TEXTS[0], voice)
+
+    audios = []
+    elapsed_total = 0.0
+    for run in range(args.runs):
+        for text in BENCH_TEXTS:
+            set_all_random_seed(SYNTHESIS_SEED)
+            start = time.perf_counter()
+            audio = helper._inference_sft_chunk(text, voice)
+            elapsed_total += time.perf_counter() - start
+            if run == 0:
+                audios.append(audio)
+
+    audio_total = sum(len(audio) for audio in audios) / helper.sample_rate * args.runs
+    result = {
+        "helper": helper,
+        "quantized": list(helper.quantized),
+        "load_time": load_time,
+        "rtf": elapsed_total / audio_total,
+        "audios": audios,
+        "sample_rate": helper.sample_rate,
+    }
+    return result
+
+
+def speaker_embedding(helper: CosyVoiceHelper, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    speech = torch.from_numpy(audio.astype(np.float32)).unsqueeze(0)
+    speech_16k = torchaudio.functional.resample(speech, sample_rate, 16000)
+    embedding = helper.model.frontend._extract_spk_embedding(speech_16k)
+    return embedding.reshape(-1).cpu().numpy()
+
+
+def mean_log_spectrum(audio: np.ndarray, n_fft: int = 1024, hop: int = 256) -> np.ndarray:
+    frames = np.lib.stride_tricks.sliding_window_view(audio.astype(np.float32), n_fft)[::hop]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=1))
+    return np.log(spectrum + 1e-6).mean(axis=0)
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比fp32与动态int8量化的速度和合成质量")
+    parser.add_argument("--quantize", default="llm", help="量化的模块：llm 或 llm,flow")
+    parser.add_argument("--voice", help="预置声音名称，默认使用第一个预置声音")
+    parser.add_argument("--runs", type=int, default=2, help="每种配置重复合成测试文本的轮数")
+    parser.add_argument("--model-dir", help="模型目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    fp32 = run_variant("", args)
+    # fp32的音频在释放模型前计算说话人向量
+    fp32_embeddings = [speaker_embedding(fp32["helper"], audio, fp32["sample_rate"]) for audio in fp32["audios"]]
+    del fp32["helper"]
+    CosyVoiceHelper._instance = None
+    gc.collect()
+
+    int8 = run_variant(args.quantize, args)
+    if not int8["quantized"]:
+        print("量化未生效，请检查日志")
+        return
+
+    print(f"{'':>6} {'加载耗时':>8} {'RTF':>8}")
+    print(f"{'fp32':>6} {fp32['load_time']:>9.2f}s {fp32['rtf']:>8.3f}")
+    print(f"{'int8':>6} {int8['load_time']:>9.2f}s {int8['rtf']:>8.3f}  ({','.join(int8['quantized'])})")
+    print(f"加速比: {fp32['rtf'] / int8['rtf']:.2f}x\n")
+
+    print(f"{'文本':>4} {'说话人相似度':>10} {'频谱相似度':>10} {'时长比':>8}")
+    for i, (ref, out) in enumerate(zip(fp32["audios"], int8["audios"])):
+        speaker_sim = cosine(fp32_embeddings[i], speaker_embedding(int8["helper"], out, int8["sample_rate"]))
+        spectrum_sim = cosine(mean_log_spectrum(ref), mean_log_spectrum(out))
+        print(f"{i + 1:>4} {speaker_sim:>14.4f} {spectrum_sim:>13.4f} {len(out) / len(ref):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
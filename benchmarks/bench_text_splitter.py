@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+文本切分与分块基准测试
+
+对生成的中文、英文、中英混合语料（1KB - 10MB）测量:
+    - split_text / iter_sentences 的切分吞吐量
+    - merge_sentences_into_chunks（按字符）与 ChunkPlanner（按token）的分块吞吐量
+    - 峰值内存分配（tracemalloc）
+    - 块数以及每块长度的分布（最小、P50、P90、最大）
+
+结果写入JSON文件，可用 --compare 与之前提交的结果对比，吞吐量下降或峰值内存增长
+超过 --threshold 时以非0状态退出。不需要加载模型，ChunkPlanner使用估算的token数。
+
+用法:
+    python benchmarks/bench_text_splitter.py --output bench_text.json
+    python benchmarks/bench_text_splitter.py --sizes 1KB,100KB --compare bench_text.json
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from ai_voice_server.utils.text_splitter import (
+    split_text, iter_sentences, merge_sentences_into_chunks, MAX_TEXT_LENGTH
+)
+from ai_voice_server.utils.chunk_planner import ChunkPlanner
+
+DEFAULT_SIZES = "1KB,10KB,100KB,1MB,10MB"
+CORPORA = ("zh", "en", "mixed")
+
+ZH_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+ZH_PUNCT = "，，，。。！？；、"
+EN_WORDS = (
+    "the of and to in is that for it as with was on be by this are from or have an they which one you "
+    "were all we her she there would their will when who him been has more if no out do so can what up "
+    "said about other into than its time only could new them man some these then two first may any like "
+    "photosynthesis chlorophyll energy process carbon dioxide oxygen molecule reaction light plant cell "
+    "students lesson question example function variable network learning model performance"
+).split()
+EN_PUNCT = ", , , . . ! ? ;".split()
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper()
+    for suffix, factor in (("MB", 1024 * 1024), ("KB", 1024), ("B", 1)):
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+
+def zh_sentence(rng: random.Random) -> str:
+    return "".join(rng.choice(ZH_CHARS) for _ in range(rng.randint(4, 30))) + rng.choice(ZH_PUNCT)
+
+
+def en_sentence(rng: random.Random) -> str:
+    words = " ".join(rng.choice(EN_WORDS) for _ in range(rng.randint(3, 18)))
+    return words.capitalize() + rng.choice(EN_PUNCT) + " "
+
+
+def generate_corpus(kind: str, size_bytes: int, seed: int = 0) -> str:
+    """生成约size_bytes字节（UTF-8）的语料，每隔若干句换段"""
+    rng = random.Random(f"{kind}-{seed}")
+    parts = []
+    total = 0
+    while total < size_bytes:
+        if kind == "zh":
+            sentence = zh_sentence(rng)
+        elif kind == "en":
+            sentence = en_sentence(rng)
+        else:
+            sentence = zh_sentence(rng) if rng.random() < 0.6 else en_sentence(rng)
+        if rng.random() < 0.12:
+            sentence += "\n"
+        parts.append(sentence)
+        total += len(sentence.encode("utf-8"))
+    return "".join(parts)
+
+
+def distribution(values) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "p50": ordered[len(ordered) // 2],
+        "p90": ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        "max": ordered[-1],
+        "mean": round(statistics.mean(ordered), 2),
+    }
+
+
+def measure(func, repeat: int) -> tuple:
+    """返回(最佳耗时, 峰值内存分配字节数, 结果)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    # 内存单独测量一次，避免tracemalloc的开销影响计时
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_corpus(text: str, planner: ChunkPlanner, repeat: int) -> dict:
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+    results = {}
+
+    elapsed, peak, sentences = measure(lambda: split_text(text), repeat)
+    results["split_text"] = {"seconds": elapsed, "mb_per_s": size_mb / elapsed, "peak_bytes": peak,
+                             "sentences": distribution([len(s) for s in sentences])}
+
+    paragraphs = text.split("\n")
+    elapsed, peak, _ = measure(lambda: sum(1 for _ in iter_sentences(paragraphs)), repeat)
+    results["iter_sentences"] = {"seconds": elapsed, "mb_per_s": size_mb / elapsed, "peak_bytes": peak}
+
+    elapsed, peak, chunks = measure(lambda: merge_sentences_into_chunks(sentences, MAX_TEXT_LENGTH), repeat)
+    results["merge_chunks"] = {"seconds": elapsed, "mb_per_s": size_mb / elapsed, "peak_bytes": peak,
+                               "chunks": distribution([len(c) for c in chunks])}
+
+    elapsed, peak, planned = measure(lambda: planner.plan(sentences), repeat)
+    results["chunk_planner"] = {"seconds": elapsed, "mb_per_s": size_mb / elapsed, "peak_bytes": peak,
+                                "chunks": distribution([planner.count_tokens(c) for c in planned])}
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """返回超过阈值的退化项"""
+    regressions = []
+    print(f"\n与 {baseline.get('revision') or '基准'} 对比（阈值 {threshold:.0%}）:")
+    for name, benches in current["results"].items():
+        for bench, metrics in benches.items():
+            base = baseline.get("results", {}).get(name, {}).get(bench)
+            if not base:
+                continue
+            speed = metrics["mb_per_s"] / base["mb_per_s"] - 1
+            memory = metrics["peak_bytes"] / max(base["peak_bytes"], 1) - 1
+            flag = ""
+            if speed < -threshold or memory > threshold:
+                flag = "  <-- 退化"
+                regressions.append(f"{name}/{bench}")
+            print(f"  {name:<12} {bench:<15} 吞吐 {speed:+7.1%}  峰值内存 {memory:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本切分与分块基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="语料大小，逗号分隔，如 1KB,1MB")
+    parser.add_argument("--corpora", default=",".join(CORPORA), help="语料类型: zh,en,mixed")
+    parser.add_argument("--repeat", type=int, default=3, help="每项计时的重复次数（取最佳）")
+    parser.add_argument("--output", default="bench_text_splitter.json", help="结果JSON文件")
+    parser.add_argument("--compare", help="对比的基准结果JSON文件")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定退化的相对变化")
+    args = parser.parse_args()
+
+    planner = ChunkPlanner()
+    report = {
+        "revision": git_revision(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": {},
+    }
+
+    print(f"{'语料':<12} {'函数':<15} {'MB/s':>9} {'峰值内存':>12} {'块/句数':>9} {'P50':>6} {'P90':>6}")
+    for kind in args.corpora.split(","):
+        for size in args.sizes.split(","):
+            name = f"{kind}-{size.strip()}"
+            text = generate_corpus(kind, parse_size(size))
+            # 大语料减少重复次数
+            repeat = args.repeat if len(text) < 2 * 1024 * 1024 else 1
+            results = bench_corpus(text, planner, repeat)
+            report["results"][name] = results
+            for bench, metrics in results.items():
+                dist = metrics.get("chunks") or metrics.get("sentences") or {}
+                print(f"{name:<12} {bench:<15} {metrics['mb_per_s']:>9.2f} "
+                      f"{metrics['peak_bytes'] / 1024:>10.0f}KB {dist.get('count', ''):>9} "
+                      f"{dist.get('p50', ''):>6} {dist.get('p90', ''):>6}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"检测到退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
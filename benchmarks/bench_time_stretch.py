@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+声音置换时长调整基准测试
+
+生成与声音置换相近的片段（默认300段，每段1-6秒，目标时长为原时长的0.7-1.4倍），
+分别测量各质量档位在当前线程中逐段处理与进程池并行处理的总耗时。
+不需要加载模型，standard/high档位需要安装librosa。
+
+用法:
+    python benchmarks/bench_time_stretch.py
+    python benchmarks/bench_time_stretch.py --segments 500 --workers 0,2,4 --qualities fast
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from ai_voice_server.utils import time_stretch
+from ai_voice_server.utils.time_stretch import stretch_to_duration, needs_stretch, QUALITY_TIERS
+
+
+def make_segments(count: int, sample_rate: int, seed: int = 0) -> list:
+    """生成带基频变化和音量包络的类语音信号，以及各自的目标时长"""
+    rng = np.random.default_rng(seed)
+    segments = []
+    for _ in range(count):
+        duration = rng.uniform(1.0, 6.0)
+        t = np.arange(int(duration * sample_rate)) / sample_rate
+        f0 = rng.uniform(100, 250) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.5, 3) * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        audio = sum(np.sin(k * phase) / k for k in range(1, 6))
+        audio *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+        audio += 0.01 * rng.standard_normal(len(t))
+        segments.append(((0.2 * audio).astype(np.float32), duration * rng.uniform(0.7, 1.4)))
+    return segments
+
+
+def run(segments, sample_rate: int, quality: str, workers: int) -> float:
+    start = time.perf_counter()
+    if workers <= 0:
+        for audio, target in segments:
+            stretch_to_duration(audio, sample_rate, target, quality)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            # 预热，排除进程启动时间
+            list(pool.map(int, range(workers)))
+            start = time.perf_counter()
+            futures = [pool.submit(stretch_to_duration, audio, sample_rate, target, quality)
+                       for audio, target in segments]
+            for future in futures:
+                future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="时长调整各质量档位与进程数的耗时对比")
+    parser.add_argument("--segments", type=int, default=300, help="片段数")
+    parser.add_argument("--sample-rate", type=int, default=24000, help="采样率")
+    parser.add_argument("--qualities", default=",".join(QUALITY_TIERS), help="质量档位，逗号分隔")
+    parser.add_argument("--workers", default="0,2", help="进程数，逗号分隔，0表示在当前线程中处理")
+    args = parser.parse_args()
+
+    segments = make_segments(args.segments, args.sample_rate)
+    stretched = sum(1 for audio, target in segments if needs_stretch(len(audio) / args.sample_rate, target))
+    total_audio = sum(len(audio) for audio, _ in segments) / args.sample_rate
+    print(f"{args.segments} 个片段，共 {total_audio:.0f} 秒音频，需要调整 {stretched} 个，CPU {os.cpu_count()} 核\n")
+
+    print(f"{'档位':<10} {'进程数':>6} {'耗时(s)':>9} {'ms/片段':>9}")
+    for quality in args.qualities.split(","):
+        if quality != "fast" and time_stretch.librosa is None:
+            print(f"{quality:<10} 未安装librosa，跳过")
+            continue
+        # 首次调用librosa时numba编译，不计入耗时
+        audio, target = segments[0]
+        stretch_to_duration(audio, args.sample_rate, target, quality)
+        for workers in (int(w) for w in args.workers.split(",")):
+            elapsed = run(segments, args.sample_rate, quality, workers)
+            print(f"{quality:<10} {workers:>6} {elapsed:>9.2f} {elapsed / args.segments * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+API进程导入耗时分析
+
+在子进程中以 python -X importtime 导入 ai_voice_server.main（PRELOAD_MODEL=0），
+列出累计耗时最高的模块，并检查torch、moviepy、whisper等重量级模块是否被导入。
+需要在部署环境中运行（main导入时会连接数据库建表）。
+
+用法:
+    python benchmarks/profile_imports.py --top 30
+    python benchmarks/profile_imports.py --check            # 导入了重量级模块时返回非0
+    python benchmarks/profile_imports.py --check --allow librosa
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import json, time\n"
+    "start = time.perf_counter()\n"
+    "import ai_voice_server.main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "from ai_voice_server.utils.lazy_import import imported_heavy_modules\n"
+    "print(json.dumps({'elapsed': elapsed, 'heavy': imported_heavy_modules()}))\n"
+)
+
+
+def parse_importtime(stderr: str) -> list:
+    """解析 -X importtime 的输出，返回 (累计微秒, 自身微秒, 模块名) 列表"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # 表头
+        rows.append((cumulative_us, self_us, fields[2].rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析API进程的导入耗时并检查重量级模块")
+    parser.add_argument("--top", type=int, default=25, help="显示累计耗时最高的模块数")
+    parser.add_argument("--check", action="store_true", help="导入了重量级模块时以非0状态退出")
+    parser.add_argument("--allow", nargs="*", default=[], help="--check时允许导入的重量级模块")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PRELOAD_MODEL="0", INFERENCE_WORKERS="0")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR, env.get("PYTHONPATH")]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                          cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-3000:])
+        sys.exit(proc.returncode)
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(proc.stderr)
+
+    print(f"导入 ai_voice_server.main 耗时 {result['elapsed']:.2f}s，共 {len(rows)} 个模块\n")
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name}")
+
+    heavy = [name for name in result["heavy"] if name not in args.allow]
+    print(f"\n已导入的重量级模块: {', '.join(result['heavy']) or '无'}")
+    if args.check and heavy:
+        print(f"检查失败: API进程启动时导入了 {', '.join(heavy)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
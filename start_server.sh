@@ -23,6 +23,48 @@ export PYTHONPATH=$PYTHONPATH:~/ai_voice_demo:~/CosyVoice:~/CosyVoice/third_part
 # 添加环境变量来控制是否预加载模型(可选)
 export PRELOAD_MODEL=${PRELOAD_MODEL:-1}
 
+# 推理工作进程数量，每个进程持有一份模型副本(0表示在Web进程内直接推理)
+export INFERENCE_WORKERS=${INFERENCE_WORKERS:-0}
+# 推理池单次调用超时(秒，0表示不限制)；工作进程连续启动失败的最大重启次数，全部放弃后/api/ready返回启动失败
+export INFERENCE_CALL_TIMEOUT=${INFERENCE_CALL_TIMEOUT:-600}
+export INFERENCE_MAX_RESTARTS=${INFERENCE_MAX_RESTARTS:-3}
+
+# 推理请求的最大排队数，以及同时执行的课件/声音置换后台任务数和排队数
+# 队列已满时接口返回503和Retry-After
+export INFERENCE_QUEUE_DEPTH=${INFERENCE_QUEUE_DEPTH:-16}
+export JOB_MAX_CONCURRENCY=${JOB_MAX_CONCURRENCY:-2}
+export JOB_QUEUE_DEPTH=${JOB_QUEUE_DEPTH:-16}
+
+# CPU推理后端: eager / torchscript / onnxruntime (后两者需要模型目录中导出的模块，缺失时回退到eager)
+export COSYVOICE_BACKEND=${COSYVOICE_BACKEND:-eager}
+# 算子内/算子间线程数，0表示使用默认值
+export INFERENCE_INTRA_OP_THREADS=${INFERENCE_INTRA_OP_THREADS:-0}
+export INFERENCE_INTER_OP_THREADS=${INFERENCE_INTER_OP_THREADS:-0}
+
+# CPU动态int8量化的模块: llm 或 llm,flow，为空表示不量化；量化权重保存在模型目录的int8子目录
+export COSYVOICE_QUANTIZE=${COSYVOICE_QUANTIZE:-}
+
+# 启动时用每个预置声音合成预热文本(以|分隔)，完成前/api/ready和推理接口返回503
+export WARMUP_ENABLED=${WARMUP_ENABLED:-1}
+export WARMUP_MAX_VOICES=${WARMUP_MAX_VOICES:-0}
+
+# 长文本流水线合成(LLM与flow/声码器阶段重叠执行)，设为0使用逐块合成
+export LONG_TEXT_PIPELINE=${LONG_TEXT_PIPELINE:-1}
+
+# 长文本按模型token数分块；分块大小由 benchmarks/bench_chunk_planner.py --calibrate 测得的耗时曲线选择
+export CHUNK_MAX_TOKENS=${CHUNK_MAX_TOKENS:-80}
+export CHUNK_TARGET_TOKENS=${CHUNK_TARGET_TOKENS:-0}
+
+# 合并结果超过该大小(MB，按float64计)时逐块读写音频，内存中只保留交叉淡化窗口
+export MERGE_MEMORY_BUDGET_MB=${MERGE_MEMORY_BUDGET_MB:-256}
+
+# 声音置换片段的时长调整: 质量档位 fast(WSOLA) / standard / high(相位声码器)，以及进程数(0表示在任务线程中处理)
+export TIME_STRETCH_QUALITY=${TIME_STRETCH_QUALITY:-fast}
+export TIME_STRETCH_WORKERS=${TIME_STRETCH_WORKERS:-2}
+# 声音置换按原始片段时长选择合成语速的范围，超出部分再由时长调整处理
+export SYNTH_SPEED_MIN=${SYNTH_SPEED_MIN:-0.8}
+export SYNTH_SPEED_MAX=${SYNTH_SPEED_MAX:-1.5}
+
 # 设置更详细的日志记录以便追踪分段合成过程
 export LOG_LEVEL=${LOG_LEVEL:-debug}
 